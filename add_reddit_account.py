@@ -1,5 +1,6 @@
-import sqlite3
 import json
+from db import get_db
+import repository
 from security import encrypt_data
 from datetime import datetime
 
@@ -17,12 +18,11 @@ def add_reddit_account():
     """Add Reddit account to the database for testing."""
     
     # Connect to database
-    conn = sqlite3.connect('social_media_automation.db')
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     
     try:
         # Get Reddit platform ID
-        platform = conn.execute('SELECT id FROM platforms WHERE name = ?', ('reddit',)).fetchone()
+        platform = repository.get_platform_by_name(conn, 'reddit')
         if not platform:
             print("❌ Reddit platform not found in database. Make sure to run the app first to initialize the database.")
             return
@@ -33,9 +33,8 @@ def add_reddit_account():
         encrypted_credentials = encrypt_data(json.dumps(reddit_credentials))
         
         # Add account
-        conn.execute('''INSERT INTO accounts (platform_id, name, credentials, created_at) 
-                       VALUES (?, ?, ?, ?)''',
-                    (platform_id, 'Reddit Test Account', encrypted_credentials, datetime.utcnow().isoformat()))
+        repository.create_account(conn, platform_id, 'Reddit Test Account', encrypted_credentials,
+                                  datetime.utcnow().isoformat())
         
         conn.commit()
         print("✅ Reddit account added successfully!")
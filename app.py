@@ -1,16 +1,15 @@
 from dotenv import load_dotenv
 load_dotenv()
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, session
 from flask_cors import CORS
-import sqlite3
 import os
 from datetime import datetime, timezone, timedelta
 import json
 from dateutil.parser import isoparse
 from dateutil.tz import tzlocal
-from apscheduler.schedulers.background import BackgroundScheduler
 from security import encrypt_data, decrypt_data
 import requests
+import http_client
 from urllib.parse import urlencode
 
 # LinkedIn OAuth scopes allowed for this application (must match dashboard exactly)
@@ -22,14 +21,16 @@ LINKEDIN_ALLOWED_SCOPES = [
 ]
 
 # --- Local API Modules ---
-from scheduler import process_scheduled_posts
-from youtube_api import post_to_youtube
-from instagram_api import post_to_instagram  # Enable Instagram
-from twitter_api import post_to_twitter
-from pinterest_api import post_to_pinterest
-
-from linkedin_api import post_to_linkedin
-from reddit_api import post_to_reddit
+from db import get_db, init_db, release_db, DB_PATH
+import repository
+import uploads
+import media_store
+import bulk_import
+import stats
+import metrics
+import post_events
+from scheduler import start_scheduler_loop, wake_scheduler, to_schedule_epoch, parse_schedule_time, RETRY_MAX_ATTEMPTS
+from publishers import platform_apis
 from youtube_auth_simple import get_youtube_auth_url, exchange_code_and_store_credentials
 from youtube_auth import process_youtube_credentials  # Import the correct function
 
@@ -38,7 +39,6 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 app = Flask(__name__, template_folder=os.path.join(BASE_DIR, 'templates'), static_folder=os.path.join(BASE_DIR, 'static'))
 app.secret_key = os.getenv('SECRET_KEY', os.urandom(24))
 CORS(app)
-DB_PATH = os.path.join(BASE_DIR, 'social_media_automation.db')
 
 # --- LinkedIn Redirect URI Selection ---
 LINKEDIN_REDIRECT_URI_LOCAL = os.getenv('LINKEDIN_REDIRECT_URI_LOCAL', 'http://localhost:5000/linkedin/callback')
@@ -65,55 +65,14 @@ def get_linkedin_redirect_uri(request_path=''):
         return 'https://social-media-manager-5j5s.onrender.com/linkedin/callback'
 
 
-# --- Database Functions ---
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS platforms (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, display_name TEXT NOT NULL
-    )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS accounts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, platform_id INTEGER NOT NULL, name TEXT NOT NULL,
-        credentials TEXT NOT NULL,
-        created_at TEXT NOT NULL,
-        updated_at TEXT NOT NULL,
-        FOREIGN KEY(platform_id) REFERENCES platforms(id)
-    )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS content (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, account_id INTEGER NOT NULL, title TEXT NOT NULL,
-        description TEXT, hashtags TEXT, media_path TEXT NOT NULL, schedule_time TEXT,
-        status TEXT DEFAULT 'pending', error TEXT, created_at TEXT NOT NULL,
-        FOREIGN KEY(account_id) REFERENCES accounts(id)
-    )''')
-    # Remove legacy Medium platform and associated accounts if they still exist
-    medium_row = c.execute('SELECT id FROM platforms WHERE name=?', ('medium',)).fetchone()
-    if medium_row:
-        medium_id = medium_row['id'] if hasattr(medium_row, 'keys') else medium_row[0]
-        c.execute('DELETE FROM accounts WHERE platform_id=?', (medium_id,))
-        c.execute('DELETE FROM platforms WHERE id=?', (medium_id,))
-
-    # Seed the supported platforms
-    platforms = [
-        ('youtube', 'YouTube'), ('instagram', 'Instagram'), ('twitter', 'Twitter'),
-        ('pinterest', 'Pinterest'), ('linkedin', 'LinkedIn'),
-        ('reddit', 'Reddit')
-    ]
-    c.executemany('INSERT OR IGNORE INTO platforms (name, display_name) VALUES (?, ?)', platforms)
-    conn.commit()
-    conn.close()
-
 init_db()
+app.teardown_appcontext(release_db)
 
 # --- API Endpoints ---
 @app.route('/api/platforms')
 def api_platforms():
     conn = get_db()
-    platforms = conn.execute('SELECT * FROM platforms').fetchall()
+    platforms = repository.list_platforms(conn)
     conn.close()
     return jsonify([dict(row) for row in platforms])
 
@@ -127,13 +86,9 @@ def api_accounts():
         platform_id = data.get('platform_id')
         name = data.get('account_name')
         credentials = {}
-        # Check platform early
-        platform_name = None
-        if platform_id:
-            c = conn.cursor()
-            platform = c.execute('SELECT name FROM platforms WHERE id=?', (platform_id,)).fetchone()
-            if platform:
-                platform_name = platform['name']
+        # Look the platform up once; every check below goes by its name
+        platform = repository.get_platform(conn, platform_id) if platform_id else None
+        platform_name = platform['name'] if platform else None
         # Instagram: use username/password fields only
         if platform_name == 'instagram':
             username = data.get('username')
@@ -173,74 +128,61 @@ def api_accounts():
         if not all([platform_id, name, credentials]):
             return jsonify({'error': 'Platform, Account Name, and Credentials are required.'}), 400
         # Special handling for YouTube: process credentials automatically
-        if platform_id:
-            c = conn.cursor()
-            platform = c.execute('SELECT name FROM platforms WHERE id=?', (platform_id,)).fetchone()
-            if platform and platform['name'] == 'youtube':
-                # Instruct user to use the new OAuth flow
-                return jsonify({'error': 'YouTube account connection now requires the new OAuth flow. Please use /youtube/authorize to connect your YouTube account.'}), 400
+        if platform_name == 'youtube':
+            # Instruct user to use the new OAuth flow
+            return jsonify({'error': 'YouTube account connection now requires the new OAuth flow. Please use /youtube/authorize to connect your YouTube account.'}), 400
         # Special handling for Reddit: process and validate credentials from form fields
-        if platform_id:
-            c = conn.cursor()
-            platform = c.execute('SELECT name FROM platforms WHERE id=?', (platform_id,)).fetchone()
-            if platform and platform['name'] == 'reddit':
-                # Accept credentials as dict or string
-                import json
-                if isinstance(credentials, str):
-                    try:
-                        credentials = json.loads(credentials)
-                    except Exception:
-                        # If not JSON, treat as form fields
-                        credentials = {key: value for key, value in data.items() if key not in ['platform_id', 'account_name']}
-                # Required fields
-                required = ['client_id', 'client_secret', 'username', 'password']
-                missing = [k for k in required if not credentials.get(k)]
-                if missing:
-                    return jsonify({'error': f'Missing Reddit credentials: {", ".join(missing)}'}), 400
-                # Set default user_agent if not provided
-                if not credentials.get('user_agent'):
-                    credentials['user_agent'] = f'script:{credentials["username"]}:v1.0 (by /u/{credentials["username"]})'
-                # Set default subreddit if not provided
-                if not credentials.get('subreddit'):
-                    credentials['subreddit'] = 'test'
-                # Test credentials before saving
+        if platform_name == 'reddit':
+            # Accept credentials as dict or string
+            import json
+            if isinstance(credentials, str):
                 try:
-                    from reddit_api import test_reddit_connection
-                    if not test_reddit_connection(credentials):
-                        return jsonify({'error': 'Reddit authentication failed: Invalid credentials or subreddit access.'}), 400
-                except Exception as e:
-                    return jsonify({'error': f'Reddit authentication failed: {str(e)}'}), 400
+                    credentials = json.loads(credentials)
+                except Exception:
+                    # If not JSON, treat as form fields
+                    credentials = {key: value for key, value in data.items() if key not in ['platform_id', 'account_name']}
+            # Required fields
+            required = ['client_id', 'client_secret', 'username', 'password']
+            missing = [k for k in required if not credentials.get(k)]
+            if missing:
+                return jsonify({'error': f'Missing Reddit credentials: {", ".join(missing)}'}), 400
+            # Set default user_agent if not provided
+            if not credentials.get('user_agent'):
+                credentials['user_agent'] = f'script:{credentials["username"]}:v1.0 (by /u/{credentials["username"]})'
+            # Set default subreddit if not provided
+            if not credentials.get('subreddit'):
+                credentials['subreddit'] = 'test'
+            # Test credentials before saving
+            try:
+                from reddit_api import test_reddit_connection
+                if not test_reddit_connection(credentials):
+                    return jsonify({'error': 'Reddit authentication failed: Invalid credentials or subreddit access.'}), 400
+            except Exception as e:
+                return jsonify({'error': f'Reddit authentication failed: {str(e)}'}), 400
         # Special handling for Twitter: process and validate credentials from form fields
-        if platform_id:
-            c = conn.cursor()
-            platform = c.execute('SELECT name FROM platforms WHERE id=?', (platform_id,)).fetchone()
-            if platform and platform['name'] == 'twitter':
-                import json
-                if isinstance(credentials, str):
-                    try:
-                        credentials = json.loads(credentials)
-                    except Exception:
-                        credentials = {key: value for key, value in data.items() if key not in ['platform_id', 'account_name']}
-                # Only accept api_key, api_key_secret, access_token, access_token_secret
-                required = ['api_key', 'api_key_secret', 'access_token', 'access_token_secret']
-                missing = [k for k in required if not credentials.get(k)]
-                if missing:
-                    return jsonify({'error': f'Missing Twitter credentials: {", ".join(missing)}. Please provide all four keys as shown in the form.'}), 400
-                # Test credentials before saving
+        if platform_name == 'twitter':
+            import json
+            if isinstance(credentials, str):
                 try:
-                    from twitter_api import test_twitter_connection
-                    if not test_twitter_connection(credentials):
-                        return jsonify({'error': 'Twitter authentication failed: Invalid credentials or permissions. Please double-check your keys and try again.'}), 400
-                except Exception as e:
-                    return jsonify({'error': f'Twitter authentication failed: {str(e)}'}), 400
+                    credentials = json.loads(credentials)
+                except Exception:
+                    credentials = {key: value for key, value in data.items() if key not in ['platform_id', 'account_name']}
+            # Only accept api_key, api_key_secret, access_token, access_token_secret
+            required = ['api_key', 'api_key_secret', 'access_token', 'access_token_secret']
+            missing = [k for k in required if not credentials.get(k)]
+            if missing:
+                return jsonify({'error': f'Missing Twitter credentials: {", ".join(missing)}. Please provide all four keys as shown in the form.'}), 400
+            # Test credentials before saving
+            try:
+                from twitter_api import test_twitter_connection
+                if not test_twitter_connection(credentials):
+                    return jsonify({'error': 'Twitter authentication failed: Invalid credentials or permissions. Please double-check your keys and try again.'}), 400
+            except Exception as e:
+                return jsonify({'error': f'Twitter authentication failed: {str(e)}'}), 400
         # Credential validation logic
         try:
-            # Map platform_id to platform name
-            c = conn.cursor()
-            platform = c.execute('SELECT name FROM platforms WHERE id=?', (platform_id,)).fetchone()
             if not platform:
                 return jsonify({'error': 'Invalid platform selected.'}), 400
-            platform_name = platform['name']
             # Define dummy_content for validation
             dummy_content = {
                 "title": "Test",
@@ -275,14 +217,10 @@ def api_accounts():
             encrypted_credentials = encrypt_data(json.dumps(credentials))
             # First, delete any existing LinkedIn accounts to avoid duplicates
             if platform_name == 'linkedin':
-                linkedin_platform_id = c.execute('SELECT id FROM platforms WHERE name = ?', ('linkedin',)).fetchone()['id']
-                conn.execute('DELETE FROM accounts WHERE platform_id = ?', (linkedin_platform_id,))
+                repository.delete_accounts_for_platform(conn, platform['id'])
             
             # Then insert the new account
-            conn.execute(
-                'INSERT INTO accounts (platform_id, name, credentials, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
-                (platform_id, name, encrypted_credentials, datetime.utcnow().isoformat(), datetime.utcnow().isoformat())
-            )
+            repository.create_account(conn, platform_id, name, encrypted_credentials, datetime.utcnow().isoformat())
             conn.commit()
             flash(f"Account '{name}' created successfully.", "success")
             return jsonify({'success': True})
@@ -291,15 +229,87 @@ def api_accounts():
         finally:
             conn.close()
     else:
+        try:
+            limit, after_id, columns = parse_list_args(repository.ACCOUNT_PUBLIC_COLUMNS.split(', '))
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
         platform_id = request.args.get('platform_id')
-        query = 'SELECT id, platform_id, name, created_at FROM accounts'
-        params = []
-        if platform_id:
-            query += ' WHERE platform_id=?'
-            params.append(platform_id)
-        accounts = conn.execute(query, params).fetchall()
+        accounts = repository.list_accounts(conn, platform_id, after_id, limit + 1, columns)
         conn.close()
-        return jsonify([dict(row) for row in accounts])
+        return list_response(accounts, limit)
+
+# --- Listings ---
+# Rows per page of the /api/content and /api/accounts listings (?limit=), and the most a request may ask for
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '100'))
+LIST_MAX_PAGE_SIZE = int(os.getenv('LIST_MAX_PAGE_SIZE', '1000'))
+
+def parse_list_args(allowed_fields):
+    """
+    Reads the paging arguments of a listing: ?limit=, ?cursor= (the id after which
+    the page starts, from the previous page's Link header) and ?fields=, a comma
+    separated projection that always includes id. Raises ValueError.
+    """
+    try:
+        limit = int(request.args.get('limit', LIST_PAGE_SIZE))
+        after_id = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        raise ValueError('limit and cursor must be integers')
+    if not 1 <= limit <= LIST_MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {LIST_MAX_PAGE_SIZE}')
+    columns = None
+    if request.args.get('fields'):
+        fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in allowed_fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        columns = ['id'] + [field for field in dict.fromkeys(fields) if field != 'id']
+    return limit, after_id, columns
+
+def parse_list_time(name):
+    """A listing's ISO time argument as a UTC epoch, or None. Raises ValueError."""
+    if not request.args.get(name):
+        return None
+    try:
+        return to_schedule_epoch(parse_schedule_time(request.args[name]))
+    except (ValueError, OverflowError):
+        raise ValueError(f'{name} must be an ISO 8601 time')
+
+def list_response(rows, limit):
+    """
+    Returns a page of rows (fetched with limit + 1) as a JSON array. When more rows
+    follow, a Link rel="next" header and X-Next-Cursor point at the next page.
+    """
+    response = jsonify([dict(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        cursor = rows[limit - 1]['id']
+        args = request.args.to_dict(flat=False)
+        args['cursor'] = cursor
+        response.headers['X-Next-Cursor'] = str(cursor)
+        response.headers['Link'] = f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+    return response
+
+def save_request_media(conn, data):
+    """
+    Stores the media of a scheduling request, returning (media_path, error_response).
+    Large files should be sent through /api/uploads first and referenced by upload_id;
+    smaller ones can come as a multipart 'media' file. media_path is None without media.
+    """
+    if data.get('upload_id'):
+        upload = repository.get_upload(conn, data.get('upload_id'))
+        # One upload can be scheduled to several platforms; its file goes once no post uses it
+        if (not upload or upload['status'] != 'complete'
+                or not os.path.exists(os.path.join(BASE_DIR, upload['media_path']))):
+            return None, (jsonify({'error': 'Upload not found or not complete'}), 400)
+        return upload['media_path'], None
+    if 'media' in request.files and request.files['media'] and request.files['media'].filename:
+        file = request.files['media']
+        # Stored once per content hash, so re-uploading the same file reuses it
+        try:
+            return media_store.store_stream(conn, BASE_DIR, file.stream, file.filename), None
+        except Exception as e:
+            return None, (jsonify({'error': f'Failed to save file: {str(e)}'}), 500)
+    return None, None
 
 @app.route('/api/content', methods=['GET', 'POST'])
 def api_content():
@@ -313,74 +323,287 @@ def api_content():
         schedule_time_str = data.get('schedule_time')
         created_at = datetime.utcnow().isoformat()
         
-        # Process schedule_time: convert local time from form to UTC
-        schedule_time_utc_iso = None
-        if schedule_time_str:
-            try:
-                # Parse schedule_time string
-                dt = isoparse(schedule_time_str)
-                # If timezone info is missing, assume browser local tz (server may be UTC)
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=tzlocal())
-                utc_time = dt.astimezone(timezone.utc)
-                schedule_time_utc_iso = utc_time.isoformat()
-            except ValueError as e:
-                print(f"Error parsing schedule time '{schedule_time_str}': {e}")
-                return jsonify({'error': f'Invalid schedule time format: {schedule_time_str}'}), 400
+        try:
+            schedule_time_utc_iso = parse_schedule_time(schedule_time_str)
+        except ValueError as e:
+            print(f"Error parsing schedule time '{schedule_time_str}': {e}")
+            return jsonify({'error': f'Invalid schedule time format: {schedule_time_str}'}), 400
 
         # Verify account exists
-        account = conn.execute('SELECT * FROM accounts WHERE id=?', 
-                             (account_id,)).fetchone()
+        account = repository.get_account(conn, account_id)
         if not account:
             return jsonify({'error': 'Invalid account'}), 400
             
-        # Save media file (optional)
-        media_path = None
-        if 'media' in request.files and request.files['media'] and request.files['media'].filename:
-            file = request.files['media']
-            uploads_dir = os.path.join(BASE_DIR, 'uploads')
-            # Always ensure uploads directory exists (robust and reliable)
-            try:
-                os.makedirs(uploads_dir, exist_ok=True)
-            except Exception as e:
-                return jsonify({'error': f'Failed to create uploads directory: {str(e)}'}), 500
-            media_path = os.path.join('uploads', f"{file.filename}")
-            try:
-                file.save(os.path.join(BASE_DIR, media_path))
-            except Exception as e:
-                return jsonify({'error': f'Failed to save file: {str(e)}'}), 500
-        # If no media, media_path remains None
+        media_path, error_response = save_request_media(conn, data)
+        if error_response:
+            return error_response
             
         try:
-            c = conn.cursor()
-            c.execute('''INSERT INTO content (account_id, title, description, hashtags, 
-                         media_path, schedule_time, created_at) 
-                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                      (account_id, title, description, hashtags, 
-                       media_path if media_path else '', schedule_time_utc_iso, created_at))
+            repository.create_content(conn, account_id, title, description, hashtags,
+                                      media_path if media_path else '', schedule_time_utc_iso,
+                                      to_schedule_epoch(schedule_time_utc_iso), created_at)
             conn.commit()
             conn.close()
+            wake_scheduler()
             flash('Content scheduled successfully!', 'success')
             return redirect(url_for('dashboard'))
         except Exception as e:
             return jsonify({'error': f'Failed to save content: {str(e)}'}), 500
     else:
+        # Filters: account_id, platform (name), status (comma separated),
+        # scheduled_from/scheduled_until (ISO times); order=desc for newest first
+        try:
+            limit, after_id, columns = parse_list_args(repository.CONTENT_DETAIL_COLUMNS)
+            scheduled_from, scheduled_until = [parse_list_time(name) for name in ('scheduled_from', 'scheduled_until')]
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        platform_id = None
+        if request.args.get('platform'):
+            platform = repository.get_platform_by_name(conn, request.args['platform'])
+            if not platform:
+                conn.close()
+                return jsonify({'error': f"Unknown platform: {request.args['platform']}"}), 400
+            platform_id = platform['id']
         account_id = request.args.get('account_id')
-        if account_id:
-            rows = conn.execute('''SELECT * FROM content 
-                                 WHERE account_id=?''', 
-                              (account_id,)).fetchall()
-        else:
-            rows = conn.execute('SELECT * FROM content').fetchall()
+        statuses = [status for status in request.args.get('status', '').split(',') if status]
+        rows = repository.list_content(conn, [account_id] if account_id else None, platform_id, statuses,
+                                       scheduled_from, scheduled_until, after_id,
+                                       request.args.get('order') == 'desc', limit + 1, columns, details=True)
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return list_response(rows, limit)
+
+@app.route('/api/content/bulk', methods=['POST'])
+def api_content_bulk():
+    """
+    Schedules many posts from a JSONL or CSV body (or a multipart 'file'), format
+    and row fields as in bulk_import.py. Returns the outcome of every row.
+    """
+    # Only look for a form file in multipart requests; parsing other bodies as a
+    # form would consume the stream
+    file = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    stream = file.stream if file else request.stream
+    conn = get_db()
+    try:
+        import_format = bulk_import.detect_format(request.args.get('format'), request.content_type,
+                                                  file.filename if file else None)
+        result = bulk_import.import_posts(conn, stream, import_format,
+                                          atomic=request.args.get('atomic', '').lower() in ('1', 'true', 'yes'))
+    except bulk_import.BulkImportError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+    if result['scheduled']:
+        wake_scheduler()
+    return jsonify(result)
+
+@app.route('/api/uploads', methods=['POST'])
+def api_create_upload():
+    """Starts a resumable chunked upload (protocol in uploads.py)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        size = int(data['size']) if data.get('size') is not None else None
+        upload = uploads.create_upload(get_db(), BASE_DIR, data.get('filename'), size)
+    except ValueError:
+        return jsonify({'error': 'Invalid upload size.'}), 400
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    return jsonify(uploads.describe(upload)), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PUT'])
+def api_upload(upload_id):
+    """GET reports the offset to resume from; PUT appends the chunk in the request body."""
+    conn = get_db()
+    try:
+        if request.method == 'PUT':
+            offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '-1')))
+            # Read the raw body stream; it is never parsed or buffered as form data
+            uploads.write_chunk(conn, BASE_DIR, upload_id, offset, request.stream, request.content_length,
+                                request.headers.get('Upload-Chunk-Id'))
+        return jsonify(uploads.describe(uploads.get_upload(conn, upload_id)))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset must be an integer.'}), 400
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), e.status_code
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def api_complete_upload(upload_id):
+    """Verifies the checksum of a finished upload and makes it available as media."""
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = uploads.complete_upload(get_db(), BASE_DIR, upload_id, data.get('sha256'))
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), e.status_code
+    return jsonify(uploads.describe(upload))
 
 @app.route('/api/errors', methods=['GET'])
 def api_errors():
+    """
+    Lists failed posts with their retry state: 'retrying' posts are waiting for
+    another attempt, 'dead' posts ran out of attempts and 'error' posts failed
+    with an error that retrying would not fix.
+    """
+    conn = get_db()
+    try:
+        limit, after_id, _ = parse_list_args(())
+    except ValueError as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    # Read by (status, id) index ranges, a page at a time, like /api/content
+    errors = repository.list_content(conn, statuses=['error', 'dead', 'retrying'], after_id=after_id, limit=limit + 1,
+                                     details=True)
+    conn.close()
+    results = []
+    for row in errors:
+        item = dict(row)
+        item['max_attempts'] = RETRY_MAX_ATTEMPTS
+        item['next_attempt_time'] = (datetime.fromtimestamp(row['next_attempt_at'], timezone.utc).isoformat()
+                                     if row['next_attempt_at'] else None)
+        results.append(item)
+    return list_response(results, limit)
+
+@app.route('/api/stats', methods=['GET'])
+def api_stats():
+    """Post counts by status (overall, per platform and per account), queue depth and recent failure rates."""
+    conn = get_db()
+    result = stats.get_stats(conn)
+    conn.close()
+    return jsonify(result)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Queue depth, publish lag, platform call latency, scheduler and database timings for Prometheus."""
+    conn = get_db()
+    try:
+        body = metrics.render(conn)
+    finally:
+        conn.close()
+    return Response(body, content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/content/<int:content_id>/events', methods=['GET'])
+def api_content_events(content_id):
+    """A post's lifecycle events (see post_events.py), oldest first."""
+    conn = get_db()
+    events = repository.list_post_events(conn, content_id)
+    conn.close()
+    if not events:
+        return jsonify({'error': 'No events for this post'}), 404
+    return jsonify([dict(event) for event in events])
+
+@app.route('/api/reports/publishing', methods=['GET'])
+def api_publishing_report():
+    """
+    p50/p95/p99 publish lag and per-stage durations per platform, for attempts that
+    ended between since and until (ISO times, default the last 24 hours), in
+    windows of bucket_seconds (default one window). Optional platform filter.
+    """
+    try:
+        until_epoch = parse_list_time('until') or datetime.now(timezone.utc).timestamp()
+        since_epoch = parse_list_time('since') or until_epoch - 86400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        bucket_seconds = int(request.args.get('bucket_seconds') or max(1, until_epoch - since_epoch))
+    except ValueError:
+        return jsonify({'error': 'bucket_seconds must be an integer'}), 400
+    if since_epoch >= until_epoch:
+        return jsonify({'error': 'since must be before until'}), 400
+    if bucket_seconds < 1 or (until_epoch - since_epoch) / bucket_seconds > 1000:
+        return jsonify({'error': 'bucket_seconds must be at least 1 and make at most 1000 windows'}), 400
     conn = get_db()
-    errors = conn.execute('SELECT * FROM content WHERE status="error"').fetchall()
+    windows = post_events.publishing_report(conn, since_epoch, until_epoch, bucket_seconds,
+                                            request.args.get('platform'))
     conn.close()
-    return jsonify([dict(row) for row in errors])
+    for window in windows:
+        window['start'] = datetime.fromtimestamp(window['start_epoch'], timezone.utc).isoformat()
+        window['end'] = datetime.fromtimestamp(window['end_epoch'], timezone.utc).isoformat()
+    return jsonify({'since': datetime.fromtimestamp(since_epoch, timezone.utc).isoformat(),
+                    'until': datetime.fromtimestamp(until_epoch, timezone.utc).isoformat(),
+                    'bucket_seconds': bucket_seconds, 'windows': windows})
+
+@app.route('/api/errors/<int:content_id>/retry', methods=['POST'])
+def api_retry_error(content_id):
+    """Puts a failed or dead-lettered post back in the queue with a fresh set of attempts."""
+    conn = get_db()
+    requeued = repository.requeue_content(conn, content_id, datetime.now(timezone.utc).timestamp())
+    conn.commit()
+    conn.close()
+    if not requeued:
+        return jsonify({'error': 'No failed post with that id'}), 404
+    wake_scheduler()
+    return jsonify({'success': True})
+
+@app.route('/api/campaigns', methods=['GET', 'POST'])
+def api_campaigns():
+    """
+    POST schedules one piece of content to several accounts at once (a campaign).
+    Each account gets its own delivery target, a content row with its own status,
+    error and external post id; all targets share one copy of the media.
+    """
+    conn = get_db()
+    if request.method == 'GET':
+        campaigns = repository.list_campaigns(conn)
+        counts = repository.count_campaign_targets_by_status(conn, [row['id'] for row in campaigns])
+        conn.close()
+        return jsonify([dict(row, targets=counts[row['id']]) for row in campaigns])
+
+    # Form posts repeat account_ids (or send them comma separated); JSON sends a list
+    data = request.get_json(silent=True) or request.form
+    account_ids = data.getlist('account_ids') if hasattr(data, 'getlist') else data.get('account_ids') or []
+    if isinstance(account_ids, str):
+        account_ids = [account_ids]
+    try:
+        account_ids = list(dict.fromkeys(int(account_id) for value in account_ids
+                                         for account_id in str(value).split(',') if account_id.strip()))
+    except ValueError:
+        conn.close()
+        return jsonify({'error': 'account_ids must be account ids'}), 400
+    if not account_ids:
+        conn.close()
+        return jsonify({'error': 'Choose at least one account'}), 400
+    missing = set(account_ids) - repository.find_existing_account_ids(conn, account_ids)
+    if missing:
+        conn.close()
+        return jsonify({'error': f'Invalid accounts: {sorted(missing)}'}), 400
+    try:
+        schedule_time_utc_iso = parse_schedule_time(data.get('schedule_time'))
+    except ValueError:
+        conn.close()
+        return jsonify({'error': f"Invalid schedule time format: {data.get('schedule_time')}"}), 400
+
+    media_path, error_response = save_request_media(conn, data)
+    if error_response:
+        conn.close()
+        return error_response
+    created_at = datetime.utcnow().isoformat()
+    schedule_epoch = to_schedule_epoch(schedule_time_utc_iso)
+    try:
+        campaign_id = repository.create_campaign(conn, data.get('title'), data.get('description'),
+                                                 data.get('hashtags'), media_path or '', schedule_time_utc_iso,
+                                                 schedule_epoch, created_at)
+        target_ids = [repository.create_content(conn, account_id, data.get('title'), data.get('description'),
+                                                data.get('hashtags'), media_path or '', schedule_time_utc_iso,
+                                                schedule_epoch, created_at, campaign_id)
+                      for account_id in account_ids]
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': f'Failed to save campaign: {str(e)}'}), 500
+    finally:
+        conn.close()
+    wake_scheduler()
+    return jsonify({'campaign_id': campaign_id, 'target_ids': target_ids}), 201
+
+@app.route('/api/campaigns/<int:campaign_id>', methods=['GET'])
+def api_campaign(campaign_id):
+    """A campaign with the delivery status of each of its targets."""
+    conn = get_db()
+    campaign = repository.get_campaign(conn, campaign_id)
+    targets = repository.list_campaign_targets(conn, campaign_id) if campaign else []
+    conn.close()
+    if not campaign:
+        return jsonify({'error': 'Campaign not found'}), 404
+    return jsonify(dict(campaign, targets=[dict(row) for row in targets]))
 
 # --- Page Routes ---
 @app.route('/')
@@ -390,39 +613,34 @@ def home():
 @app.route('/dashboard')
 def dashboard():
     conn = get_db()
-    platforms = conn.execute('SELECT * FROM platforms').fetchall()
-    accounts = conn.execute('SELECT * FROM accounts').fetchall()
-    content = conn.execute('SELECT * FROM content').fetchall()
+    platforms = repository.list_platforms(conn)
+    accounts = repository.list_accounts(conn)
+    # Only the newest posts are shown, so the page does not grow with the post history
+    content = repository.list_content(conn, descending=True, limit=5, details=True)
+    dashboard_stats = stats.get_stats(conn)
     conn.close()
     return render_template('dashboard.html', 
                          platforms=platforms,
                          accounts=accounts,
-                         content_items=content)
+                         content_items=content,
+                         stats=dashboard_stats)
 
 @app.route('/platform/<platform_name>')
 def platform_page(platform_name):
     conn = get_db()
-    platform = conn.execute('SELECT * FROM platforms WHERE name=?', 
-                          (platform_name,)).fetchone()
-    accounts = conn.execute('''SELECT * FROM accounts 
-                             WHERE platform_id=?''', 
-                          (platform['id'],)).fetchall() if platform else []
-    content = []
-    if accounts:
-        account_ids = tuple([a['id'] for a in accounts])
-        if len(account_ids) == 1:
-            content = conn.execute('''SELECT * FROM content 
-                                    WHERE account_id=?''', 
-                                 (account_ids[0],)).fetchall()
-        elif len(account_ids) > 1:
-            q = f'''SELECT * FROM content 
-                   WHERE account_id IN ({','.join(['?']*len(account_ids))})'''
-            content = conn.execute(q, account_ids).fetchall()
+    platform = repository.get_platform_by_name(conn, platform_name)
+    accounts = repository.list_accounts(conn, platform['id']) if platform else []
+    # Newest posts first, a page at a time; ?cursor= continues after the last post shown
+    cursor = request.args.get('cursor', type=int)
+    content = repository.list_content(conn, [account['id'] for account in accounts], after_id=cursor,
+                                      descending=True, limit=LIST_PAGE_SIZE + 1, details=True)
     conn.close()
+    next_cursor = content[LIST_PAGE_SIZE - 1]['id'] if len(content) > LIST_PAGE_SIZE else None
     return render_template('platform.html', 
                          platform=platform,
                          accounts=accounts,
-                         content_items=content)
+                         content_items=content[:LIST_PAGE_SIZE],
+                         next_cursor=next_cursor)
 
 # The old YouTube OAuth routes (authorize_youtube, oauth2callback_youtube) are no longer needed
 # as credentials are now added directly in the 'Add Account' form. They have been removed.
@@ -611,10 +829,9 @@ def linkedin_register_account():
     conn = None
     try:
         conn = get_db()
-        c = conn.cursor()
         
         # Get LinkedIn platform_id
-        platform = c.execute('SELECT id FROM platforms WHERE name = ?', ('linkedin',)).fetchone()
+        platform = repository.get_platform_by_name(conn, 'linkedin')
         if not platform:
             flash('LinkedIn platform not found in database.', 'error')
             return redirect(url_for('platform_page', platform_name='linkedin'))
@@ -642,49 +859,22 @@ def linkedin_register_account():
         existing = None
         if account.get('email'):
             # Try to find by email
-            existing = c.execute(
-                'SELECT id, credentials FROM accounts WHERE platform_id = ? AND json_extract(credentials, "$.email") = ?',
-                (platform_id, account['email'])
-            ).fetchone()
+            existing = repository.find_account_by_credential(conn, platform_id, 'email', account['email'])
         
         if not existing and account.get('person_urn'):
             # Try to find by person_urn
-            existing = c.execute(
-                'SELECT id, credentials FROM accounts WHERE platform_id = ? AND json_extract(credentials, "$.person_urn") = ?',
-                (platform_id, account['person_urn'])
-            ).fetchone()
+            existing = repository.find_account_by_credential(conn, platform_id, 'person_urn', account['person_urn'])
         
         current_time = datetime.utcnow().isoformat()
         
         if existing:
             # Update existing account
             account_id = existing['id']
-            c.execute('''
-                UPDATE accounts 
-                SET name = ?, 
-                    credentials = ?,
-                    updated_at = ?
-                WHERE id = ?
-            ''', (
-                account_name,
-                encrypted_credentials,
-                current_time,
-                account_id
-            ))
+            repository.update_account(conn, account_id, account_name, encrypted_credentials, current_time)
             message = 'LinkedIn account updated successfully!'
         else:
             # Create new account
-            c.execute('''
-                INSERT INTO accounts (platform_id, name, credentials, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                platform_id,
-                account_name,
-                encrypted_credentials,
-                current_time,
-                current_time
-            ))
-            account_id = c.lastrowid
+            account_id = repository.create_account(conn, platform_id, account_name, encrypted_credentials, current_time)
             message = 'LinkedIn account registered successfully!'
         
         conn.commit()
@@ -736,7 +926,7 @@ def linkedin_callback_post():
         "client_id": LINKEDIN_CLIENT_ID,
         "client_secret": LINKEDIN_CLIENT_SECRET,
     }
-    resp = requests.post(token_url, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"})
+    resp = http_client.post(token_url, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"})
     if resp.status_code != 200:
         return f"Failed to get posting access token: {resp.text}", 400
     token_data = resp.json()
@@ -782,7 +972,7 @@ def linkedin_post_example():
         "X-Restli-Protocol-Version": "2.0.0",
         "Content-Type": "application/json"
     }
-    resp = requests.post("https://api.linkedin.com/v2/ugcPosts", json=post_body, headers=headers)
+    resp = http_client.post("https://api.linkedin.com/v2/ugcPosts", json=post_body, headers=headers)
     if resp.status_code == 201:
         return f"Post successful! LinkedIn response: {resp.json()}"
     else:
@@ -821,47 +1011,20 @@ def youtube_oauth2callback():
         result = exchange_code_and_store_credentials(code, account_name)
         # Save the new YouTube account to the database if not already present
         conn = get_db()
-        c = conn.cursor()
-        platform = c.execute('SELECT id FROM platforms WHERE name=?', ('youtube',)).fetchone()
+        platform = repository.get_platform_by_name(conn, 'youtube')
         if platform:
             platform_id = platform['id']
             encrypted_credentials = result['credentials']
             # Avoid duplicate accounts by channel_id
-            existing = c.execute('SELECT id FROM accounts WHERE platform_id=? AND name=?', (platform_id, result['name'])).fetchone()
+            existing = repository.find_account_by_name(conn, platform_id, result['name'])
             if not existing:
-                c.execute('''
-                    INSERT INTO accounts (platform_id, name, credentials, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    platform_id, 
-                    result['name'], 
-                    encrypted_credentials, 
-                    datetime.utcnow().isoformat(), 
-                    datetime.utcnow().isoformat()
-                ))
-                conn.commit()
-                c.execute('SELECT id FROM accounts WHERE platform_id=? AND name=?', (platform_id, result['name']))
-                account_id = c.fetchone()['id']
-                c.execute('''
-                    INSERT INTO account_bindings (account_id, binding_type, binding_value)
-                    VALUES (?, ?, ?)
-                ''', (account_id, 'channel_id', result['channel_info']['id']))
-                c.execute('''
-                    INSERT INTO account_bindings (account_id, binding_type, binding_value)
-                    VALUES (?, ?, ?)
-                ''', (account_id, 'channel_name', result['channel_info']['name']))
-                c.execute('''
-                    INSERT INTO account_bindings (account_id, binding_type, binding_value)
-                    VALUES (?, ?, ?)
-                ''', (account_id, 'channel_description', result['channel_info']['description']))
-                c.execute('''
-                    INSERT INTO account_bindings (account_id, binding_type, binding_value)
-                    VALUES (?, ?, ?)
-                ''', (account_id, 'channel_keywords', result['channel_info']['keywords']))
-                c.execute('''
-                    INSERT INTO account_bindings (account_id, binding_type, binding_value)
-                    VALUES (?, ?, ?)
-                ''', (account_id, 'channel_thumbnail', result['channel_info']['thumbnail']))
+                account_id = repository.create_account(conn, platform_id, result['name'],
+                                                       encrypted_credentials, datetime.utcnow().isoformat())
+                repository.add_account_binding(conn, account_id, 'channel_id', result['channel_info']['id'])
+                repository.add_account_binding(conn, account_id, 'channel_name', result['channel_info']['name'])
+                repository.add_account_binding(conn, account_id, 'channel_description', result['channel_info']['description'])
+                repository.add_account_binding(conn, account_id, 'channel_keywords', result['channel_info']['keywords'])
+                repository.add_account_binding(conn, account_id, 'channel_thumbnail', result['channel_info']['thumbnail'])
                 conn.commit()
         conn.close()
         flash(f"YouTube channel '{result['channel_info']['name']}' added successfully!", "success")
@@ -873,26 +1036,24 @@ def youtube_oauth2callback():
 @app.route('/delete/account/<int:account_id>', methods=['POST'])
 def delete_account(account_id):
     conn = get_db()
-    c = conn.cursor()
     try:
         # Optionally check for _method=DELETE, but not strictly necessary for this simple case
         # method = request.form.get('_method', '').upper()
         # if method != 'DELETE':
         #     return jsonify({'error': 'Method not allowed'}), 405
             
-        c.execute('DELETE FROM accounts WHERE id=?', (account_id,))
-        deleted_rows = c.rowcount
+        deleted_rows = repository.delete_account(conn, account_id)
         conn.commit()
         conn.close()
 
         if deleted_rows == 0:
             return jsonify({'error': 'Account not found'}), 404
 
-        # Also delete associated content
+        # Also delete associated content, and media no other post uses
         conn = get_db()
-        c = conn.cursor()
-        c.execute('DELETE FROM content WHERE account_id=?', (account_id,))
+        repository.delete_content_for_account(conn, account_id)
         conn.commit()
+        media_store.collect_garbage(conn, BASE_DIR)
         conn.close()
 
         # Optionally delete credential file associated with the account
@@ -911,30 +1072,33 @@ def delete_account(account_id):
 @app.route('/delete/content/<int:content_id>', methods=['POST'])
 def delete_content(content_id):
     conn = get_db()
-    conn.execute('DELETE FROM content WHERE id = ?', (content_id,))
+    repository.delete_content(conn, content_id)
     conn.commit()
+    media_store.collect_garbage(conn, BASE_DIR)
     conn.close()
+    wake_scheduler()
     return redirect(url_for('dashboard'))
 
+@app.route('/delete/campaign/<int:campaign_id>', methods=['POST'])
+def delete_campaign(campaign_id):
+    conn = get_db()
+    deleted = repository.delete_campaign(conn, campaign_id)
+    conn.commit()
+    media_store.collect_garbage(conn, BASE_DIR)
+    conn.close()
+    if not deleted:
+        return jsonify({'error': 'Campaign not found'}), 404
+    wake_scheduler()
+    return jsonify({'success': True})
+
 # --- Scheduler Setup ---
-platform_apis = {
-    'youtube': post_to_youtube,
-    'instagram': post_to_instagram,  # Enabled
-    'twitter': post_to_twitter,
-    'pinterest': post_to_pinterest,
-
-    'linkedin': post_to_linkedin,
-    'reddit': post_to_reddit,
-}
-
-scheduler = BackgroundScheduler(timezone=timezone.utc)
-scheduler.add_job(
-    func=process_scheduled_posts,
-    trigger='interval',
-    minutes=1,
-    args=[get_db, platform_apis, BASE_DIR]
-)
-scheduler.start()
+# Set EMBEDDED_SCHEDULER=false when publishing runs in a separate worker process
+# (python -m worker run), so web workers only serve requests.
+EMBEDDED_SCHEDULER = os.getenv('EMBEDDED_SCHEDULER', 'true').lower() in ('1', 'true', 'yes')
+
+if EMBEDDED_SCHEDULER:
+    # Sleeps until the next post is due; /api/content and delete_content wake it early
+    scheduler = start_scheduler_loop(get_db, platform_apis, BASE_DIR)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8080, debug=True) 
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Asyncio publishing engine.
+
+A single event loop on a background thread runs the async platform adapters
+(post_to_*_async), so one process can keep hundreds of platform requests in
+flight without a thread per post. Sync code hands coroutines to the loop with
+submit() or run(); run_sync() wraps an async adapter as a regular blocking
+(account, content, base_dir) function for platform_apis.
+"""
+import asyncio
+import functools
+import os
+import threading
+
+# Posts in flight per platform on the event loop. Override per platform with
+# ASYNC_CONCURRENCY_<PLATFORM>, e.g. ASYNC_CONCURRENCY_PINTEREST=50.
+DEFAULT_ASYNC_CONCURRENCY = int(os.getenv('ASYNC_CONCURRENCY', '100'))
+
+def get_async_concurrency(platform_name):
+    """Returns the number of posts a platform may have in flight on the event loop."""
+    override = os.getenv(f'ASYNC_CONCURRENCY_{platform_name.upper()}')
+    return max(1, int(override)) if override else DEFAULT_ASYNC_CONCURRENCY
+
+class AsyncEngine:
+    """Owns the publishing event loop and its thread, started on first use."""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def _ensure_started(self):
+        with self._lock:
+            # A loop thread inherited across fork() is not running in this process
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._semaphores = {}
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name='publish-async', daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+            return self._loop
+
+    def submit(self, coro):
+        """Schedules a coroutine on the engine's loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro):
+        """Runs a coroutine on the engine's loop and blocks until it finishes."""
+        return self.submit(coro).result()
+
+    def limit(self, platform_name):
+        """Returns the semaphore bounding in-flight posts for a platform (use from the loop)."""
+        semaphore = self._semaphores.get(platform_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(get_async_concurrency(platform_name))
+            self._semaphores[platform_name] = semaphore
+        return semaphore
+
+_engine = AsyncEngine()
+
+def get_engine():
+    return _engine
+
+def run_sync(async_function):
+    """
+    Wraps an async adapter as a blocking function with the same arguments. The
+    wrapper keeps a reference to the coroutine function in `async_function`, which
+    the scheduler uses to publish on the engine without blocking a thread.
+    """
+    @functools.wraps(async_function)
+    def wrapper(*args, **kwargs):
+        return get_engine().run(async_function(*args, **kwargs))
+    wrapper.async_function = async_function
+    return wrapper
@@ -1,7 +1,8 @@
 from flask_login import LoginManager, UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
 from datetime import datetime
+from db import get_db, IntegrityError
+import repository
 
 login_manager = LoginManager()
 
@@ -14,9 +15,8 @@ class User(UserMixin):
 
     @staticmethod
     def get(user_id):
-        conn = sqlite3.connect('social_media_automation.db')
-        conn.row_factory = sqlite3.Row
-        user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+        conn = get_db()
+        user = repository.get_user(conn, user_id)
         conn.close()
         if user:
             return User(user['id'], user['username'], user['email'], user['password_hash'])
@@ -24,24 +24,23 @@ class User(UserMixin):
 
     @staticmethod
     def create(username, email, password):
-        conn = sqlite3.connect('social_media_automation.db')
+        conn = get_db()
         password_hash = generate_password_hash(password)
         created_at = datetime.utcnow().isoformat()
         try:
-            conn.execute('INSERT INTO users (username, email, password_hash, created_at) VALUES (?, ?, ?, ?)',
-                        (username, email, password_hash, created_at))
+            repository.create_user(conn, username, email, password_hash, created_at)
             conn.commit()
             return True
-        except sqlite3.IntegrityError:
+        except IntegrityError:
+            conn.rollback()
             return False
         finally:
             conn.close()
 
     @staticmethod
     def authenticate(email, password):
-        conn = sqlite3.connect('social_media_automation.db')
-        conn.row_factory = sqlite3.Row
-        user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+        conn = get_db()
+        user = repository.get_user_by_email(conn, email)
         conn.close()
         if user and check_password_hash(user['password_hash'], password):
             return User(user['id'], user['username'], user['email'], user['password_hash'])
@@ -54,15 +53,4 @@ def load_user(user_id):
 def init_auth(app):
     login_manager.init_app(app)
     login_manager.login_view = 'login'
-    
-    # Create users table if it doesn't exist
-    conn = sqlite3.connect('social_media_automation.db')
-    conn.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TEXT NOT NULL
-    )''')
-    conn.commit()
-    conn.close() 
\ No newline at end of file
+    # The users table is created by db.init_db() 
\ No newline at end of file
@@ -0,0 +1,330 @@
+"""
+Offline benchmarks for the scheduler and the listing endpoints.
+
+Each run seeds a temporary SQLite database (DB_PATH) with synthetic platforms
+(bench_0, bench_1, ...), accounts and posts, swaps the platform adapters for stubs
+that sleep for a configurable latency instead of calling a platform, and reports:
+
+  - scheduler throughput (posts/s) and per-tick latency while publishing the due posts
+  - get_db() checkout latency
+  - p50/p99 latency of /api/content (first page, deep page, filtered), /api/errors,
+    /api/stats, /dashboard and /platform/<name>, through the Flask test client
+  - peak RSS of the benchmark process
+
+Nothing leaves the machine. Each row count runs in its own process, so sizes do
+not share caches or peak RSS:
+
+    python benchmark.py --rows 10000,100000
+    python benchmark.py --rows 100000 --save-baseline bench.json
+    python benchmark.py --rows 100000 --baseline bench.json   # exits 1 on a regression
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Metrics where a larger value is better; every other metric is a cost
+HIGHER_IS_BETTER = ('scheduler.posts_per_second',)
+
+# Latency differences below this many milliseconds are treated as noise when comparing
+NOISE_FLOOR_MS = 1.0
+
+# Share of the seeded history in each status, out of 100 (the rest is scheduled for later)
+HISTORY_STATUSES = (('posted', 90), ('error', 3), ('dead', 1))
+
+SEED_CHUNK_ROWS = 50000
+
+# Untimed requests to each endpoint before measuring it
+WARMUP_REQUESTS = 3
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def make_stub_adapter(platform_name, latency, failure_rate, use_async):
+    """A platform adapter that takes `latency` seconds and fails a share of posts with a retryable error."""
+    from async_engine import run_sync
+
+    def outcome(post):
+        if failure_rate and random.random() < failure_rate:
+            raise ConnectionError(f'{platform_name} stub: simulated connection reset')
+        return {'id': f"{platform_name}-{post['id']}"}
+
+    def publish(account, post, base_dir):
+        time.sleep(latency)
+        return outcome(post)
+
+    async def publish_async(account, post, base_dir):
+        import asyncio
+        await asyncio.sleep(latency)
+        return outcome(post)
+
+    return run_sync(publish_async) if use_async else publish
+
+def seed(conn, rows, due, platforms, accounts_per_platform):
+    """Seeds synthetic platforms, accounts and posts; `due` of the posts are due now. Returns platform names."""
+    from security import encrypt_data
+    now = time.time()
+    platform_names = [f'bench_{i}' for i in range(platforms)]
+    conn.executemany('INSERT INTO platforms (name, display_name) VALUES (?, ?)',
+                     [(name, name.replace('_', ' ').title()) for name in platform_names])
+    platform_ids = [row['id'] for row in conn.execute("SELECT id FROM platforms WHERE name LIKE 'bench_%' ORDER BY id")]
+    credentials = encrypt_data('{}')
+    created_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    conn.executemany(
+        'INSERT INTO accounts (platform_id, name, credentials, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+        [(platform_id, f'account_{platform_id}_{n}', credentials, created_at, created_at)
+         for platform_id in platform_ids for n in range(accounts_per_platform)]
+    )
+    account_ids = [row['id'] for row in conn.execute(
+        f"SELECT id FROM accounts WHERE platform_id IN ({','.join('?' * len(platform_ids))})", platform_ids)]
+
+    history = [status for status, share in HISTORY_STATUSES for _ in range(share)]
+    batch = []
+    for i in range(rows):
+        if i >= rows - due:
+            status, schedule_epoch = 'pending', now - 60
+        elif i % 100 < len(history):
+            status, schedule_epoch = history[i % 100], now - (rows - i) * 60
+        else:
+            status, schedule_epoch = 'pending', now + 30 * 86400
+        batch.append((account_ids[i % len(account_ids)], f'Benchmark post {i}', 'Synthetic benchmark content',
+                      '#bench', '', schedule_epoch, status, created_at,
+                      'simulated failure' if status in ('error', 'dead') else None))
+        if len(batch) >= SEED_CHUNK_ROWS:
+            _insert_posts(conn, batch)
+            batch = []
+    if batch:
+        _insert_posts(conn, batch)
+    conn.commit()
+    return platform_names
+
+def _insert_posts(conn, batch):
+    conn.executemany(
+        '''INSERT INTO content (account_id, title, description, hashtags, media_path, schedule_epoch,
+           status, created_at, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        batch
+    )
+
+def bench_scheduler(app_module, stub_apis):
+    """Runs scheduler passes until no post is due. Returns throughput and per-tick latency."""
+    import scheduler
+    ticks, published = [], 0
+    started = time.perf_counter()
+    while True:
+        tick_started = time.perf_counter()
+        claimed = scheduler.process_scheduled_posts(app_module.get_db, stub_apis, app_module.BASE_DIR)
+        if not claimed:
+            # Passes do not wait for their posts: claim again when one finishes, and
+            # stop once none are publishing and none were claimable
+            in_flight = scheduler.posts_in_flight()
+            if not in_flight:
+                break
+            scheduler.wait_for_posts_in_flight(fewer_than=in_flight)
+            continue
+        ticks.append((time.perf_counter() - tick_started) * 1000)
+        published += claimed
+    elapsed = time.perf_counter() - started
+    return {
+        'scheduler.posts': published,
+        'scheduler.posts_per_second': round(published / elapsed, 1) if elapsed else None,
+        'scheduler.tick_p50_ms': _round(percentile(ticks, 50)),
+        'scheduler.tick_p99_ms': _round(percentile(ticks, 99)),
+    }
+
+def bench_get_db(app_module, iterations=1000):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        conn = app_module.get_db()
+        conn.execute('SELECT 1').fetchone()
+        conn.close()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'get_db.p50_ms': _round(percentile(timings, 50), 3), 'get_db.p99_ms': _round(percentile(timings, 99), 3)}
+
+def bench_endpoints(app_module, platform_name, requests_per_endpoint):
+    conn = app_module.get_db()
+    max_id = conn.execute('SELECT MAX(id) FROM content').fetchone()[0] or 0
+    conn.close()
+    endpoints = {
+        'api_content_first_page': '/api/content?limit=100',
+        'api_content_deep_page': f'/api/content?limit=100&cursor={max(0, max_id - 200)}',
+        'api_content_by_status': '/api/content?limit=100&status=error',
+        'api_content_by_platform': f'/api/content?limit=100&platform={platform_name}&order=desc',
+        'api_errors': '/api/errors?limit=100',
+        'api_stats': '/api/stats',
+        'dashboard': '/dashboard',
+        'platform_page': f'/platform/{platform_name}',
+    }
+    client = app_module.app.test_client()
+    results = {}
+    for name, url in endpoints.items():
+        # Untimed warm-up: template compilation and the first page of SQLite's cache
+        for _ in range(WARMUP_REQUESTS):
+            client.get(url)
+        timings = []
+        for _ in range(requests_per_endpoint):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+        results[f'endpoints.{name}.p50_ms'] = _round(percentile(timings, 50))
+        results[f'endpoints.{name}.p99_ms'] = _round(percentile(timings, 99))
+    return results
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+def run_size(args, rows):
+    """Runs every benchmark against a fresh database of `rows` posts (in this process)."""
+    work_dir = tempfile.mkdtemp(prefix='smm-bench-')
+    # Configure before the app modules are imported: they read these at import time
+    os.environ['DB_PATH'] = os.path.join(work_dir, 'benchmark.db')
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['EMBEDDED_SCHEDULER'] = 'false'
+    if not os.getenv('ENCRYPTION_KEY'):
+        from cryptography.fernet import Fernet
+        os.environ['ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+    random.seed(args.seed)
+    log = io.StringIO() if not args.verbose else None
+    try:
+        with contextlib.redirect_stdout(log) if log is not None else contextlib.nullcontext():
+            import app as app_module
+            conn = app_module.get_db()
+            started = time.perf_counter()
+            due = min(args.due, rows)
+            platform_names = seed(conn, rows, due, args.platforms, args.accounts)
+            conn.close()
+            results = {'rows': rows, 'due': due, 'seed_seconds': round(time.perf_counter() - started, 2)}
+            stub_apis = {name: make_stub_adapter(name, args.latency, args.failure_rate, args.use_async)
+                         for name in platform_names}
+            results.update(bench_scheduler(app_module, stub_apis))
+            results.update(bench_get_db(app_module))
+            results.update(bench_endpoints(app_module, platform_names[0], args.requests))
+        results['peak_rss_mb'] = peak_rss_mb()
+        return results
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"[Benchmark] Kept database in {work_dir}", file=sys.stderr)
+
+def median_results(runs):
+    """Per-metric median of repeated runs, so one noisy run does not decide a comparison."""
+    merged = {}
+    for name in runs[0]:
+        values = [run[name] for run in runs if isinstance(run.get(name), (int, float))]
+        merged[name] = sorted(values)[len(values) // 2] if len(values) == len(runs) else runs[0][name]
+    return merged
+
+def compare(results, baseline, tolerance):
+    """Returns (report lines, regressions) comparing results with a baseline of the same row counts."""
+    lines, regressions = [], []
+    for rows, metrics in results.items():
+        previous = baseline.get(rows)
+        if not previous:
+            lines.append(f'{rows} rows: not in the baseline')
+            continue
+        for name, value in metrics.items():
+            old = previous.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old or name in ('rows', 'due'):
+                continue
+            change = (value - old) / old
+            worse = -change if name in HIGHER_IS_BETTER else change
+            regressed = worse > tolerance and not (name.endswith('_ms') and abs(value - old) < NOISE_FLOOR_MS)
+            marker = '  REGRESSION' if regressed else ''
+            lines.append(f'{rows:>9} {name:<40} {old:>10} -> {value:<10} {change:+.1%}{marker}')
+            if regressed:
+                regressions.append((rows, name))
+    return lines, regressions
+
+def print_results(results):
+    names = sorted({name for metrics in results.values() for name in metrics})
+    sizes = list(results)
+    print(f"{'metric':<44}" + ''.join(f'{size + " rows":>16}' for size in sizes))
+    for name in names:
+        print(f'{name:<44}' + ''.join(f'{str(results[size].get(name)):>16}' for size in sizes))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline scheduler and API benchmarks")
+    parser.add_argument('--rows', default='10000', help="Comma separated post counts to benchmark (default 10000)")
+    parser.add_argument('--due', type=int, default=2000, help="Posts due for publishing in each run (default 2000)")
+    parser.add_argument('--platforms', type=int, default=3, help="Synthetic platforms (default 3)")
+    parser.add_argument('--accounts', type=int, default=5, help="Accounts per platform (default 5)")
+    parser.add_argument('--latency', type=float, default=0.01, help="Stub adapter latency in seconds (default 0.01)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of stub posts that fail (default 0)")
+    parser.add_argument('--async', dest='use_async', action='store_true', help="Use async stub adapters")
+    parser.add_argument('--requests', type=int, default=50, help="Requests per endpoint (default 50)")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Runs per row count, reporting the median of each metric (use 3+ when gating)")
+    parser.add_argument('--save-baseline', metavar='FILE', help="Write the results to FILE")
+    parser.add_argument('--baseline', metavar='FILE', help="Compare with FILE; exit 1 on a regression")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression (default 0.2)")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary databases")
+    parser.add_argument('--verbose', action='store_true', help="Show scheduler and app output")
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_output:
+        with open(args.worker_output, 'w') as f:
+            json.dump(run_size(args, int(args.rows)), f)
+        return 0
+
+    results = {}
+    worker_args = sys.argv[1:]
+    for rows in [int(value) for value in args.rows.split(',') if value.strip()]:
+        runs = []
+        for run in range(1, args.repeat + 1):
+            print(f"[Benchmark] {rows} rows, run {run}/{args.repeat}...", file=sys.stderr)
+            with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as output:
+                output_path = output.name
+            try:
+                subprocess.run([sys.executable, os.path.abspath(__file__), *worker_args, '--rows', str(rows),
+                                '--worker-output', output_path], check=True)
+                with open(output_path) as f:
+                    runs.append(json.load(f))
+            finally:
+                os.remove(output_path)
+        results[str(rows)] = median_results(runs)
+
+    print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"[Benchmark] Baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, regressions = compare(results, json.load(f), args.tolerance)
+        print('\n'.join(lines))
+        if regressions:
+            print(f"[Benchmark] {len(regressions)} metrics regressed by more than {args.tolerance:.0%}.")
+            return 1
+        print("[Benchmark] No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
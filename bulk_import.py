@@ -0,0 +1,169 @@
+"""
+Bulk scheduling of posts from JSONL or CSV.
+
+POST /api/content/bulk takes one post per JSONL line or CSV row, with the same
+fields as /api/content:
+
+    account_id, title, description, hashtags, schedule_time, media
+
+`media` is optional and refers to a file already in the media store (uploaded
+through /api/uploads or /api/content), either by its SHA-256 or by its stored
+media_path, so a month of posts can reuse a few assets without sending them again.
+
+The body is read as a stream. Rows are validated in batches of
+BULK_IMPORT_BATCH_SIZE, with one query per batch for the accounts and one for
+the media, and the valid rows are inserted with executemany. The whole import
+is one transaction. Invalid rows are skipped and reported with their row number;
+pass atomic=true to import nothing when any row is invalid.
+"""
+import codecs
+import csv
+import json
+import os
+import re
+from datetime import datetime
+
+import repository
+from scheduler import parse_schedule_time, to_schedule_epoch
+
+# Rows validated and inserted together
+BULK_IMPORT_BATCH_SIZE = int(os.getenv('BULK_IMPORT_BATCH_SIZE', '1000'))
+
+# Most rows accepted in one import
+BULK_IMPORT_MAX_ROWS = int(os.getenv('BULK_IMPORT_MAX_ROWS', '100000'))
+
+FORMATS = ('jsonl', 'csv')
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+class BulkImportError(Exception):
+    """A problem with the import as a whole (as opposed to a single row)."""
+
+def detect_format(requested_format, content_type, filename=None):
+    """The import format from ?format=, the file name or the Content-Type; JSONL by default."""
+    if requested_format:
+        if requested_format.lower() not in FORMATS:
+            raise BulkImportError(f"Unknown format '{requested_format}'; use one of {', '.join(FORMATS)}.")
+        return requested_format.lower()
+    if (filename or '').lower().endswith('.csv') or 'csv' in (content_type or '').lower():
+        return 'csv'
+    return 'jsonl'
+
+def read_rows(stream, import_format):
+    """
+    Yields (row_number, fields, error) for each record of a binary stream. Rows
+    that cannot be parsed have fields None and an error message.
+    """
+    # utf-8-sig drops the byte order mark spreadsheet programs put before CSV headers
+    lines = codecs.getreader('utf-8-sig')(stream)
+    if import_format == 'csv':
+        reader = csv.DictReader(lines)
+        for fields in reader:
+            if None in fields:
+                yield reader.line_num, None, 'more values than header columns'
+            else:
+                yield reader.line_num, fields, None
+        return
+    for row_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f'invalid JSON: {e}'
+            continue
+        if isinstance(fields, dict):
+            yield row_number, fields, None
+        else:
+            yield row_number, None, 'each line must be a JSON object'
+
+def _text(fields, name):
+    value = fields.get(name)
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+def _parse_row(fields):
+    """Checks one row on its own; returns (post, error)."""
+    try:
+        account_id = int(_text(fields, 'account_id') or '')
+    except ValueError:
+        return None, 'account_id must be an integer'
+    title = _text(fields, 'title')
+    if not title:
+        return None, 'title is required'
+    try:
+        schedule_time = parse_schedule_time(_text(fields, 'schedule_time'))
+    except (ValueError, OverflowError):
+        return None, f"invalid schedule_time: {fields.get('schedule_time')}"
+    return {
+        'account_id': account_id, 'title': title, 'description': _text(fields, 'description'),
+        'hashtags': _text(fields, 'hashtags'), 'schedule_time': schedule_time,
+        'media': _text(fields, 'media'),
+    }, None
+
+def _import_batch(conn, batch, created_at):
+    """Validates a batch of (row_number, post) against the database and inserts the valid ones."""
+    account_ids = repository.find_existing_account_ids(conn, {post['account_id'] for _, post in batch})
+    media = {post['media'] for _, post in batch if post['media']}
+    media_paths = repository.find_media_paths(conn, {m.lower() for m in media if _SHA256_RE.match(m.lower())},
+                                              {m for m in media if not _SHA256_RE.match(m.lower())})
+    rows, results = [], []
+    for row_number, post in batch:
+        media_path = ''
+        if post['media']:
+            key = post['media'].lower() if _SHA256_RE.match(post['media'].lower()) else post['media']
+            media_path = media_paths.get(key)
+        if post['account_id'] not in account_ids:
+            results.append({'row': row_number, 'status': 'error', 'error': f"unknown account {post['account_id']}"})
+        elif media_path is None:
+            results.append({'row': row_number, 'status': 'error', 'error': f"media not found: {post['media']}"})
+        else:
+            rows.append((post['account_id'], post['title'], post['description'], post['hashtags'], media_path,
+                         post['schedule_time'], to_schedule_epoch(post['schedule_time']), created_at))
+            results.append({'row': row_number, 'status': 'scheduled'})
+    if rows:
+        repository.create_content_rows(conn, rows)
+    return results
+
+def import_posts(conn, stream, import_format, atomic=False):
+    """
+    Schedules the posts in a JSONL or CSV stream in one transaction and returns
+    {'scheduled': n, 'failed': n, 'results': [...]} with one result per row.
+    Commits, unless atomic is set and a row failed, in which case it rolls back.
+    """
+    created_at = datetime.utcnow().isoformat()
+    results, batch = [], []
+    try:
+        for row_number, fields, error in read_rows(stream, import_format):
+            if len(results) + len(batch) >= BULK_IMPORT_MAX_ROWS:
+                raise BulkImportError(f'Too many rows; at most {BULK_IMPORT_MAX_ROWS} can be imported at once.')
+            post, error = (None, error) if error else _parse_row(fields)
+            if error:
+                results.append({'row': row_number, 'status': 'error', 'error': error})
+                continue
+            batch.append((row_number, post))
+            if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+                results.extend(_import_batch(conn, batch, created_at))
+                batch = []
+        if batch:
+            results.extend(_import_batch(conn, batch, created_at))
+    except (UnicodeDecodeError, csv.Error) as e:
+        conn.rollback()
+        raise BulkImportError(f'Could not read the {import_format} data: {e}')
+    except Exception:
+        conn.rollback()
+        raise
+    failed = sum(1 for result in results if result['status'] == 'error')
+    if atomic and failed:
+        conn.rollback()
+        for result in results:
+            if result['status'] == 'scheduled':
+                result['status'] = 'skipped'
+        scheduled = 0
+    else:
+        conn.commit()
+        scheduled = len(results) - failed
+    results.sort(key=lambda result: result['row'])
+    print(f"[BulkImport] Scheduled {scheduled} posts, {failed} rows failed.")
+    return {'scheduled': scheduled, 'failed': failed, 'results': results}
@@ -0,0 +1,65 @@
+"""
+Registry of authenticated platform API clients (tweepy, PRAW, googleapiclient),
+kept per account so only the first post for an account pays for authentication
+and discovery. Clients are rebuilt when the account's credentials change and
+dropped after sitting idle.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+CLIENT_IDLE_SECONDS = int(os.getenv('CLIENT_IDLE_SECONDS', '900'))
+
+_clients = {}  # (platform, account id, thread id or None) -> [fingerprint, last_used, client]
+_clients_lock = threading.Lock()
+
+def _fingerprint(credentials):
+    """A digest of the credentials, so a changed token or secret gets a new client."""
+    return hashlib.sha256(json.dumps(credentials, sort_keys=True, default=str).encode()).hexdigest()
+
+def _account_id(account):
+    try:
+        return account['id']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+def _evict_idle(now):
+    for key in [key for key, entry in _clients.items() if now - entry[1] > CLIENT_IDLE_SECONDS]:
+        del _clients[key]
+
+def get_client(platform, account, credentials, factory, per_thread=False):
+    """
+    Returns the cached client for (platform, account), calling factory(credentials)
+    to build it on first use or when the credentials have changed. Clients that are
+    not thread-safe (PRAW, googleapiclient) should pass per_thread=True to get one
+    client per worker thread. Accounts without an id (e.g. credential validation)
+    always get a fresh client.
+    """
+    account_id = _account_id(account)
+    if account_id is None:
+        return factory(credentials)
+
+    key = (platform, account_id, threading.get_ident() if per_thread else None)
+    fingerprint = _fingerprint(credentials)
+    now = time.monotonic()
+    with _clients_lock:
+        _evict_idle(now)
+        entry = _clients.get(key)
+        if entry and entry[0] == fingerprint:
+            entry[1] = now
+            return entry[2]
+
+    # Build outside the lock: authentication can take several round trips
+    client = factory(credentials)
+    with _clients_lock:
+        _clients[key] = [fingerprint, now, client]
+    return client
+
+def discard_client(platform, account):
+    """Drops every cached client of an account, e.g. after the platform rejected its token."""
+    account_id = _account_id(account)
+    with _clients_lock:
+        for key in [key for key in _clients if key[0] == platform and key[1] == account_id]:
+            del _clients[key]
@@ -0,0 +1,484 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import metrics
+
+# Shared by the web app and the standalone scheduler worker (python -m worker run)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.getenv('DB_PATH', os.path.join(BASE_DIR, 'social_media_automation.db'))
+
+# Storage backend: 'sqlite' (default, DB_PATH) or 'postgres' (DATABASE_URL, the same
+# database prisma/schema.prisma points at). SQLite allows a single writer at a time,
+# so multi-node scheduling should run on PostgreSQL.
+DB_BACKEND = os.getenv('DB_BACKEND', 'sqlite').lower()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+# Connection tuning. WAL lets dashboard reads run alongside scheduler writes, and
+# synchronous=NORMAL is durable in WAL mode without an fsync on every commit.
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '256'))
+
+# PostgreSQL connection pool size (per process)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+    from psycopg2 import extensions as psycopg2_extensions
+except ImportError:
+    psycopg2 = None
+
+# Raised on UNIQUE violations by whichever backend is active
+IntegrityError = (sqlite3.IntegrityError,) + ((psycopg2.IntegrityError,) if psycopg2 else ())
+
+_local = threading.local()
+
+class PooledConnection(sqlite3.Connection):
+    """
+    A sqlite3 connection that is reused by every get_db() call on the same thread.
+    close() hands the connection back (rolling back anything left uncommitted once the
+    outermost user is done) instead of closing it, so existing call sites keep their
+    get_db()/close() pairs while reusing the connection and its statement cache.
+    """
+    backend = 'sqlite'
+
+    def close(self):
+        _local.depth = max(getattr(_local, 'depth', 1) - 1, 0)
+        if _local.depth == 0 and self.in_transaction:
+            self.rollback()
+
+    def close_connection(self):
+        """Really closes the underlying connection."""
+        super().close()
+
+class PostgresCursor:
+    """Cursor wrapper that accepts the '?' placeholders used throughout the codebase."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(_to_pyformat(sql), tuple(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(_to_pyformat(sql), [tuple(params) for params in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+class PostgresConnection:
+    """
+    A pooled psycopg2 connection with the subset of the sqlite3.Connection interface
+    the app uses (execute, executemany, cursor, commit, rollback, close). Rows are
+    psycopg2 DictRows, which support row['name'], row[0] and dict(row) like sqlite3.Row.
+    """
+    backend = 'postgres'
+
+    def __init__(self, raw, pool):
+        self._raw = raw
+        self._pool = pool
+
+    def cursor(self):
+        return PostgresCursor(self._raw.cursor(cursor_factory=psycopg2.extras.DictCursor))
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._raw.get_transaction_status() != psycopg2_extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        if self._raw is None:
+            return  # Already returned to the pool
+        _local.depth = max(getattr(_local, 'depth', 1) - 1, 0)
+        if _local.depth == 0:
+            # Return the connection to the pool once the outermost user is done
+            raw, self._raw = self._raw, None
+            _local.conn = None
+            self._pool.release(raw)
+
+def _to_pyformat(sql):
+    """Converts sqlite-style '?' placeholders to psycopg2's '%s'."""
+    return sql.replace('%', '%%').replace('?', '%s')
+
+class PostgresPool:
+    """A psycopg2 ThreadedConnectionPool that blocks (instead of erroring) when exhausted."""
+
+    def __init__(self, dsn, minconn, maxconn):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._available = threading.BoundedSemaphore(maxconn)
+
+    def acquire(self):
+        started = time.perf_counter()
+        self._available.acquire()
+        try:
+            raw = self._pool.getconn()
+        except Exception:
+            self._available.release()
+            raise
+        metrics.DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        return raw
+
+    def release(self, raw):
+        try:
+            if raw.get_transaction_status() != psycopg2_extensions.TRANSACTION_STATUS_IDLE:
+                raw.rollback()
+            self._pool.putconn(raw)
+        finally:
+            self._available.release()
+
+_pg_pool = None
+_pg_pool_pid = None
+_pg_pool_lock = threading.Lock()
+
+def _get_pg_pool():
+    global _pg_pool, _pg_pool_pid
+    with _pg_pool_lock:
+        # Pools inherited across fork() (e.g. gunicorn --preload) must not be shared
+        if _pg_pool is None or _pg_pool_pid != os.getpid():
+            if psycopg2 is None:
+                raise RuntimeError("DB_BACKEND=postgres requires psycopg2 (pip install psycopg2-binary).")
+            if not DATABASE_URL:
+                raise RuntimeError("DB_BACKEND=postgres requires DATABASE_URL to be set.")
+            _pg_pool = PostgresPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX)
+            _pg_pool_pid = os.getpid()
+        return _pg_pool
+
+def _connect_sqlite():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        factory=PooledConnection,
+        cached_statements=DB_STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    return conn
+
+def _connect_postgres():
+    pool = _get_pg_pool()
+    return PostgresConnection(pool.acquire(), pool)
+
+def get_db():
+    """
+    Returns this thread's pooled database connection for the configured backend,
+    opening (or checking out) one on first use. Callers should still close() it when
+    done; nested get_db() calls on the same thread share the connection.
+    """
+    conn = getattr(_local, 'conn', None)
+    # A connection inherited across fork() (e.g. gunicorn --preload) must not be reused
+    if conn is None or _local.pid != os.getpid():
+        conn = _connect_postgres() if DB_BACKEND == 'postgres' else _connect_sqlite()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.depth = 0
+    _local.depth += 1
+    return conn
+
+def release_db(exc=None):
+    """
+    Hands this thread's connection back regardless of how many get_db() calls are
+    still open, rolling back uncommitted work. Registered as a Flask teardown so a
+    request that returns early without close() cannot hold a pooled connection.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.depth == 0:
+        return
+    _local.depth = 1
+    conn.close()
+
+def close_db():
+    """Closes this thread's pooled SQLite connection, if any."""
+    conn = getattr(_local, 'conn', None)
+    if isinstance(conn, PooledConnection) and _local.pid == os.getpid():
+        conn.close_connection()
+    _local.conn = None
+
+def change_marker(conn):
+    """
+    Returns a cheap value that changes whenever another connection commits, used by
+    the scheduler loop to notice new work without querying the content table.
+    """
+    if conn.backend == 'postgres':
+        return conn.execute('SELECT pg_current_wal_lsn()::text').fetchone()[0]
+    return conn.execute('PRAGMA data_version').fetchone()[0]
+
+# --- Schema ---
+# Column types that differ between backends. Epochs need double precision in
+# PostgreSQL, where REAL is only 4 bytes.
+_DIALECT_TYPES = {
+    'sqlite': {'pk': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'float': 'REAL'},
+    'postgres': {'pk': 'SERIAL PRIMARY KEY', 'float': 'DOUBLE PRECISION'},
+}
+
+# Triggers that keep content_stats (posts per account and status) and content_outcomes
+# (publish results per hour, account and status) in step with every write to content,
+# so statistics are read from a few small rows instead of counting the content table.
+_CONTENT_STATS_TRIGGERS = {
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS content_stats_insert',
+        '''CREATE TRIGGER content_stats_insert AFTER INSERT ON content BEGIN
+            INSERT INTO content_stats (account_id, status, posts) VALUES (NEW.account_id, NEW.status, 1)
+                ON CONFLICT (account_id, status) DO UPDATE SET posts = posts + 1;
+        END''',
+        'DROP TRIGGER IF EXISTS content_stats_delete',
+        '''CREATE TRIGGER content_stats_delete AFTER DELETE ON content BEGIN
+            UPDATE content_stats SET posts = posts - 1 WHERE account_id = OLD.account_id AND status = OLD.status;
+        END''',
+        'DROP TRIGGER IF EXISTS content_stats_update',
+        '''CREATE TRIGGER content_stats_update AFTER UPDATE OF status, account_id ON content
+           WHEN OLD.status IS NOT NEW.status OR OLD.account_id IS NOT NEW.account_id BEGIN
+            UPDATE content_stats SET posts = posts - 1 WHERE account_id = OLD.account_id AND status = OLD.status;
+            INSERT INTO content_stats (account_id, status, posts) VALUES (NEW.account_id, NEW.status, 1)
+                ON CONFLICT (account_id, status) DO UPDATE SET posts = posts + 1;
+            INSERT INTO content_outcomes (bucket_epoch, account_id, status, posts)
+                SELECT CAST(strftime('%s', 'now') AS INTEGER) / 3600 * 3600, NEW.account_id, NEW.status, 1
+                WHERE NEW.status IN ('posted', 'retrying', 'error', 'dead') AND OLD.status IS NOT NEW.status
+                ON CONFLICT (bucket_epoch, account_id, status) DO UPDATE SET posts = posts + 1;
+        END''',
+    ],
+    'postgres': [
+        '''CREATE OR REPLACE FUNCTION content_stats_maintain() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND OLD.status IS NOT DISTINCT FROM NEW.status
+                    AND OLD.account_id = NEW.account_id THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE content_stats SET posts = posts - 1 WHERE account_id = OLD.account_id AND status = OLD.status;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO content_stats (account_id, status, posts) VALUES (NEW.account_id, NEW.status, 1)
+                    ON CONFLICT (account_id, status) DO UPDATE SET posts = content_stats.posts + 1;
+            END IF;
+            IF TG_OP = 'UPDATE' AND NEW.status IN ('posted', 'retrying', 'error', 'dead')
+                    AND OLD.status IS DISTINCT FROM NEW.status THEN
+                INSERT INTO content_outcomes (bucket_epoch, account_id, status, posts)
+                    VALUES ((floor(extract(epoch FROM now()) / 3600) * 3600)::bigint, NEW.account_id, NEW.status, 1)
+                    ON CONFLICT (bucket_epoch, account_id, status) DO UPDATE SET posts = content_outcomes.posts + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql''',
+        'DROP TRIGGER IF EXISTS content_stats_trigger ON content',
+        '''CREATE TRIGGER content_stats_trigger AFTER INSERT OR DELETE OR UPDATE OF status, account_id ON content
+           FOR EACH ROW EXECUTE FUNCTION content_stats_maintain()''',
+    ],
+}
+
+# Triggers that record the 'enqueued' post event (post_events.py) when a post is created
+# or requeued after failing, whichever path wrote it. due_at is when the post is due.
+_POST_EVENTS_TRIGGERS = {
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS post_events_insert',
+        '''CREATE TRIGGER post_events_insert AFTER INSERT ON content BEGIN
+            INSERT INTO post_events (content_id, attempt, event, occurred_at, due_at, platform)
+                SELECT NEW.id, 0, 'enqueued', now_epoch, MAX(COALESCE(NEW.schedule_epoch, 0), now_epoch),
+                    (SELECT platforms.name FROM accounts JOIN platforms ON platforms.id = accounts.platform_id
+                     WHERE accounts.id = NEW.account_id)
+                FROM (SELECT (julianday('now') - 2440587.5) * 86400.0 AS now_epoch);
+        END''',
+        'DROP TRIGGER IF EXISTS post_events_requeue',
+        '''CREATE TRIGGER post_events_requeue AFTER UPDATE OF status ON content
+           WHEN NEW.status = 'pending' AND OLD.status IN ('error', 'dead', 'retrying') BEGIN
+            INSERT INTO post_events (content_id, attempt, event, occurred_at, due_at, platform)
+                SELECT NEW.id, 0, 'enqueued', now_epoch, MAX(COALESCE(NEW.schedule_epoch, 0), now_epoch),
+                    (SELECT platforms.name FROM accounts JOIN platforms ON platforms.id = accounts.platform_id
+                     WHERE accounts.id = NEW.account_id)
+                FROM (SELECT (julianday('now') - 2440587.5) * 86400.0 AS now_epoch);
+        END''',
+    ],
+    'postgres': [
+        '''CREATE OR REPLACE FUNCTION post_events_enqueued() RETURNS trigger AS $$
+        DECLARE
+            now_epoch DOUBLE PRECISION := extract(epoch FROM clock_timestamp());
+        BEGIN
+            IF TG_OP = 'UPDATE' AND NOT (NEW.status = 'pending' AND OLD.status IN ('error', 'dead', 'retrying')) THEN
+                RETURN NULL;
+            END IF;
+            INSERT INTO post_events (content_id, attempt, event, occurred_at, due_at, platform)
+                VALUES (NEW.id, 0, 'enqueued', now_epoch, GREATEST(COALESCE(NEW.schedule_epoch, 0), now_epoch),
+                    (SELECT platforms.name FROM accounts JOIN platforms ON platforms.id = accounts.platform_id
+                     WHERE accounts.id = NEW.account_id));
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql''',
+        'DROP TRIGGER IF EXISTS post_events_trigger ON content',
+        '''CREATE TRIGGER post_events_trigger AFTER INSERT OR UPDATE OF status ON content
+           FOR EACH ROW EXECUTE FUNCTION post_events_enqueued()''',
+    ],
+}
+
+def table_columns(conn, table):
+    """Returns the column names of a table."""
+    if conn.backend == 'postgres':
+        rows = conn.execute(
+            'SELECT column_name FROM information_schema.columns WHERE table_name=?', (table,)
+        ).fetchall()
+        return [row[0] for row in rows]
+    return [row['name'] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+def init_db():
+    """Creates the schema, applies column migrations and seeds the supported platforms."""
+    from scheduler import to_schedule_epoch, SCHEDULER_LEASE_SECONDS
+    conn = get_db()
+    types = _DIALECT_TYPES[conn.backend]
+    c = conn.cursor()
+    c.execute(f'''CREATE TABLE IF NOT EXISTS platforms (
+        id {types['pk']}, name TEXT UNIQUE NOT NULL, display_name TEXT NOT NULL
+    )''')
+    c.execute(f'''CREATE TABLE IF NOT EXISTS accounts (
+        id {types['pk']}, platform_id INTEGER NOT NULL, name TEXT NOT NULL,
+        credentials TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        FOREIGN KEY(platform_id) REFERENCES platforms(id)
+    )''')
+    c.execute(f'''CREATE TABLE IF NOT EXISTS account_bindings (
+        id {types['pk']}, account_id INTEGER NOT NULL, binding_type TEXT NOT NULL, binding_value TEXT
+    )''')
+    c.execute(f'''CREATE TABLE IF NOT EXISTS content (
+        id {types['pk']}, account_id INTEGER NOT NULL, title TEXT NOT NULL,
+        description TEXT, hashtags TEXT, media_path TEXT NOT NULL, schedule_time TEXT, schedule_epoch {types['float']},
+        status TEXT DEFAULT 'pending', error TEXT, created_at TEXT NOT NULL,
+        claimed_by TEXT, lease_expires_at {types['float']},
+        attempts INTEGER DEFAULT 0, next_attempt_at {types['float']}, error_class TEXT,
+        campaign_id INTEGER, external_id TEXT,
+        FOREIGN KEY(account_id) REFERENCES accounts(id)
+    )''')
+    # A campaign is one piece of content published to several accounts; each delivery
+    # target is a content row with campaign_id set, so it is scheduled and retried alone
+    c.execute(f'''CREATE TABLE IF NOT EXISTS campaigns (
+        id {types['pk']}, title TEXT NOT NULL, description TEXT, hashtags TEXT, media_path TEXT NOT NULL,
+        schedule_time TEXT, schedule_epoch {types['float']}, created_at TEXT NOT NULL
+    )''')
+    # Materialized statistics (stats.py), maintained by the _CONTENT_STATS_TRIGGERS
+    new_stats = not table_columns(conn, 'content_stats')
+    c.execute('''CREATE TABLE IF NOT EXISTS content_stats (
+        account_id INTEGER NOT NULL, status TEXT NOT NULL, posts INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (account_id, status)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS content_outcomes (
+        bucket_epoch INTEGER NOT NULL, account_id INTEGER NOT NULL, status TEXT NOT NULL,
+        posts INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (bucket_epoch, account_id, status)
+    )''')
+    # Append-only post lifecycle events (post_events.py)
+    c.execute(f'''CREATE TABLE IF NOT EXISTS post_events (
+        id {types['pk']}, content_id INTEGER NOT NULL, attempt INTEGER, event TEXT NOT NULL,
+        occurred_at {types['float']} NOT NULL, due_at {types['float']}, platform TEXT, worker_id TEXT, error_class TEXT
+    )''')
+    # Token buckets of the rate limiter (rate_limit.py), shared by every worker
+    c.execute(f'''CREATE TABLE IF NOT EXISTS rate_limits (
+        bucket_key TEXT PRIMARY KEY, tokens {types['float']} NOT NULL, capacity {types['float']} NOT NULL,
+        refill_per_second {types['float']} NOT NULL, updated_at {types['float']} NOT NULL,
+        blocked_until {types['float']} NOT NULL DEFAULT 0
+    )''')
+    # Resumable media uploads in progress (uploads.py); received is the committed offset
+    c.execute(f'''CREATE TABLE IF NOT EXISTS uploads (
+        id TEXT PRIMARY KEY, filename TEXT NOT NULL, total_size INTEGER, received INTEGER NOT NULL DEFAULT 0,
+        last_chunk_id TEXT, last_chunk_offset INTEGER, sha256 TEXT, status TEXT NOT NULL DEFAULT 'uploading',
+        media_path TEXT, created_at {types['float']} NOT NULL, updated_at {types['float']} NOT NULL
+    )''')
+    # Content-addressed media files (media_store.py), referenced by content.media_path
+    c.execute(f'''CREATE TABLE IF NOT EXISTS media_assets (
+        sha256 TEXT PRIMARY KEY, path TEXT NOT NULL UNIQUE, size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0, created_at {types['float']} NOT NULL,
+        updated_at {types['float']} NOT NULL, released_at {types['float']}
+    )''')
+    c.execute(f'''CREATE TABLE IF NOT EXISTS users (
+        id {types['pk']},
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )''')
+    # Migrate older databases: add columns introduced after the original schema
+    content_columns = table_columns(conn, 'content')
+    for column, column_type in [('schedule_epoch', types['float']), ('claimed_by', 'TEXT'), ('lease_expires_at', types['float']),
+                                ('attempts', 'INTEGER DEFAULT 0'), ('next_attempt_at', types['float']), ('error_class', 'TEXT'),
+                                ('campaign_id', 'INTEGER'), ('external_id', 'TEXT')]:
+        if column not in content_columns:
+            c.execute(f'ALTER TABLE content ADD COLUMN {column} {column_type}')
+    # Backfill the sortable UTC schedule_epoch from the stored ISO strings
+    unmigrated = c.execute('SELECT id, schedule_time FROM content WHERE schedule_epoch IS NULL').fetchall()
+    if unmigrated:
+        c.executemany('UPDATE content SET schedule_epoch=? WHERE id=?',
+                      [(to_schedule_epoch(row['schedule_time']), row['id']) for row in unmigrated])
+    # Posts left in 'processing' without a lease (claimed before leases existed) get one
+    # lease period before another worker may reclaim them
+    c.execute("UPDATE content SET lease_expires_at=? WHERE status='processing' AND lease_expires_at IS NULL",
+              (datetime.now(timezone.utc).timestamp() + SCHEDULER_LEASE_SECONDS,))
+    # The scheduler fetches due posts by (status, schedule_epoch), expired leases by
+    # (status, lease_expires_at) and posts due for another attempt by (status, next_attempt_at)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_status_schedule ON content (status, schedule_epoch)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_status_lease ON content (status, lease_expires_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_status_next_attempt ON content (status, next_attempt_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_campaign ON content (campaign_id)')
+    # Keyset-paginated listings filtered by account or status, read in id order
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_account_id ON content (account_id, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_status_id ON content (status, id)')
+    # Media garbage collection looks for unreferenced assets
+    c.execute('CREATE INDEX IF NOT EXISTS idx_media_assets_refcount ON media_assets (refcount)')
+    # Publishing reports read events by time, post timelines by post
+    c.execute('CREATE INDEX IF NOT EXISTS idx_post_events_occurred_at ON post_events (occurred_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_post_events_content_id ON post_events (content_id, occurred_at)')
+    # Posts with their account and platform names, read by listings in one statement.
+    # Recreated on start so it includes columns added by the migrations above.
+    c.execute('DROP VIEW IF EXISTS content_details')
+    c.execute('''CREATE VIEW content_details AS
+        SELECT content.*, accounts.name AS account_name, accounts.platform_id, platforms.name AS platform
+        FROM content
+        LEFT JOIN accounts ON accounts.id = content.account_id
+        LEFT JOIN platforms ON platforms.id = accounts.platform_id''')
+    for statement in _CONTENT_STATS_TRIGGERS[conn.backend] + _POST_EVENTS_TRIGGERS[conn.backend]:
+        c.execute(statement)
+    if new_stats:
+        # Count the posts of databases created before the statistics existed
+        from repository import rebuild_content_stats
+        rebuild_content_stats(conn)
+    # Remove legacy Medium platform and associated accounts if they still exist
+    medium_row = c.execute('SELECT id FROM platforms WHERE name=?', ('medium',)).fetchone()
+    if medium_row:
+        medium_id = medium_row['id'] if hasattr(medium_row, 'keys') else medium_row[0]
+        c.execute('DELETE FROM accounts WHERE platform_id=?', (medium_id,))
+        c.execute('DELETE FROM platforms WHERE id=?', (medium_id,))
+
+    # Seed the supported platforms
+    platforms = [
+        ('youtube', 'YouTube'), ('instagram', 'Instagram'), ('twitter', 'Twitter'),
+        ('pinterest', 'Pinterest'), ('linkedin', 'LinkedIn'),
+        ('reddit', 'Reddit')
+    ]
+    c.executemany('INSERT INTO platforms (name, display_name) VALUES (?, ?) ON CONFLICT (name) DO NOTHING', platforms)
+    conn.commit()
+    conn.close()
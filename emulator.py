@@ -0,0 +1,621 @@
+"""
+Local emulator of the platform APIs, for end-to-end load tests of the publishing path.
+
+It serves the endpoints the adapters call, each platform under its own prefix:
+
+  - Instagram Graph API: POST /instagram/<ig_user_id>/media, then /media_publish
+  - Pinterest v5: POST /pinterest/media, PUT to the returned upload_url, POST /pinterest/pins
+  - LinkedIn v2: GET /linkedin/me, POST /linkedin/assets?action=registerUpload, PUT to the
+    returned uploadUrl, POST /linkedin/ugcPosts
+  - Medium v1: GET /medium/me, POST /medium/users/<user_id>/posts
+
+and the adapters are pointed at it with their base-URL overrides:
+
+    INSTAGRAM_API_BASE_URL=http://127.0.0.1:8765/instagram
+    PINTEREST_API_BASE_URL=http://127.0.0.1:8765/pinterest
+    LINKEDIN_API_BASE_URL=http://127.0.0.1:8765/linkedin
+    MEDIUM_API_BASE_URL=http://127.0.0.1:8765/medium
+
+Every response is delayed by a draw from a latency distribution, a share of
+requests fail with a 5xx or are throttled, and platforms given a quota answer
+with rate-limit headers (x-ratelimit-*, or x-app-usage for Instagram) and
+throttle once it runs out, the way each platform does. So the HTTP retries, the
+retry queue and the scheduler's rate limiting all get exercised.
+
+    python emulator.py serve --port 8765 --latency lognormal:120:0.5 --latency instagram=uniform:300:900
+    python emulator.py drive --rate 50 --duration 60 --error-rate 0.02 --quota pinterest=1000/60
+
+`drive` starts an emulator, seeds a temporary SQLite database (DB_PATH) with
+accounts on the emulated platforms, inserts posts falling due at N per second
+and publishes them with the real scheduler loop and adapters. It then reports
+throughput, the delay from a post falling due to the platform accepting it, the
+final statuses and the requests the emulator answered.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask, jsonify, request
+
+# Used when --latency gives no distribution for a platform
+DEFAULT_LATENCY = 'lognormal:80:0.5'
+
+# Latency distributions: name -> (parameter count, sampler returning milliseconds)
+LATENCY_DISTRIBUTIONS = {
+    'fixed': (1, lambda ms: ms),
+    'uniform': (2, random.uniform),
+    'normal': (2, lambda mean, stddev: max(0.0, random.gauss(mean, stddev))),
+    'lognormal': (2, lambda median, sigma: random.lognormvariate(math.log(median), sigma)),
+    'exponential': (1, lambda mean: random.expovariate(1 / mean)),
+}
+
+# Status codes of injected server errors
+SERVER_ERROR_STATUSES = (500, 502, 503)
+
+# Platforms `drive` can publish to, and the adapter setting pointing each at the emulator
+DRIVE_PLATFORMS = ('instagram', 'pinterest', 'linkedin', 'medium')
+
+# How often `drive` inserts the posts falling due, and reports progress
+DRIVE_TICK_SECONDS = 0.1
+DRIVE_PROGRESS_SECONDS = 5
+
+_TITLE_RE = re.compile(r'Load test post (\d+)')
+
+def parse_latency(spec):
+    """
+    Parses a latency distribution in milliseconds, e.g. fixed:50, uniform:20:200,
+    normal:100:30, lognormal:80:0.5 (median, sigma) or exponential:50 (mean).
+    Returns a function giving a delay in seconds.
+    """
+    name, _, params = spec.partition(':')
+    if name not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution '{name}'; use one of {', '.join(LATENCY_DISTRIBUTIONS)}.")
+    count, sampler = LATENCY_DISTRIBUTIONS[name]
+    try:
+        values = [float(value) for value in params.split(':')] if params else []
+    except ValueError:
+        raise ValueError(f"Invalid latency '{spec}'.")
+    if len(values) != count:
+        raise ValueError(f"Latency '{name}' takes {count} parameter(s), e.g. {name}:{':'.join(['50'] * count)}.")
+    if name in ('lognormal', 'exponential') and values[0] <= 0:
+        raise ValueError(f"Latency '{spec}' needs a positive {'median' if name == 'lognormal' else 'mean'}.")
+    return lambda: sampler(*values) / 1000
+
+def parse_quota(spec):
+    """Parses a request budget COUNT/SECONDS, e.g. 200/3600."""
+    try:
+        count, seconds = spec.split('/')
+        return int(count), float(seconds)
+    except ValueError:
+        raise ValueError(f"Invalid quota '{spec}'; use COUNT/SECONDS, e.g. 200/3600.")
+
+def parse_per_platform(values, parse, default=None):
+    """Parses repeated [PLATFORM=]SPEC options into {platform or None: parsed}."""
+    parsed = {None: parse(default)} if default else {}
+    for value in values or []:
+        platform, _, spec = value.rpartition('=')
+        parsed[platform or None] = parse(spec)
+    return parsed
+
+class Emulator:
+    """Settings, state and counters of one emulator. Handlers run on many threads."""
+
+    def __init__(self, latencies, quotas=None, error_rate=0.0, throttle_rate=0.0):
+        self.latencies = latencies
+        self.quotas = quotas or {}
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.requests = {}
+        self.published = []
+        self._windows = {}
+        self._containers = {}
+        self._uploads = {}
+        self._ids = itertools.count(17841000000000001)
+        self._lock = threading.Lock()
+
+    def new_id(self):
+        with self._lock:
+            return str(next(self._ids))
+
+    def latency(self, platform):
+        sampler = self.latencies.get(platform) or self.latencies.get(None)
+        return sampler() if sampler else 0
+
+    def _use_quota(self, platform, now_epoch):
+        """Counts a request against the platform's quota. Returns (limit, remaining, reset seconds) or None."""
+        quota = self.quotas.get(platform) or self.quotas.get(None)
+        if not quota:
+            return None
+        limit, seconds = quota
+        window = now_epoch // seconds * seconds
+        with self._lock:
+            start, used = self._windows.get(platform, (window, 0))
+            if start != window:
+                used = 0
+            used += 1
+            self._windows[platform] = (window, used)
+        return limit, limit - used, window + seconds - now_epoch
+
+    def handle(self, platform, endpoint, authorized, respond, metered=True):
+        """
+        Delays, counts and throttles or fails a request; otherwise answers it with
+        respond(). Requests that are not metered only draw from the latency and
+        server errors.
+        """
+        time.sleep(self.latency(platform))
+        quota = self._use_quota(platform, time.time()) if metered else None
+        roll = random.random()
+        if quota and quota[1] < 0:
+            response = _throttled(platform, quota[2], exhausted=True)
+        elif metered and roll < self.throttle_rate:
+            response = _throttled(platform, quota[2] if quota else 1 + random.random() * 4)
+        elif roll < self.throttle_rate + self.error_rate:
+            response = _error(platform, random.choice(SERVER_ERROR_STATUSES), 'Emulated server error')
+        elif not authorized:
+            response = _error(platform, 401, 'Invalid access token')
+        else:
+            response = respond()
+        if quota:
+            response.headers.update(_rate_limit_headers(platform, *quota))
+        with self._lock:
+            key = (platform, endpoint, response.status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+        return response
+
+    def publish(self, platform, text):
+        """Records a post the emulated platform accepted; returns its id."""
+        post_id = self.new_id()
+        with self._lock:
+            self.published.append((platform, text or '', time.time()))
+        return post_id
+
+    def add_container(self, caption):
+        container_id = self.new_id()
+        with self._lock:
+            self._containers[container_id] = caption
+        return container_id
+
+    def take_container(self, container_id):
+        with self._lock:
+            return self._containers.pop(container_id, None)
+
+    def add_upload(self):
+        media_id = self.new_id()
+        with self._lock:
+            self._uploads[media_id] = False
+        return media_id
+
+    def finish_upload(self, media_id):
+        with self._lock:
+            if media_id not in self._uploads:
+                return False
+            self._uploads[media_id] = True
+            return True
+
+    def uploaded(self, media_id):
+        with self._lock:
+            return self._uploads.pop(media_id, False)
+
+    def request_counts(self):
+        with self._lock:
+            return dict(self.requests)
+
+def _error(platform, status, message, code=None, headers=None):
+    """An error response in the platform's format (Graph API errors for Instagram)."""
+    if platform == 'instagram':
+        body = {'error': {'message': message, 'type': 'OAuthException', 'code': code or (2 if status >= 500 else 100),
+                          'is_transient': status >= 500, 'fbtrace_id': 'emulator'}}
+    else:
+        body = {'status': status, 'code': code or status, 'message': message}
+    response = jsonify(body)
+    response.status_code = status
+    response.headers.update(headers or {})
+    return response
+
+def _throttled(platform, retry_after, exhausted=False):
+    # The Graph API throttles with a 400 and an error code instead of a 429:
+    # 4 when the app's budget is used up, 32 for a single user
+    if platform == 'instagram':
+        return _error(platform, 400, 'Application request limit reached' if exhausted else 'User request limit reached',
+                      code=4 if exhausted else 32)
+    return _error(platform, 429, 'Rate limit exceeded', headers={'Retry-After': str(max(1, math.ceil(retry_after)))})
+
+def _rate_limit_headers(platform, limit, remaining, reset_seconds):
+    if platform == 'instagram':
+        usage = min(100, round(100 * (limit - remaining) / limit)) if limit else 100
+        return {'x-app-usage': json.dumps({'call_count': usage, 'total_cputime': usage, 'total_time': usage})}
+    return {'x-ratelimit-limit': str(limit), 'x-ratelimit-remaining': str(max(0, remaining)),
+            'x-ratelimit-reset': str(math.ceil(reset_seconds))}
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    return header[len('Bearer '):] if header.startswith('Bearer ') else None
+
+def create_app(emulator):
+    """The emulator's Flask app."""
+    app = Flask(__name__)
+
+    # --- Instagram Graph API ---
+    @app.route('/instagram/<ig_user_id>/media', methods=['POST'])
+    def instagram_media(ig_user_id):
+        def respond():
+            if not request.form.get('image_url'):
+                return _error('instagram', 400, 'The parameter image_url is required')
+            return jsonify({'id': emulator.add_container(request.form.get('caption', ''))})
+        return emulator.handle('instagram', 'media', request.form.get('access_token'), respond)
+
+    @app.route('/instagram/<ig_user_id>/media_publish', methods=['POST'])
+    def instagram_media_publish(ig_user_id):
+        def respond():
+            caption = emulator.take_container(request.form.get('creation_id'))
+            if caption is None:
+                return _error('instagram', 400, 'Unsupported post request', code=100)
+            return jsonify({'id': emulator.publish('instagram', caption)})
+        return emulator.handle('instagram', 'media_publish', request.form.get('access_token'), respond)
+
+    # --- Pinterest ---
+    @app.route('/pinterest/media', methods=['POST'])
+    def pinterest_register_media():
+        def respond():
+            media_id = emulator.add_upload()
+            return jsonify({'media_id': media_id, 'media_type': 'image', 'upload_parameters': {},
+                            'upload_url': f'{request.host_url}pinterest/uploads/{media_id}'})
+        return emulator.handle('pinterest', 'media', _bearer_token(), respond)
+
+    @app.route('/pinterest/uploads/<media_id>', methods=['PUT'])
+    def pinterest_upload(media_id):
+        # Stands in for the pre-signed storage URL, which takes no token and has no API quota
+        def respond():
+            request.get_data()
+            if not emulator.finish_upload(media_id):
+                return _error('pinterest', 404, 'Unknown upload')
+            return '', 204
+        return emulator.handle('pinterest', 'upload', True, lambda: app.make_response(respond()), metered=False)
+
+    @app.route('/pinterest/pins', methods=['POST'])
+    def pinterest_pins():
+        def respond():
+            data = request.get_json(silent=True) or {}
+            media_id = (data.get('media_source') or {}).get('media_id')
+            if not data.get('board_id') or not emulator.uploaded(media_id):
+                return _error('pinterest', 400, 'Invalid board_id or media_id')
+            pin_id = emulator.publish('pinterest', data.get('title'))
+            response = jsonify({'id': pin_id, 'board_id': data['board_id'], 'title': data.get('title'),
+                                'created_at': datetime.utcnow().isoformat()})
+            response.status_code = 201
+            return response
+        return emulator.handle('pinterest', 'pins', _bearer_token(), respond)
+
+    # --- LinkedIn ---
+    @app.route('/linkedin/me', methods=['GET'])
+    def linkedin_me():
+        return emulator.handle('linkedin', 'me', _bearer_token(),
+                               lambda: jsonify({'id': f'emulated{abs(hash(_bearer_token())) % 10 ** 8}',
+                                                'localizedFirstName': 'Load', 'localizedLastName': 'Test'}))
+
+    @app.route('/linkedin/assets', methods=['POST'])
+    def linkedin_register_upload():
+        def respond():
+            data = request.get_json(silent=True) or {}
+            if request.args.get('action') != 'registerUpload' or not (data.get('registerUploadRequest') or {}).get('owner'):
+                return _error('linkedin', 422, 'registerUploadRequest with an owner is required')
+            asset_id = emulator.add_upload()
+            return jsonify({'value': {
+                'asset': f'urn:li:digitalmediaAsset:{asset_id}',
+                'uploadMechanism': {'com.linkedin.digitalmedia.uploadmechanism.MediaUploadHttpRequest': {
+                    'uploadUrl': f'{request.host_url}linkedin/uploads/{asset_id}', 'headers': {},
+                }},
+            }})
+        return emulator.handle('linkedin', 'assets', _bearer_token(), respond)
+
+    @app.route('/linkedin/uploads/<asset_id>', methods=['PUT'])
+    def linkedin_upload(asset_id):
+        # Stands in for the media upload host, which has no API quota
+        def respond():
+            request.get_data()
+            if not emulator.finish_upload(asset_id):
+                return _error('linkedin', 404, 'Unknown upload')
+            return '', 201
+        return emulator.handle('linkedin', 'upload', _bearer_token(), lambda: app.make_response(respond()),
+                               metered=False)
+
+    @app.route('/linkedin/ugcPosts', methods=['POST'])
+    def linkedin_ugc_posts():
+        def respond():
+            data = request.get_json(silent=True) or {}
+            share = (data.get('specificContent') or {}).get('com.linkedin.ugc.ShareContent') or {}
+            if not data.get('author'):
+                return _error('linkedin', 422, 'author is required')
+            for media in share.get('media') or []:
+                if not emulator.uploaded(str(media.get('media', '')).rsplit(':', 1)[-1]):
+                    return _error('linkedin', 422, f"Unknown or incomplete asset {media.get('media')}")
+            urn = f"urn:li:share:{emulator.publish('linkedin', (share.get('shareCommentary') or {}).get('text'))}"
+            response = jsonify({'id': urn})
+            response.status_code = 201
+            response.headers['X-RestLi-Id'] = urn
+            return response
+        return emulator.handle('linkedin', 'ugcPosts', _bearer_token(), respond)
+
+    # --- Medium ---
+    @app.route('/medium/me', methods=['GET'])
+    def medium_me():
+        return emulator.handle('medium', 'me', _bearer_token(), lambda: jsonify({'data': {
+            'id': f'emulated{abs(hash(_bearer_token())) % 10 ** 8}', 'username': 'loadtest', 'name': 'Load Test',
+        }}))
+
+    @app.route('/medium/users/<user_id>/posts', methods=['POST'])
+    def medium_posts(user_id):
+        def respond():
+            data = request.get_json(silent=True) or {}
+            if not data.get('title') or not data.get('content'):
+                return _error('medium', 400, 'title and content are required')
+            post_id = emulator.publish('medium', data['title'])
+            response = jsonify({'data': {'id': post_id, 'title': data['title'], 'authorId': user_id,
+                                         'url': f'https://medium.com/@loadtest/{post_id}',
+                                         'publishStatus': data.get('publishStatus', 'public')}})
+            response.status_code = 201
+            return response
+        return emulator.handle('medium', 'posts', _bearer_token(), respond)
+
+    @app.route('/_emulator/stats', methods=['GET'])
+    def emulator_stats():
+        return jsonify({
+            'published': len(emulator.published),
+            'requests': [{'platform': platform, 'endpoint': endpoint, 'status': status, 'count': count}
+                         for (platform, endpoint, status), count in sorted(emulator.request_counts().items())],
+        })
+
+    return app
+
+def start_server(emulator, host='127.0.0.1', port=0):
+    """Serves an emulator on a background thread. Returns the server (server.port; server.shutdown() stops it)."""
+    from werkzeug.serving import make_server
+    server = make_server(host, port, create_app(emulator), threaded=True)
+    threading.Thread(target=server.serve_forever, name='emulator', daemon=True).start()
+    return server
+
+def base_urls(server_url):
+    """The adapter base-URL settings pointing every platform at an emulator."""
+    return {f'{platform.upper()}_API_BASE_URL': f'{server_url}/{platform}' for platform in DRIVE_PLATFORMS}
+
+# --- Load driver ---
+def _credentials(platform_name, n):
+    token = f'emulator-{platform_name}-{n}'
+    if platform_name == 'instagram':
+        return {'access_token': token, 'ig_user_id': f'1784{n:011d}'}
+    if platform_name == 'pinterest':
+        return {'access_token': token, 'board_id': f'board-{n}'}
+    if platform_name == 'linkedin':
+        # Every other account has no member URN, so its posts look it up through /me first
+        credentials = {'access_token': token, 'scopes': ['w_member_social'],
+                       'expires_at': (datetime.utcnow() + timedelta(days=60)).isoformat()}
+        if n % 2 == 0:
+            credentials['person_urn'] = f'urn:li:person:emulated{n}'
+        return credentials
+    return {'access_token': token}
+
+def seed_accounts(conn, platform_names, accounts_per_platform):
+    """Creates accounts on the emulated platforms. Returns [(account_id, platform_name)]."""
+    import repository
+    from security import encrypt_data
+    created_at = datetime.utcnow().isoformat()
+    accounts = []
+    for platform_name in platform_names:
+        platform = repository.get_platform_by_name(conn, platform_name)
+        if platform is None:
+            # Medium is no longer offered in the app, but its adapter can still be driven
+            conn.execute('INSERT INTO platforms (name, display_name) VALUES (?, ?)',
+                         (platform_name, platform_name.title()))
+            platform = repository.get_platform_by_name(conn, platform_name)
+        for n in range(accounts_per_platform):
+            account_id = repository.create_account(conn, platform['id'], f'load-test-{platform_name}-{n}',
+                                                   encrypt_data(json.dumps(_credentials(platform_name, n))),
+                                                   created_at)
+            accounts.append((account_id, platform_name))
+    conn.commit()
+    return accounts
+
+def _insert_due_posts(conn, accounts, first_seq, count, media, now_epoch):
+    created_at = datetime.utcnow().isoformat()
+    schedule_time = datetime.fromtimestamp(now_epoch).isoformat()
+    rows = []
+    for seq in range(first_seq, first_seq + count):
+        account_id, platform_name = accounts[seq % len(accounts)]
+        rows.append((account_id, f'Load test post {seq}', 'Published through the platform emulator', 'loadtest',
+                     media.get(platform_name, ''), schedule_time, now_epoch, created_at))
+    conn.executemany(
+        '''INSERT INTO content (account_id, title, description, hashtags, media_path, schedule_time,
+           schedule_epoch, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        rows
+    )
+    conn.commit()
+
+def drive(args, emulator, out):
+    """Publishes posts falling due at args.rate per second through the real scheduler against an emulator."""
+    from benchmark import percentile
+    work_dir = tempfile.mkdtemp(prefix='smm-emulator-')
+    server = start_server(emulator)
+    server_url = f'http://127.0.0.1:{server.port}'
+    # Configure before the app modules are imported: they read these at import time
+    os.environ.update(base_urls(server_url))
+    os.environ['DB_PATH'] = os.path.join(work_dir, 'emulator.db')
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['EMBEDDED_SCHEDULER'] = 'false'
+    if not os.getenv('ENCRYPTION_KEY'):
+        from cryptography.fernet import Fernet
+        os.environ['ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+    if not args.client_limits:
+        # Leave throttling to the emulator's quotas rather than the app's own daily budgets
+        for platform_name in args.platforms:
+            os.environ.setdefault(f'RATE_LIMIT_{platform_name.upper()}_ACCOUNT', 'off')
+            os.environ.setdefault(f'RATE_LIMIT_{platform_name.upper()}_APP', 'off')
+
+    import scheduler
+    import stats
+    from db import get_db, init_db
+    from medium_api import post_to_medium
+    from publishers import platform_apis
+
+    init_db()
+    # Medium is no longer a publishing platform; its sync adapter is still exercised here
+    apis = dict(platform_apis, medium=post_to_medium)
+    # Pinterest uploads a local file; Instagram takes a public URL. The emulator does not decode either
+    with open(os.path.join(work_dir, 'load-test.jpg'), 'wb') as f:
+        f.write(b'\xff\xd8\xff\xe0' + os.urandom(2048) + b'\xff\xd9')
+    media = {'pinterest': 'load-test.jpg', 'linkedin': 'load-test.jpg', 'instagram': f'{server_url}/media/load-test.jpg'}
+
+    conn = get_db()
+    loop = None
+    try:
+        accounts = seed_accounts(conn, args.platforms, args.accounts)
+        loop = scheduler.start_scheduler_loop(get_db, apis, work_dir)
+        print(f"[Emulator] Driving {args.rate} posts/s for {args.duration}s at {server_url} "
+              f"({len(accounts)} accounts on {', '.join(args.platforms)})", file=out)
+        due_epochs, inserted = {}, 0
+        started = time.monotonic()
+        next_progress = DRIVE_PROGRESS_SECONDS
+        while (elapsed := time.monotonic() - started) < args.duration:
+            owed = int(args.rate * elapsed) - inserted
+            if owed > 0:
+                now_epoch = time.time()
+                _insert_due_posts(conn, accounts, inserted, owed, media, now_epoch)
+                due_epochs.update((seq, now_epoch) for seq in range(inserted, inserted + owed))
+                inserted += owed
+                loop.wake()
+            if elapsed >= next_progress:
+                totals = stats.get_stats(conn)
+                print(f"[Emulator] {elapsed:.0f}s: {inserted} inserted, {totals['totals'].get('posted', 0)} posted, "
+                      f"{totals['queue_depth']} queued", file=out)
+                next_progress += DRIVE_PROGRESS_SECONDS
+            time.sleep(DRIVE_TICK_SECONDS)
+
+        # Let the scheduler finish what is due; retries wait for their backoff and are reported as queued
+        drain_deadline = time.monotonic() + args.drain_timeout
+        while time.monotonic() < drain_deadline:
+            counts = stats.get_stats(conn)['totals']
+            if not counts.get('pending', 0) and not counts.get('processing', 0):
+                break
+            time.sleep(DRIVE_TICK_SECONDS)
+        elapsed = time.monotonic() - started
+        totals = stats.get_stats(conn)
+    finally:
+        if loop is not None:
+            loop.stop()
+        conn.close()
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"[Emulator] Kept database in {work_dir}", file=out)
+
+    delays = []
+    for _, text, published_epoch in emulator.published:
+        match = _TITLE_RE.search(text)
+        if match and int(match.group(1)) in due_epochs:
+            delays.append((published_epoch - due_epochs[int(match.group(1))]) * 1000)
+    counts = totals['totals']
+    report = {
+        'inserted': inserted,
+        'elapsed_seconds': round(elapsed, 1),
+        'posted': counts.get('posted', 0),
+        'posted_per_second': round(counts.get('posted', 0) / elapsed, 1) if elapsed else None,
+        'statuses': {status: posts for status, posts in counts.items() if status != 'total'},
+        'publish_delay_ms': {f'p{pct}': None if not delays else round(percentile(delays, pct), 1) for pct in (50, 90, 99)},
+        'emulator_requests': [{'platform': platform, 'endpoint': endpoint, 'status': status, 'count': count}
+                              for (platform, endpoint, status), count in sorted(emulator.request_counts().items())],
+    }
+    return report
+
+def print_report(report, out):
+    print(f"[Emulator] Inserted {report['inserted']} posts; {report['posted']} posted in {report['elapsed_seconds']}s "
+          f"({report['posted_per_second']}/s)", file=out)
+    print(f"[Emulator] Statuses: {json.dumps(report['statuses'], sort_keys=True)}", file=out)
+    delay = report['publish_delay_ms']
+    print(f"[Emulator] Due to accepted: p50 {delay['p50']} ms, p90 {delay['p90']} ms, p99 {delay['p99']} ms", file=out)
+    for row in report['emulator_requests']:
+        print(f"  {row['platform']:<10} {row['endpoint']:<14} {row['status']:>4} {row['count']:>8}", file=out)
+
+def main():
+    parser = argparse.ArgumentParser(description="Local platform API emulator and load driver")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subcommands.add_parser('serve', help="Run the emulator until interrupted")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    drive_parser = subcommands.add_parser('drive', help="Push posts through the real scheduler against the emulator")
+    drive_parser.add_argument('--rate', type=float, default=20, help="Posts falling due per second (default 20)")
+    drive_parser.add_argument('--duration', type=float, default=30, help="Seconds to insert posts for (default 30)")
+    drive_parser.add_argument('--platforms', default='instagram,pinterest,linkedin',
+                              help=f"Comma separated platforms out of {','.join(DRIVE_PLATFORMS)}")
+    drive_parser.add_argument('--accounts', type=int, default=5, help="Accounts per platform (default 5)")
+    drive_parser.add_argument('--drain-timeout', type=float, default=30,
+                              help="Seconds to wait for due posts to finish after the last insert (default 30)")
+    drive_parser.add_argument('--client-limits', action='store_true',
+                              help="Keep the app's own rate limits (by default only the emulator's quotas apply)")
+    drive_parser.add_argument('--json', metavar='FILE', help="Also write the report to FILE")
+    drive_parser.add_argument('--keep', action='store_true', help="Keep the temporary database")
+    for sub in (serve_parser, drive_parser):
+        sub.add_argument('--latency', action='append', metavar='[PLATFORM=]DIST',
+                         help=f"Response latency in ms, e.g. lognormal:80:0.5 or linkedin=uniform:200:600; "
+                              f"repeatable (default {DEFAULT_LATENCY})")
+        sub.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 5xx")
+        sub.add_argument('--throttle-rate', type=float, default=0.0, help="Share of requests throttled")
+        sub.add_argument('--quota', action='append', metavar='[PLATFORM=]COUNT/SECONDS',
+                         help="Request budget per window, sent as rate-limit headers; repeatable")
+        sub.add_argument('--seed', type=int, help="Random seed")
+        sub.add_argument('--verbose', action='store_true', help="Show request, scheduler and adapter output")
+    args = parser.parse_args()
+
+    try:
+        emulator = Emulator(parse_per_platform(args.latency, parse_latency, DEFAULT_LATENCY),
+                            parse_per_platform(args.quota, parse_quota), args.error_rate, args.throttle_rate)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.seed is not None:
+        random.seed(args.seed)
+    if not args.verbose:
+        import logging
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    if args.command == 'serve':
+        server = start_server(emulator, args.host, args.port)
+        server_url = f'http://{args.host}:{server.port}'
+        print(f"[Emulator] Serving on {server_url}. Point the adapters at it with:")
+        for name, url in base_urls(server_url).items():
+            print(f"  {name}={url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    args.platforms = [name.strip() for name in args.platforms.split(',') if name.strip()]
+    unknown = set(args.platforms) - set(DRIVE_PLATFORMS)
+    if unknown:
+        parser.error(f"unknown platforms: {', '.join(sorted(unknown))}")
+    out = sys.stdout
+    # Adapters and the scheduler log every post; keep them quiet unless asked
+    with open(os.devnull, 'w') as devnull:
+        quiet = devnull if not args.verbose else None
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext(), \
+                contextlib.redirect_stderr(quiet) if quiet else contextlib.nullcontext():
+            report = drive(args, emulator, out)
+    print_report(report, out)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Classification of publishing errors as retryable or fatal.
+
+Platform adapters register a classifier for their own exception types with
+register_classifier(); anything they do not recognise falls back to
+classify_generic(), which looks at HTTP status codes and network errors anywhere
+in the exception chain. Unknown errors are fatal, so a post that may already
+have been published is never sent twice.
+
+Timeouts, dropped connections, 5xx responses and rate limits are retried, as long
+as the post cannot have been published yet. The final publishing request is not
+idempotent: adapters wrap it in publish_call(), and a failure inside it is only
+retried if the request never reached the platform or was rate limited. Anything
+else there may come after the platform accepted the post, so it goes to 'error'
+for a manual retry. Failures in earlier steps (media uploads, containers) are
+retried as usual.
+"""
+import contextlib
+import socket
+
+import requests
+import urllib3
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Error classes stored in content.error_class. CONNECT: no connection could be
+# opened, so nothing was sent; TIMEOUT and CONNECTION: the request may have been sent.
+CONNECT = 'connect'
+TIMEOUT = 'timeout'
+CONNECTION = 'connection'
+SERVER_ERROR = 'server_error'
+RATE_LIMITED = 'rate_limited'
+AUTH = 'auth'
+INVALID_REQUEST = 'invalid_request'
+MEDIA = 'media'
+CONFIG = 'config'
+UNKNOWN = 'unknown'
+
+RETRYABLE_CLASSES = {CONNECT, TIMEOUT, CONNECTION, SERVER_ERROR, RATE_LIMITED}
+
+# Retryable even when the final publishing request failed: the platform did not take the post
+NOT_SENT_CLASSES = {CONNECT, RATE_LIMITED}
+
+# Errors raised before a connection was established (refused, DNS, connect or pool timeout)
+_NOT_SENT_ERRORS = (requests.exceptions.ConnectTimeout, urllib3.exceptions.NewConnectionError,
+                    urllib3.exceptions.ConnectTimeoutError, ConnectionRefusedError, socket.gaierror) + (
+                    (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) if httpx else ())
+
+_classifiers = {}  # platform name -> function(exc) -> error class or None
+
+def register_classifier(platform_name, classifier):
+    """Registers a platform adapter's classifier, called with each exception in the chain."""
+    _classifiers[platform_name] = classifier
+
+@contextlib.contextmanager
+def publish_call():
+    """Marks exceptions raised by an adapter's final publishing request (see the module docstring)."""
+    try:
+        yield
+    except Exception as exc:
+        exc.during_publish = True
+        raise
+
+def exception_chain(exc):
+    """Yields an exception and the exceptions it was raised from or while handling."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+def classify_status(status_code):
+    """Maps an HTTP status code to an error class."""
+    if status_code == 429:
+        return RATE_LIMITED
+    if status_code >= 500:
+        return SERVER_ERROR
+    if status_code in (401, 403):
+        return AUTH
+    if status_code == 408:
+        return TIMEOUT
+    return INVALID_REQUEST
+
+def classify_generic(exc):
+    """Classifies network errors and HTTP responses from requests, httpx and friends."""
+    if any(isinstance(link, _NOT_SENT_ERRORS) for link in exception_chain(exc)):
+        return CONNECT
+    timeouts = (requests.Timeout, socket.timeout, TimeoutError) + ((httpx.TimeoutException,) if httpx else ())
+    if isinstance(exc, timeouts):
+        return TIMEOUT
+    connection_errors = (requests.ConnectionError, ConnectionError) + ((httpx.TransportError,) if httpx else ())
+    if isinstance(exc, connection_errors):
+        return CONNECTION
+    response = getattr(exc, 'response', None)
+    status_code = getattr(response, 'status_code', None)
+    if isinstance(status_code, int):
+        return classify_status(status_code)
+    if isinstance(exc, FileNotFoundError):
+        return MEDIA
+    return None
+
+def classify(platform_name, exc):
+    """
+    Returns (retryable, error_class) for an exception raised by a platform adapter.
+    The first exception in the chain that the adapter's classifier or the generic
+    rules recognise decides.
+    """
+    classifier = _classifiers.get(platform_name)
+    during_publish = any(getattr(link, 'during_publish', False) for link in exception_chain(exc))
+    retryable_classes = NOT_SENT_CLASSES if during_publish else RETRYABLE_CLASSES
+    for link in exception_chain(exc):
+        error_class = (classifier(link) if classifier else None) or classify_generic(link)
+        if error_class:
+            return error_class in retryable_classes, error_class
+    # Validation errors raised by the adapters themselves (missing keys, bad config)
+    if any(isinstance(link, ValueError) for link in exception_chain(exc)):
+        return False, INVALID_REQUEST
+    return False, UNKNOWN
@@ -0,0 +1,241 @@
+"""
+Shared HTTP layer for the requests-based platform APIs (Instagram, Pinterest,
+Medium, LinkedIn).
+
+One requests.Session per process keeps connections alive in per-host pools, so a
+burst of posts to the same API reuses TCP+TLS connections instead of handshaking
+for every call. Every request gets a default timeout, and 429/5xx responses are
+retried with exponential backoff and jitter.
+
+request_async() is the asyncio counterpart used by the async adapters (see
+async_engine.py). It runs on one httpx.AsyncClient per event loop with the same
+timeouts and retry policy.
+"""
+import asyncio
+import http.cookiejar
+import os
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# (connect, read) timeout applied when a call does not pass its own
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '60'))
+
+# Number of hosts to keep pools for, and connections kept alive per host
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '16'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+
+# Retries for 429/5xx responses and connection failures
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+HTTP_BACKOFF_SECONDS = float(os.getenv('HTTP_BACKOFF_SECONDS', '0.5'))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv('HTTP_BACKOFF_MAX_SECONDS', '30'))
+
+# Connections the async client may hold open across all hosts, and how many idle
+# ones it keeps alive. httpcore slows down sharply when it reuses a large idle pool,
+# so keep-alive stays small even when hundreds of requests are in flight.
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', '200'))
+HTTP_ASYNC_KEEPALIVE_CONNECTIONS = int(os.getenv('HTTP_ASYNC_KEEPALIVE_CONNECTIONS', '20'))
+
+# Size of the reads when request_async() streams a file body
+HTTP_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+# Called with every response (requests or httpx), e.g. by rate_limit.py to read
+# rate-limit headers. Hooks must not raise.
+response_hooks = []
+
+def run_response_hooks(response, *args, **kwargs):
+    """Runs response_hooks; also usable as a requests session hook (see add_session_hooks)."""
+    for hook in response_hooks:
+        hook(response)
+
+def add_session_hooks(session):
+    """Makes a third-party requests.Session (e.g. tweepy's) report its responses to response_hooks."""
+    if run_response_hooks not in session.hooks['response']:
+        session.hooks['response'].append(run_response_hooks)
+
+def _no_cookies_policy():
+    # Sessions are shared by every account, so never carry cookies between requests
+    return http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.cookies.set_policy(_no_cookies_policy())
+    return session
+
+def get_session():
+    """Returns this process's shared session, creating it on first use (and after fork)."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session()
+            _session_pid = os.getpid()
+        return _session
+
+def _retry_delay(attempt, response=None):
+    """Backoff for the given attempt, honouring a Retry-After header if the server sent one."""
+    delay = min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_SECONDS * (2 ** attempt))
+    delay = random.uniform(delay / 2, delay)
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            try:
+                delay = max(delay, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return delay
+
+def get_async_client():
+    """Returns the httpx.AsyncClient of the running event loop, creating it on first use."""
+    if httpx is None:
+        raise RuntimeError("Async publishing requires httpx (pip install httpx).")
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_ASYNC_KEEPALIVE_CONNECTIONS),
+            follow_redirects=True
+        )
+        client.cookies.jar.set_policy(_no_cookies_policy())
+        _async_clients[loop] = client
+    return client
+
+def _next_retry_delay(method, url, response, attempt, can_retry):
+    """
+    Returns how long to wait before retrying a response, or None to return it to
+    the caller as is.
+    """
+    if attempt == HTTP_MAX_RETRIES or response.status_code not in RETRY_STATUSES:
+        return None
+    if response.status_code != 429 and not can_retry:
+        return None
+    delay = _retry_delay(attempt, response)
+    if delay > HTTP_BACKOFF_MAX_SECONDS:
+        return None
+    print(f"[HTTP] {method} {url.split('?')[0]} returned {response.status_code}, retrying in {delay:.1f}s")
+    return delay
+
+def request(method, url, retry_unsafe=False, **kwargs):
+    """
+    Sends a request through the shared session and returns the final response.
+
+    429 responses are always retried since the server did not act on them. 5xx
+    responses and dropped connections are only retried for idempotent methods,
+    or when the caller passes retry_unsafe=True for a POST that is safe to repeat
+    (e.g. registering an upload); otherwise a retried POST could publish twice.
+    A Retry-After longer than HTTP_BACKOFF_MAX_SECONDS is not waited out; the
+    429 is returned to the caller instead.
+    """
+    method = method.upper()
+    kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    can_retry = retry_unsafe or method in IDEMPOTENT_METHODS
+    body = kwargs.get('data')
+    body_start = body.tell() if hasattr(body, 'seek') else None
+
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        if attempt and body_start is not None:
+            body.seek(body_start)  # Re-send file uploads from the start
+        last_attempt = attempt == HTTP_MAX_RETRIES
+        try:
+            response = get_session().request(method, url, **kwargs)
+            run_response_hooks(response)
+        except requests.exceptions.ConnectTimeout:
+            # Nothing reached the server, so this is safe to retry for any method
+            if last_attempt:
+                raise
+            time.sleep(_retry_delay(attempt))
+            continue
+        except requests.exceptions.ConnectionError:
+            if last_attempt or not can_retry:
+                raise
+            time.sleep(_retry_delay(attempt))
+            continue
+
+        delay = _next_retry_delay(method, url, response, attempt, can_retry)
+        if delay is None:
+            return response
+        response.close()
+        time.sleep(delay)
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+async def _stream_file(f, start):
+    await asyncio.to_thread(f.seek, start)
+    while chunk := await asyncio.to_thread(f.read, HTTP_UPLOAD_CHUNK_BYTES):
+        yield chunk
+
+async def request_async(method, url, retry_unsafe=False, **kwargs):
+    """
+    Async version of request() on the event loop's httpx client, with the same
+    retry rules. Takes httpx arguments (content= for raw bodies, data= for forms).
+    A file opened in binary mode can be passed as content=; it is streamed from
+    its current position, read off the event loop, and re-sent from there on retries.
+    """
+    method = method.upper()
+    can_retry = retry_unsafe or method in IDEMPOTENT_METHODS
+    client = get_async_client()
+    body = kwargs.get('content')
+    body_start = body.tell() if hasattr(body, 'seek') else None
+    if body_start is not None:
+        # A known length, so the upload is not sent chunked (presigned upload URLs refuse that)
+        headers = dict(kwargs.get('headers') or {})
+        headers.setdefault('Content-Length', str(os.fstat(body.fileno()).st_size - body_start))
+        kwargs['headers'] = headers
+
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        last_attempt = attempt == HTTP_MAX_RETRIES
+        if body_start is not None:
+            kwargs['content'] = _stream_file(body, body_start)
+        try:
+            response = await client.request(method, url, **kwargs)
+            run_response_hooks(response)
+        except (httpx.ConnectTimeout, httpx.ConnectError):
+            # The connection was never established, so nothing reached the server
+            if last_attempt:
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+        except (httpx.RemoteProtocolError, httpx.ReadError):
+            if last_attempt or not can_retry:
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+
+        delay = _next_retry_delay(method, url, response, attempt, can_retry)
+        if delay is None:
+            return response
+        await response.aclose()
+        await asyncio.sleep(delay)
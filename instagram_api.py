@@ -1,22 +1,20 @@
 import os
-import requests
+import http_client
 import json
-from security import decrypt_data
+import requests
+from security import load_credentials
+import errors
 
-def post_to_instagram(account, content, base_dir):
-    """
-    Posts content to Instagram using the Instagram Graph API with an access token.
-    Requires:
-      - access_token: Instagram Graph API token (from Meta Developers)
-      - ig_user_id: Instagram Business Account ID
-    """
+# Graph API root; point it elsewhere (e.g. at the local emulator, see emulator.py) for load tests
+INSTAGRAM_API_BASE_URL = os.getenv('INSTAGRAM_API_BASE_URL', 'https://graph.facebook.com/v19.0').rstrip('/')
+
+def _prepare_instagram_post(account, content, base_dir):
+    """Validates credentials and media and returns (access_token, ig_user_id, caption, image_url)."""
     # Convert sqlite3.Row to dict if needed
     if not isinstance(content, dict):
         content = dict(content)
     try:
-        creds_encrypted = account['credentials']
-        creds_json = decrypt_data(creds_encrypted)
-        credentials = json.loads(creds_json)
+        credentials = load_credentials(account)
     except (json.JSONDecodeError, TypeError, KeyError):
         raise ValueError("Invalid credentials format for Instagram account.")
 
@@ -30,42 +28,108 @@ def post_to_instagram(account, content, base_dir):
     media_path_relative = content.get('media_path')
     if not media_path_relative:
         raise Exception("No media path provided for Instagram post.")
-    media_path_absolute = os.path.join(base_dir, media_path_relative)
-    if not os.path.exists(media_path_absolute):
-        raise Exception(f"Media file not found at: {media_path_absolute}")
 
     # Step 1: Upload the image to a publicly accessible location (Instagram Graph API requires a public URL)
     # For demo purposes, this script assumes you already have a public URL for the image.
     # In production, you should upload the image to a service like AWS S3, Imgur, or your own server.
     # Here, we'll raise an error if the image is not a URL.
-    if media_path_absolute.startswith('http://') or media_path_absolute.startswith('https://'):
-        image_url = media_path_absolute
+    if media_path_relative.startswith('http://') or media_path_relative.startswith('https://'):
+        image_url = media_path_relative
     else:
+        media_path_absolute = os.path.join(base_dir, media_path_relative)
+        if not os.path.exists(media_path_absolute):
+            raise Exception(f"Media file not found at: {media_path_absolute}")
         raise Exception("Instagram Graph API requires a public image URL. Please upload your image to a public location and provide the URL as media_path.")
+    return access_token, ig_user_id, caption, image_url
+
+def post_to_instagram(account, content, base_dir):
+    """
+    Posts content to Instagram using the Instagram Graph API with an access token.
+    Requires:
+      - access_token: Instagram Graph API token (from Meta Developers)
+      - ig_user_id: Instagram Business Account ID
+    """
+    access_token, ig_user_id, caption, image_url = _prepare_instagram_post(account, content, base_dir)
 
     # Step 2: Create a media object (container)
-    create_media_url = f"https://graph.facebook.com/v19.0/{ig_user_id}/media"
+    create_media_url = f"{INSTAGRAM_API_BASE_URL}/{ig_user_id}/media"
     payload = {
         'image_url': image_url,
         'caption': caption,
         'access_token': access_token
     }
-    resp = requests.post(create_media_url, data=payload)
+    # An unpublished container is harmless, so creating one is safe to retry
+    resp = http_client.post(create_media_url, data=payload, retry_unsafe=True)
     if resp.status_code != 200:
-        raise Exception(f"Failed to create Instagram media container: {resp.text}")
+        raise requests.HTTPError(f"Failed to create Instagram media container: {resp.text}", response=resp)
     media_id = resp.json().get('id')
     if not media_id:
         raise Exception(f"No media ID returned from Instagram: {resp.text}")
 
     # Step 3: Publish the media object
-    publish_url = f"https://graph.facebook.com/v19.0/{ig_user_id}/media_publish"
+    publish_url = f"{INSTAGRAM_API_BASE_URL}/{ig_user_id}/media_publish"
     publish_payload = {
         'creation_id': media_id,
         'access_token': access_token
     }
-    publish_resp = requests.post(publish_url, data=publish_payload)
-    if publish_resp.status_code != 200:
-        raise Exception(f"Failed to publish Instagram media: {publish_resp.text}")
+    with errors.publish_call():
+        publish_resp = http_client.post(publish_url, data=publish_payload)
+        if publish_resp.status_code != 200:
+            raise requests.HTTPError(f"Failed to publish Instagram media: {publish_resp.text}", response=publish_resp)
     result = publish_resp.json()
     print(f"[Instagram Graph API] Post successful: {result}")
-    return result 
\ No newline at end of file
+    return result 
+
+async def post_to_instagram_async(account, content, base_dir):
+    """
+    Async version of post_to_instagram for the asyncio publishing engine: the
+    container create and publish calls await on the shared httpx client.
+    """
+    access_token, ig_user_id, caption, image_url = _prepare_instagram_post(account, content, base_dir)
+
+    # Step 2: Create a media object (container)
+    resp = await http_client.request_async(
+        'POST', f"{INSTAGRAM_API_BASE_URL}/{ig_user_id}/media",
+        data={'image_url': image_url, 'caption': caption, 'access_token': access_token},
+        retry_unsafe=True
+    )
+    if resp.status_code != 200:
+        raise requests.HTTPError(f"Failed to create Instagram media container: {resp.text}", response=resp)
+    media_id = resp.json().get('id')
+    if not media_id:
+        raise Exception(f"No media ID returned from Instagram: {resp.text}")
+
+    # Step 3: Publish the media object
+    with errors.publish_call():
+        publish_resp = await http_client.request_async(
+            'POST', f"{INSTAGRAM_API_BASE_URL}/{ig_user_id}/media_publish",
+            data={'creation_id': media_id, 'access_token': access_token}
+        )
+        if publish_resp.status_code != 200:
+            raise requests.HTTPError(f"Failed to publish Instagram media: {publish_resp.text}", response=publish_resp)
+    result = publish_resp.json()
+    print(f"[Instagram Graph API] Post successful: {result}")
+    return result
+
+# Graph API error codes worth retrying: 1/2 temporary service errors, 4/17/32/613 rate
+# limits. They come back as HTTP 400s, so the status code alone would call them fatal.
+# A temporary error from media_publish is not retried (see errors.publish_call).
+GRAPH_TRANSIENT_ERROR_CODES = {1, 2}
+GRAPH_RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613}
+
+def classify_error(exc):
+    """Classifies Graph API errors for the scheduler's retry queue (see errors.py)."""
+    response = getattr(exc, 'response', None)
+    if not isinstance(exc, requests.HTTPError) or response is None:
+        return None
+    try:
+        error = response.json().get('error', {})
+    except ValueError:
+        return None
+    if error.get('code') in GRAPH_RATE_LIMIT_ERROR_CODES:
+        return errors.RATE_LIMITED
+    if error.get('is_transient') or error.get('code') in GRAPH_TRANSIENT_ERROR_CODES:
+        return errors.SERVER_ERROR
+    return None
+
+errors.register_classifier('instagram', classify_error)
@@ -1,17 +1,23 @@
 import os
+import asyncio
 from datetime import datetime
 import requests
+import http_client
 from dotenv import load_dotenv
 import json
-from security import decrypt_data
+from security import load_credentials
+import errors
 
 load_dotenv()
 
+# API root; point it elsewhere (e.g. at the local emulator, see emulator.py) for load tests
+LINKEDIN_API_BASE_URL = os.getenv('LINKEDIN_API_BASE_URL', 'https://api.linkedin.com/v2').rstrip('/')
+
 class LinkedInAPI:
     def __init__(self, access_token, user_id):
         self.access_token = access_token
         self.user_id = user_id
-        self.base_url = "https://api.linkedin.com/v2"
+        self.base_url = LINKEDIN_API_BASE_URL
         self.headers = {
             'Authorization': f'Bearer {self.access_token}',
             'X-Restli-Protocol-Version': '2.0.0',
@@ -40,7 +46,8 @@ class LinkedInAPI:
             
         return logger
         
-    def _make_request(self, method, endpoint, json_data=None, params=None, headers=None, is_upload=False):
+    def _make_request(self, method, endpoint, json_data=None, params=None, headers=None, is_upload=False,
+                      retry_unsafe=False):
         """Helper method to make HTTP requests with proper error handling and logging."""
         url = f"{self.base_url}{endpoint}"
         request_headers = self.headers.copy()
@@ -57,49 +64,67 @@ class LinkedInAPI:
         self.logger.debug(f"Making request: {log_data}")
         
         try:
-            response = requests.request(
-                method=method,
-                url=url,
+            response = http_client.request(
+                method,
+                url,
                 json=json_data,
                 params=params,
                 headers=request_headers,
-                timeout=30
+                timeout=30,
+                retry_unsafe=retry_unsafe
             )
-            
-            # Log the response status and headers
-            self.logger.debug(f"Response status: {response.status_code}")
-            
-            # Try to parse JSON if possible
-            response_data = None
-            try:
-                if response.text:
-                    response_data = response.json()
-            except json.JSONDecodeError:
-                response_data = response.text
-                
-            # Log error responses
-            if response.status_code >= 400:
-                error_msg = f"LinkedIn API error ({response.status_code}): {response.text}"
-                self.logger.error(error_msg)
-                
-                # Handle specific error cases
-                if response.status_code == 401:
-                    raise ValueError("Invalid or expired access token. Please re-authenticate your LinkedIn account.")
-                elif response.status_code == 403:
-                    # Check if it's a permission issue
-                    if "Not enough permissions" in response.text:
-                        raise ValueError("Insufficient permissions. Please ensure your LinkedIn app has the 'w_member_social' permission.")
-                
-                # Raise a general error for other cases
-                response.raise_for_status()
-                
-            return response_data or response.text
+            return self._handle_response(response)
             
         except requests.exceptions.RequestException as e:
             error_msg = f"Request to LinkedIn API failed: {str(e)}"
             self.logger.error(error_msg, exc_info=True)
             raise Exception(error_msg) from e
 
+    async def _make_request_async(self, method, endpoint, json_data=None, params=None):
+        """Async version of _make_request on the shared httpx client."""
+        url = f"{self.base_url}{endpoint}"
+        self.logger.debug(f"Making async request: {{'method': '{method}', 'url': '{url}'}}")
+        try:
+            response = await http_client.request_async(
+                method, url, json=json_data, params=params, headers=self.headers, timeout=30
+            )
+        except http_client.httpx.HTTPError as e:
+            error_msg = f"Request to LinkedIn API failed: {str(e)}"
+            self.logger.error(error_msg, exc_info=True)
+            raise Exception(error_msg) from e
+        return self._handle_response(response)
+
+    def _handle_response(self, response):
+        """Parses a requests or httpx response, raising on LinkedIn errors."""
+        # Log the response status and headers
+        self.logger.debug(f"Response status: {response.status_code}")
+        
+        # Try to parse JSON if possible
+        response_data = None
+        try:
+            if response.text:
+                response_data = response.json()
+        except json.JSONDecodeError:
+            response_data = response.text
+            
+        # Log error responses
+        if response.status_code >= 400:
+            error_msg = f"LinkedIn API error ({response.status_code}): {response.text}"
+            self.logger.error(error_msg)
+            
+            # Handle specific error cases
+            if response.status_code == 401:
+                raise ValueError("Invalid or expired access token. Please re-authenticate your LinkedIn account.")
+            elif response.status_code == 403:
+                # Check if it's a permission issue
+                if "Not enough permissions" in response.text:
+                    raise ValueError("Insufficient permissions. Please ensure your LinkedIn app has the 'w_member_social' permission.")
+            
+            # Raise a general error for other cases (requests.HTTPError for both clients)
+            raise requests.HTTPError(f"{response.status_code} Error for url: {response.url}", response=response)
+            
+        return response_data or response.text
+
     def post_text(self, text, visibility='PUBLIC'):
         """Post a text-only update to LinkedIn."""
         return self._post_ugc(text, visibility)
@@ -108,9 +133,45 @@ class LinkedInAPI:
         """Post an update with media (image or video) to LinkedIn."""
         return self._post_ugc(text, visibility, media_urn, media_category)
 
+    def upload_media(self, file_path, media_type='IMAGE'):
+        """
+        Uploads an image or video with the Assets API and returns its asset URN,
+        for post_with_media.
+        """
+        recipe = 'feedshare-video' if media_type == 'VIDEO' else 'feedshare-image'
+        # Registering an upload publishes nothing, so it is safe to retry
+        registration = self._make_request('POST', '/assets', params={'action': 'registerUpload'}, json_data={
+            'registerUploadRequest': {
+                'recipes': [f'urn:li:digitalmediaRecipe:{recipe}'],
+                'owner': f'urn:li:person:{self.user_id}',
+                'serviceRelationships': [
+                    {'relationshipType': 'OWNER', 'identifier': 'urn:li:userGeneratedContent'}
+                ],
+            }
+        }, retry_unsafe=True)
+        value = registration['value']
+        upload_url = value['uploadMechanism']['com.linkedin.digitalmedia.uploadmechanism.MediaUploadHttpRequest']['uploadUrl']
+
+        with open(file_path, 'rb') as media_file:
+            response = http_client.put(upload_url, headers={'Authorization': f'Bearer {self.access_token}'},
+                                       data=media_file, timeout=(http_client.HTTP_CONNECT_TIMEOUT, 300))
+        self._handle_response(response)
+        print(f"[LinkedIn API] Uploaded {media_type.lower()} as {value['asset']}")
+        return value['asset']
+
+    async def post_text_async(self, text, visibility='PUBLIC'):
+        """Async version of post_text."""
+        with errors.publish_call():
+            return await self._make_request_async('POST', "/ugcPosts", json_data=self._ugc_payload(text, visibility))
+
     def _post_ugc(self, text, visibility, media_urn=None, media_category=None):
         """Helper method to make UGC (User Generated Content) posts."""
         endpoint = "/ugcPosts"  # Just the endpoint path, base_url is already set
+        with errors.publish_call():
+            return self._make_request('POST', endpoint, json_data=self._ugc_payload(text, visibility, media_urn, media_category))
+
+    def _ugc_payload(self, text, visibility, media_urn=None, media_category=None):
+        """Builds the body of a UGC post."""
         share_content = {'shareCommentary': {'text': text}}
 
         if media_urn and media_category:
@@ -129,8 +190,49 @@ class LinkedInAPI:
         }
         
         print(f"[LinkedIn API] Final payload: {json.dumps(payload, indent=2)}")
-        return self._make_request('POST', endpoint, json_data=payload)
+        return payload
+
+
+def _check_linkedin_token(account, credentials):
+    """Checks the access token's expiry and that it was granted the posting scope."""
+    # Check if token is expired
+    expires_at = credentials.get('expires_at')
+    if expires_at:
+        from datetime import datetime, timezone
+        try:
+            # Ensure both datetimes are timezone-aware
+            expires_dt = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
+            current_dt = datetime.now(timezone.utc)
+
+            # If expires_dt is naive, make it timezone-aware
+            if expires_dt.tzinfo is None:
+                expires_dt = expires_dt.replace(tzinfo=timezone.utc)
 
+            if current_dt > expires_dt:
+                error_msg = "LinkedIn access token has expired. Please re-authenticate your account."
+                print(f"[LinkedIn] {error_msg}")
+                raise ValueError(error_msg)
+        except (ValueError, AttributeError) as e:
+            print(f"[LinkedIn] Error checking token expiration: {str(e)}")
+    else:
+        print("[LinkedIn] No expiration time found for access token")
+
+    # Check if we have the required scopes
+    required_scopes = {'w_member_social'}
+    # Robust: handle both list and string
+    raw_scopes = credentials.get('scopes', [])
+    if isinstance(raw_scopes, str):
+        token_scopes = set(raw_scopes.split())
+    elif isinstance(raw_scopes, list):
+        token_scopes = set(raw_scopes)
+    else:
+        token_scopes = set()
+    print(f"[LinkedIn] Token scopes for account {account.get('name')}: {token_scopes}")
+    missing_scopes = required_scopes - token_scopes
+    if missing_scopes:
+        error_msg = f"Missing required LinkedIn OAuth scopes: {', '.join(missing_scopes)}. Please re-authenticate with the correct permissions."
+        print(f"[LinkedIn] {error_msg}")
+        raise ValueError(error_msg)
 
 def post_to_linkedin(account, content, base_dir):
     """
@@ -146,7 +248,7 @@ def post_to_linkedin(account, content, base_dir):
         print(f"[LinkedIn] Starting post process for content ID: {content.get('id')}")
         
         # Decrypt and parse credentials
-        credentials = json.loads(decrypt_data(account.get('credentials', '{}')))
+        credentials = load_credentials(account)
         if not credentials or 'access_token' not in credentials:
             raise ValueError("Invalid or missing LinkedIn credentials")
                 
@@ -170,8 +272,8 @@ def post_to_linkedin(account, content, base_dir):
                     'Authorization': f'Bearer {access_token}',
                     'X-Restli-Protocol-Version': '2.0.0'
                 }
-                response = requests.get(
-                    'https://api.linkedin.com/v2/me',
+                response = http_client.get(
+                    f'{LINKEDIN_API_BASE_URL}/me',
                     headers=headers,
                     timeout=30
                 )
@@ -185,44 +287,7 @@ def post_to_linkedin(account, content, base_dir):
         if not user_id:
             raise ValueError("Could not determine LinkedIn user ID. Please re-authenticate your account.")
         
-        # Check if token is expired
-        expires_at = credentials.get('expires_at')
-        if expires_at:
-            from datetime import datetime, timezone
-            try:
-                # Ensure both datetimes are timezone-aware
-                expires_dt = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-                current_dt = datetime.now(timezone.utc)
-                
-                # If expires_dt is naive, make it timezone-aware
-                if expires_dt.tzinfo is None:
-                    expires_dt = expires_dt.replace(tzinfo=timezone.utc)
-                
-                if current_dt > expires_dt:
-                    error_msg = "LinkedIn access token has expired. Please re-authenticate your account."
-                    print(f"[LinkedIn] {error_msg}")
-                    raise ValueError(error_msg)
-            except (ValueError, AttributeError) as e:
-                print(f"[LinkedIn] Error checking token expiration: {str(e)}")
-        else:
-            print("[LinkedIn] No expiration time found for access token")
-            
-        # Check if we have the required scopes
-        required_scopes = {'w_member_social'}
-        # Robust: handle both list and string
-        raw_scopes = credentials.get('scopes', [])
-        if isinstance(raw_scopes, str):
-            token_scopes = set(raw_scopes.split())
-        elif isinstance(raw_scopes, list):
-            token_scopes = set(raw_scopes)
-        else:
-            token_scopes = set()
-        print(f"[LinkedIn] Token scopes for account {account.get('name')}: {token_scopes}")
-        missing_scopes = required_scopes - token_scopes
-        if missing_scopes:
-            error_msg = f"Missing required LinkedIn OAuth scopes: {', '.join(missing_scopes)}. Please re-authenticate with the correct permissions."
-            print(f"[LinkedIn] {error_msg}")
-            raise ValueError(error_msg)
+        _check_linkedin_token(account, credentials)
             
     except requests.exceptions.RequestException as e:
         error_msg = f"[LinkedIn] Network error while connecting to LinkedIn API: {str(e)}"
@@ -301,7 +366,7 @@ def post_to_linkedin(account, content, base_dir):
                 'scheduledTime': int(scheduled_time.timestamp() * 1000)
             }
             
-            response = requests.post(endpoint, headers=self.headers, json=payload)
+            response = http_client.post(endpoint, headers=self.headers, json=payload)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -318,9 +383,73 @@ def post_to_linkedin(account, content, base_dir):
                 'q': 'author',
                 'author': f"urn:li:person:{os.getenv('LINKEDIN_USER_ID')}"
             }
-            response = requests.get(endpoint, headers=self.headers, params=params)
+            response = http_client.get(endpoint, headers=self.headers, params=params)
             response.raise_for_status()
             return response.json()
         except Exception as e:
             print(f"Error getting scheduled LinkedIn posts: {str(e)}")
-            return None 
\ No newline at end of file
+            return None 
+
+
+async def post_to_linkedin_async(account, content, base_dir):
+    """
+    Async version of post_to_linkedin for the asyncio publishing engine. Text
+    posts run on the event loop; posts with a media file still go through the
+    sync media path, on a worker thread.
+    """
+    if not isinstance(account, dict):
+        account = dict(account)
+    if not isinstance(content, dict):
+        content = dict(content)
+    media_path_relative = content.get('media_path')
+    if media_path_relative and os.path.exists(os.path.join(base_dir, media_path_relative)):
+        return await asyncio.to_thread(post_to_linkedin, account, content, base_dir)
+
+    try:
+        print(f"[LinkedIn] Starting post process for content ID: {content.get('id')}")
+        credentials = load_credentials(account)
+        if not credentials or 'access_token' not in credentials:
+            raise ValueError("Invalid or missing LinkedIn credentials")
+
+        access_token = credentials.get('access_token')
+        person_urn = credentials.get('person_urn')
+        user_id = None
+        if person_urn and person_urn.startswith('urn:li:person:'):
+            user_id = person_urn.split(':')[-1]
+
+        if not user_id:
+            try:
+                print("[LinkedIn] No user ID found in credentials, fetching from API...")
+                response = await http_client.request_async(
+                    'GET', f'{LINKEDIN_API_BASE_URL}/me',
+                    headers={'Authorization': f'Bearer {access_token}', 'X-Restli-Protocol-Version': '2.0.0'},
+                    timeout=30
+                )
+                if response.status_code == 200:
+                    user_id = response.json().get('id')
+                    print(f"[LinkedIn] Retrieved user ID from API: {user_id}")
+            except Exception as e:
+                print(f"[LinkedIn] Error fetching user ID: {str(e)}")
+
+        if not user_id:
+            raise ValueError("Could not determine LinkedIn user ID. Please re-authenticate your account.")
+
+        _check_linkedin_token(account, credentials)
+    except Exception as e:
+        error_msg = f"[LinkedIn] Error in post_to_linkedin: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg) from e
+
+    try:
+        api = LinkedInAPI(access_token, user_id)
+        text_content = f"{content.get('title', '')}\n\n{content.get('description', '')}\n\n{content.get('hashtags', '')}".strip()
+        print(f"[LinkedIn API] Posting text-only update.")
+        response = await api.post_text_async(text_content)
+        print(f"[LinkedIn API] Post successful: {response}")
+        return response
+    except requests.HTTPError as http_err:
+        print(f"[LinkedIn API] HTTPError: {http_err.response.status_code} {http_err.response.text}")
+        raise Exception(f"LinkedIn API Error: {http_err.response.status_code} {http_err.response.text}")
+    except Exception as e:
+        print(f"[LinkedIn API] Exception: {e}")
+        raise Exception(f"LinkedIn API Error: {e}")
@@ -0,0 +1,246 @@
+"""
+Per-platform media preparation.
+
+Platforms reject images and videos over their size, dimension or format limits.
+Before a post is published, prepare_media() checks its media against the
+platform's profile and, when it does not fit, produces a derived copy that does:
+images are resized and re-encoded with Pillow, videos are transcoded with a local
+ffmpeg. Media that already fits is used as is.
+
+Derived files are cached on disk by (source SHA-256, platform profile), so
+re-posting the same asset skips the work. The cache is bounded by
+MEDIA_DERIVED_CACHE_BYTES and evicts the least recently used files first, except
+files used within MEDIA_DERIVED_IN_USE_SECONDS, which may still be uploading.
+
+Pillow and ffmpeg are both optional. Without them media is published unchanged.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+import media_store
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# What each platform's upload API accepts. Platforms without a profile (YouTube takes
+# raw uploads, Instagram and Reddit posts do not upload files) get the original media.
+PLATFORM_PROFILES = {
+    'twitter': {
+        'image': {'max_bytes': 5 * 1024 * 1024, 'max_dimension': 4096, 'formats': ['JPEG', 'PNG', 'GIF', 'WEBP']},
+        'video': {'max_bytes': 512 * 1024 * 1024, 'max_width': 1920, 'max_height': 1200, 'extensions': ['.mp4', '.mov']},
+    },
+    'pinterest': {
+        'image': {'max_bytes': 20 * 1024 * 1024, 'max_dimension': 4000, 'formats': ['JPEG', 'PNG', 'WEBP']},
+    },
+    'linkedin': {
+        'image': {'max_bytes': 8 * 1024 * 1024, 'max_dimension': 6000, 'formats': ['JPEG', 'PNG', 'GIF']},
+        'video': {'max_bytes': 200 * 1024 * 1024, 'max_width': 1920, 'max_height': 1080, 'extensions': ['.mp4']},
+    },
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tiff', '.heic')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+
+# JPEG qualities tried in turn until a re-encoded image fits the size limit
+JPEG_QUALITIES = (90, 80, 70, 60, 50)
+
+# Total size of the derived-media cache before least recently used files are evicted
+MEDIA_DERIVED_CACHE_BYTES = int(os.getenv('MEDIA_DERIVED_CACHE_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+# Derived files returned this recently may still be uploading, so eviction leaves them.
+# A post holds its claim for up to SCHEDULER_LEASE_SECONDS, so that is the default.
+MEDIA_DERIVED_IN_USE_SECONDS = int(os.getenv('MEDIA_DERIVED_IN_USE_SECONDS',
+                                             os.getenv('SCHEDULER_LEASE_SECONDS', '1800')))
+
+# Longest a single video transcode may run
+FFMPEG_TIMEOUT_SECONDS = int(os.getenv('FFMPEG_TIMEOUT_SECONDS', '1800'))
+
+DERIVED_DIR = os.path.join('uploads', 'derived')
+
+# One preparation or eviction per derived file at a time in this process; other
+# processes racing for the same file each write a temp file and the last rename wins
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _lock_for(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+def ffmpeg_path():
+    """The ffmpeg binary to use (FFMPEG_PATH, or ffmpeg on PATH), or None."""
+    return os.getenv('FFMPEG_PATH') or shutil.which('ffmpeg')
+
+def _profile_key(profile):
+    """Short fingerprint of a profile, so changing a platform's limits invalidates its cache."""
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:10]
+
+def _source_hash(absolute_path):
+    """Media in the store is named by its SHA-256; anything else is hashed."""
+    name = os.path.splitext(os.path.basename(absolute_path))[0]
+    if len(name) == 64 and all(c in '0123456789abcdef' for c in name):
+        return name
+    return media_store.hash_file(absolute_path)
+
+def prepare_media(platform_name, base_dir, media_path):
+    """
+    Returns the media_path to publish for a platform: the original when it fits
+    the platform's profile (or cannot be converted here), else a cached derived file.
+    """
+    profiles = PLATFORM_PROFILES.get(platform_name)
+    if not profiles or not media_path:
+        return media_path
+    absolute_path = os.path.join(base_dir, media_path)
+    extension = os.path.splitext(media_path)[1].lower()
+    if extension in IMAGE_EXTENSIONS and 'image' in profiles:
+        kind, convert, output_extension = 'image', _convert_image, None
+    elif extension in VIDEO_EXTENSIONS and 'video' in profiles:
+        kind, convert, output_extension = 'video', _convert_video, '.mp4'
+    else:
+        return media_path
+    profile = profiles[kind]
+    if not os.path.isfile(absolute_path) or _fits(kind, profile, absolute_path, extension):
+        return media_path
+    if kind == 'image' and Image is None:
+        print("[Media] Pillow is not installed; publishing the original image.")
+        return media_path
+    if kind == 'video' and ffmpeg_path() is None:
+        print("[Media] ffmpeg is not available; publishing the original video.")
+        return media_path
+
+    source_hash = _source_hash(absolute_path)
+    name = f'{source_hash}-{platform_name}-{_profile_key(profile)}'
+    derived_dir = os.path.join(DERIVED_DIR, source_hash[:2])
+    with _lock_for(name):
+        for existing in _cached_files(base_dir, derived_dir, name):
+            # Cache hit: mark it recently used for LRU eviction, and in use
+            try:
+                os.utime(os.path.join(base_dir, existing))
+            except FileNotFoundError:
+                continue  # Evicted by another process
+            return existing
+        os.makedirs(os.path.join(base_dir, derived_dir), exist_ok=True)
+        started = time.monotonic()
+        derived_path = convert(profile, absolute_path, os.path.join(derived_dir, name), base_dir, output_extension)
+        if derived_path is None:
+            return media_path
+        print(f"[Media] Prepared {media_path} for {platform_name} in {time.monotonic() - started:.1f}s "
+              f"({os.path.getsize(absolute_path)} -> {os.path.getsize(os.path.join(base_dir, derived_path))} bytes)")
+    evict_derived_cache(base_dir)
+    return derived_path
+
+def _cached_files(base_dir, derived_dir, name):
+    try:
+        entries = os.listdir(os.path.join(base_dir, derived_dir))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(derived_dir, entry) for entry in entries
+            if os.path.splitext(entry)[0] == name and not entry.endswith('.tmp')]
+
+def _fits(kind, profile, absolute_path, extension):
+    """Whether media can be uploaded unchanged. Without Pillow, image dimensions are not checked."""
+    if os.path.getsize(absolute_path) > profile['max_bytes']:
+        return False
+    if kind == 'video':
+        # Dimensions and codecs would need ffprobe; only the container is checked
+        return extension in profile['extensions']
+    if Image is None:
+        return True
+    try:
+        with Image.open(absolute_path) as image:
+            return image.format in profile['formats'] and max(image.size) <= profile['max_dimension']
+    except OSError:
+        return True  # Not an image Pillow understands; let the platform decide
+
+def _convert_image(profile, absolute_path, derived_base, base_dir, output_extension):
+    with Image.open(absolute_path) as image:
+        if getattr(image, 'is_animated', False):
+            return None  # Re-encoding would drop the animation
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((profile['max_dimension'], profile['max_dimension']))
+        # Try to keep transparency as PNG when the platform takes it, then JPEG at
+        # falling qualities until the file fits
+        encodings = [('PNG', '.png', {})] if image.mode in ('RGBA', 'LA', 'P') and 'PNG' in profile['formats'] else []
+        encodings += [('JPEG', '.jpg', {'quality': quality, 'optimize': True, 'progressive': True})
+                      for quality in JPEG_QUALITIES]
+        temp_path = os.path.join(base_dir, derived_base) + f'.{os.getpid()}.tmp'
+        for image_format, extension, options in encodings:
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                image = _flatten(image)
+            image.save(temp_path, image_format, **options)
+            if os.path.getsize(temp_path) <= profile['max_bytes']:
+                break
+    derived_path = derived_base + extension
+    os.replace(temp_path, os.path.join(base_dir, derived_path))
+    return derived_path
+
+def _flatten(image):
+    """Converts to RGB for JPEG, putting transparent areas on white."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+def _convert_video(profile, absolute_path, derived_base, base_dir, output_extension):
+    ffmpeg = ffmpeg_path()
+    derived_path = derived_base + output_extension
+    temp_path = os.path.join(base_dir, derived_path) + f'.{os.getpid()}.tmp'
+    width, height = profile['max_width'], profile['max_height']
+    command = [
+        ffmpeg, '-y', '-loglevel', 'error', '-i', absolute_path,
+        # Fit inside the limits keeping the aspect ratio; H.264 needs even dimensions
+        '-vf', f"scale='min({width},iw)':'min({height},ih)':force_original_aspect_ratio=decrease,"
+               "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', '-f', 'mp4', temp_path,
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        stderr = getattr(e, 'stderr', b'') or b''
+        print(f"[Media] ffmpeg failed for {absolute_path}: {stderr.decode(errors='replace').strip() or e}")
+        return None
+    os.replace(temp_path, os.path.join(base_dir, derived_path))
+    return derived_path
+
+def evict_derived_cache(base_dir, max_bytes=None, now=None):
+    """
+    Deletes least recently used derived files until the cache fits its budget.
+    Files used within MEDIA_DERIVED_IN_USE_SECONDS are kept even over budget.
+    """
+    max_bytes = MEDIA_DERIVED_CACHE_BYTES if max_bytes is None else max_bytes
+    in_use_since = (time.time() if now is None else now) - MEDIA_DERIVED_IN_USE_SECONDS
+    files = []
+    for directory, _, names in os.walk(os.path.join(base_dir, DERIVED_DIR)):
+        for name in names:
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in sorted(files):
+        if total <= max_bytes or mtime >= in_use_since:
+            break
+        # Under the file's lock, so a cache hit in this process cannot return it while it goes
+        with _lock_for(os.path.splitext(os.path.basename(path))[0]):
+            try:
+                if os.stat(path).st_mtime >= in_use_since:
+                    continue  # Used since the scan
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
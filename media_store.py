@@ -0,0 +1,146 @@
+"""
+Content-addressed media store.
+
+Uploaded files are stored once per SHA-256 under uploads/media/<ab>/<sha256><ext>,
+so the same asset cross-posted to several platforms (or uploaded twice) takes one
+copy on disk, and different files that share a name never overwrite each other.
+content.media_path holds the stored path, which the platform adapters open as
+before; the file extension is kept because they detect media types from it.
+
+media_assets.refcount counts the posts using each file (see repository.py).
+collect_garbage() deletes files whose last post was deleted, and files that were
+stored but never used by a post within MEDIA_ORPHAN_GRACE_SECONDS.
+"""
+import hashlib
+import os
+import secrets
+import time
+
+import repository
+
+# Read size when hashing or copying media
+MEDIA_BLOCK_SIZE = int(os.getenv('MEDIA_BLOCK_SIZE', str(1024 * 1024)))
+
+# How long a stored file may go without being referenced by a post before it is
+# collected, leaving time to schedule a post after uploading its media
+MEDIA_ORPHAN_GRACE_SECONDS = int(os.getenv('MEDIA_ORPHAN_GRACE_SECONDS', '86400'))
+
+MEDIA_DIR = os.path.join('uploads', 'media')
+
+def hash_file(path):
+    """SHA-256 of a file, read in MEDIA_BLOCK_SIZE blocks."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MEDIA_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def media_path_for(sha256, filename):
+    """Relative store path for a file's hash, keeping the original extension."""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return os.path.join(MEDIA_DIR, sha256[:2], f'{sha256}{extension}')
+
+def store_file(conn, base_dir, source_path, filename, sha256=None):
+    """
+    Moves a file into the store and returns its media_path. When the store
+    already has the same content, the source is discarded instead. Commits.
+    """
+    sha256 = sha256 or hash_file(source_path)
+    asset = repository.get_media_asset(conn, sha256)
+    media_path = asset['path'] if asset else media_path_for(sha256, filename)
+    # Record the asset before checking for the file: garbage collection re-checks
+    # the row after moving a file aside, so it will put the file back
+    repository.upsert_media_asset(conn, sha256, media_path, os.path.getsize(source_path), time.time())
+    conn.commit()
+    absolute_path = os.path.join(base_dir, media_path)
+    if os.path.exists(absolute_path):
+        os.remove(source_path)
+    else:
+        os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+        os.replace(source_path, absolute_path)
+    return media_path
+
+def store_stream(conn, base_dir, stream, filename):
+    """Streams a file-like object (e.g. a Werkzeug FileStorage stream) into the store. Commits."""
+    temp_dir = os.path.join(base_dir, 'uploads', '.partial')
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_path = os.path.join(temp_dir, secrets.token_hex(16))
+    hasher = hashlib.sha256()
+    try:
+        with open(temp_path, 'wb') as f:
+            for block in iter(lambda: stream.read(MEDIA_BLOCK_SIZE), b''):
+                f.write(block)
+                hasher.update(block)
+        return store_file(conn, base_dir, temp_path, filename, hasher.hexdigest())
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def collect_garbage(conn, base_dir):
+    """
+    Deletes unreferenced media files and returns how many were removed. Commits.
+
+    Each file is first renamed aside, then its row is deleted only if it is still
+    unreferenced. If another request stored the same content in the meantime the
+    delete matches nothing and the file is put back, so it is never lost.
+    """
+    orphaned_before = time.time() - MEDIA_ORPHAN_GRACE_SECONDS
+    removed = 0
+    for asset in repository.list_collectable_media_assets(conn, orphaned_before):
+        absolute_path = os.path.join(base_dir, asset['path'])
+        tombstone = f'{absolute_path}.{secrets.token_hex(4)}.deleted'
+        try:
+            os.replace(absolute_path, tombstone)
+        except FileNotFoundError:
+            tombstone = None
+        deleted = repository.delete_media_asset(conn, asset['sha256'], orphaned_before)
+        conn.commit()
+        if tombstone is None:
+            continue
+        if deleted:
+            os.remove(tombstone)
+            removed += 1
+        elif os.path.exists(absolute_path):
+            os.remove(tombstone)
+        else:
+            os.replace(tombstone, absolute_path)
+    if removed:
+        print(f"[Media] Removed {removed} unreferenced media files.")
+    return removed
+
+def import_existing_media(conn, base_dir):
+    """
+    Moves media of posts created before the store existed (uploads/<filename>)
+    into the store and points the posts at it. Returns the number of files moved.
+    """
+    moved = 0
+    for old_path in repository.list_unstored_media_paths(conn):
+        absolute_path = os.path.join(base_dir, old_path)
+        # Only files the app uploaded itself; URLs and bundled static files stay where they are
+        if not old_path.startswith(('uploads/', 'uploads\\')) or not os.path.isfile(absolute_path):
+            continue
+        new_path = store_file(conn, base_dir, absolute_path, old_path)
+        repository.replace_content_media_path(conn, old_path, new_path)
+        conn.commit()
+        moved += 1
+    return moved
+
+if __name__ == "__main__":
+    import argparse
+    from db import get_db, init_db, BASE_DIR
+
+    parser = argparse.ArgumentParser(description="Content-addressed media store maintenance")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    subcommands.add_parser('import', help="Move media of existing posts into the store")
+    subcommands.add_parser('gc', help="Delete unreferenced media files")
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_db()
+    try:
+        if args.command == 'import':
+            print(f"[Media] Imported {import_existing_media(conn, BASE_DIR)} files into the media store.")
+        elif args.command == 'gc':
+            collect_garbage(conn, BASE_DIR)
+    finally:
+        conn.close()
@@ -1,15 +1,18 @@
 import os
-import requests
+import http_client
 import json
 from datetime import datetime
-from security import decrypt_data
+from security import load_credentials
+
+# API root; point it elsewhere (e.g. at the local emulator, see emulator.py) for load tests
+MEDIUM_API_BASE_URL = os.getenv('MEDIUM_API_BASE_URL', 'https://api.medium.com/v1').rstrip('/')
 
 class MediumAPI:
     def __init__(self, access_token):
         if not access_token:
             raise ValueError("Medium access token is required.")
         self.access_token = access_token
-        self.base_url = 'https://api.medium.com/v1'
+        self.base_url = MEDIUM_API_BASE_URL
         self.headers = {
             'Authorization': f'Bearer {self.access_token}',
             'Content-Type': 'application/json',
@@ -23,7 +26,7 @@ class MediumAPI:
             raise ValueError("Title and content are required for a Medium story.")
 
         # 1. Fetch authenticated user ID
-        user_info_response = requests.get(f'{self.base_url}/me', headers=self.headers)
+        user_info_response = http_client.get(f'{self.base_url}/me', headers=self.headers)
         user_info_response.raise_for_status()
         author_id = user_info_response.json()['data']['id']
 
@@ -37,7 +40,7 @@ class MediumAPI:
             'publishStatus': publish_status,
         }
         
-        response = requests.post(endpoint, headers=self.headers, json=payload)
+        response = http_client.post(endpoint, headers=self.headers, json=payload)
         response.raise_for_status()
         return response.json()
 
@@ -54,31 +57,38 @@ class MediumAPI:
         # Post as draft, then the scheduler would need to update its status at scheduled_time
         return self.post_story(title, content, tags=tags, publish_status='draft')
 
-def post_to_medium(account, content, base_dir):
-    """
-    Main function to post content to Medium, using credentials from the database.
-    """
+def _medium_access_token(account):
     try:
-        credentials = json.loads(decrypt_data(account['credentials']))
+        credentials = load_credentials(account)
     except (json.JSONDecodeError, TypeError):
         raise ValueError("Invalid credentials format for Medium account.")
+    return credentials.get('access_token')
+
+def _medium_story(content):
+    """Returns (title, html_content, tag_list) for a content row."""
+    title = content.get('title', 'No Title')
+    description = content.get('description', '')
+    hashtags = content.get('hashtags', '')
+
+    # Construct HTML content for the post
+    description_html = description.replace('\n', '<br>')
+    html_content = f"<h1>{title}</h1>\n<p>{description_html}</p>"
+    if hashtags:
+        formatted_tags = [f"#{tag.strip()}" for tag in hashtags.split(',') if tag.strip()]
+        html_content += f"<p><em>{' '.join(formatted_tags)}</em></p>"
+    
+    tag_list = [tag.strip() for tag in hashtags.split(',') if tag.strip()]
+    return title, html_content, tag_list
 
-    access_token = credentials.get('access_token')
+def post_to_medium(account, content, base_dir):
+    """
+    Main function to post content to Medium, using credentials from the database.
+    """
+    access_token = _medium_access_token(account)
 
     try:
         api = MediumAPI(access_token)
-        
-        title = content.get('title', 'No Title')
-        description = content.get('description', '')
-        hashtags = content.get('hashtags', '')
-
-        # Construct HTML content for the post
-        html_content = f"<h1>{title}</h1>\n<p>{description.replace('\n', '<br>')}</p>"
-        if hashtags:
-            formatted_tags = [f"#{tag.strip()}" for tag in hashtags.split(',') if tag.strip()]
-            html_content += f"<p><em>{' '.join(formatted_tags)}</em></p>"
-        
-        tag_list = [tag.strip() for tag in hashtags.split(',') if tag.strip()]
+        title, html_content, tag_list = _medium_story(content)
 
         response = api.post_story(
             title=title,
@@ -91,4 +101,4 @@ def post_to_medium(account, content, base_dir):
         return response
 
     except Exception as e:
-        raise Exception(f"Medium API Error: {e}") 
\ No newline at end of file
+        raise Exception(f"Medium API Error: {e}") 
@@ -0,0 +1,310 @@
+"""
+Prometheus metrics.
+
+A small in-process registry of counters, gauges and histograms, served at
+/metrics in the Prometheus text format:
+
+  smm_queue_depth{platform,status}           posts waiting to be published (gauge)
+  smm_oldest_due_post_age_seconds            how overdue the oldest waiting post is (gauge)
+  smm_publish_lag_seconds{platform}          schedule_time to posted (histogram)
+  smm_platform_api_seconds{platform,result}  adapter calls; result is 'success' or the error class (histogram)
+  smm_scheduler_tick_seconds                 scheduler passes (histogram)
+  smm_scheduler_claimed_posts_total          posts claimed by scheduler passes (counter)
+  smm_db_pool_wait_seconds                   checking out a pooled PostgreSQL connection (histogram)
+
+The gauges are read from the database when /metrics is scraped (content_stats and
+index lookups), so every process reports the same values. Counters and
+histograms are kept per process. With several processes (gunicorn workers, the
+standalone scheduler worker), set METRICS_DIR to a directory they all share on
+one host: each process writes its values there every METRICS_FLUSH_SECONDS, and
+/metrics adds up the files of every process. When a scrape finds the file of a
+process that has exited, it folds the values into exited.json and removes the
+file, so totals do not drop when a worker is replaced and the directory only
+holds one file per live process.
+"""
+import atexit
+import bisect
+import json
+import math
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import repository
+import stats
+
+# Directory shared by every process for multi-process aggregation (unset: this process only)
+METRICS_DIR = os.getenv('METRICS_DIR')
+
+# How often each process writes its values to METRICS_DIR
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Values of exited processes in METRICS_DIR, and the per-process file names
+EXITED_FILE = 'exited.json'
+_PROCESS_FILE = re.compile(r'(\d+)-\d+\.json')
+
+_registry = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+_started = time.time()
+_dirty = False
+_flusher_pid = None
+
+def _changed():
+    """Called with _lock held before a counter or histogram changes."""
+    global _pid, _started, _dirty, _flusher_pid
+    if _pid != os.getpid():
+        # Values inherited across fork() (e.g. gunicorn --preload) belong to the parent
+        for metric in _registry.values():
+            if metric.shared:
+                metric.values.clear()
+        _pid, _started = os.getpid(), time.time()
+    _dirty = True
+    if METRICS_DIR and _flusher_pid != _pid:
+        _flusher_pid = _pid
+        threading.Thread(target=_flush_forever, name='metrics-flush', daemon=True).start()
+
+class Metric:
+    kind = None
+    # Whether values are added up across processes (counters and histograms)
+    shared = True
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def samples(self, key, value):
+        yield f'{self.name}{self._labels(key)} {_number(value)}'
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            _changed()
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """A value set in this process, e.g. by collect_database_gauges() when scraped. Not aggregated."""
+    kind = 'gauge'
+    shared = False
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            _changed()
+            # Per-bucket counts (the last one is +Inf), then the sum and the count
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 3)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), value):
+            cumulative += count
+            yield f'{self.name}_bucket{self._labels(key, [("le", _number(bound))])} {_number(cumulative)}'
+        yield f'{self.name}_sum{self._labels(key)} {_number(value[-2])}'
+        yield f'{self.name}_count{self._labels(key)} {_number(value[-1])}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+# --- Metrics ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+DB_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+QUEUE_DEPTH = Gauge('smm_queue_depth', 'Posts waiting to be published, by platform and status.',
+                    ('platform', 'status'))
+OLDEST_DUE_POST_AGE = Gauge('smm_oldest_due_post_age_seconds',
+                            'Seconds since the oldest post still waiting to be published fell due.')
+PUBLISH_LAG = Histogram('smm_publish_lag_seconds', 'Seconds from a post\'s schedule_time to it being posted.',
+                        ('platform',), LAG_BUCKETS)
+PLATFORM_API_SECONDS = Histogram('smm_platform_api_seconds',
+                                 'Platform adapter call duration, by platform and result (success or error class).',
+                                 ('platform', 'result'), LATENCY_BUCKETS)
+SCHEDULER_TICK_SECONDS = Histogram('smm_scheduler_tick_seconds', 'Duration of scheduler passes.',
+                                   buckets=LATENCY_BUCKETS)
+SCHEDULER_CLAIMED_POSTS = Counter('smm_scheduler_claimed_posts_total', 'Posts claimed by scheduler passes.')
+# SQLite keeps one connection per thread and waits for its lock inside busy_timeout,
+# where the wait cannot be timed, so it reports nothing here.
+DB_POOL_WAIT_SECONDS = Histogram('smm_db_pool_wait_seconds',
+                                 'Time to check out a pooled PostgreSQL connection, including waiting for a free one.',
+                                 buckets=DB_WAIT_BUCKETS)
+
+def collect_database_gauges(conn, now_epoch=None):
+    """Sets the queue gauges from the database."""
+    now_epoch = time.time() if now_epoch is None else now_epoch
+    # Every platform with posts reports each queued status, so an empty queue reads 0 rather than no data
+    depth = {}
+    for row in repository.list_content_stats(conn):
+        for status in stats.QUEUED_STATUSES:
+            depth.setdefault((row['platform'], status), 0)
+        if row['status'] in stats.QUEUED_STATUSES:
+            depth[(row['platform'], row['status'])] += row['posts']
+    with _lock:
+        QUEUE_DEPTH.values.clear()
+    for (platform, status), posts in depth.items():
+        QUEUE_DEPTH.set(posts, platform=platform, status=status)
+    oldest_epoch = repository.oldest_waiting_epoch(conn)
+    OLDEST_DUE_POST_AGE.set(max(0.0, now_epoch - oldest_epoch) if oldest_epoch is not None else 0.0)
+
+# --- Multi-process aggregation ---
+def _snapshot():
+    with _lock:
+        return {metric.name: [[list(key), value] for key, value in metric.values.items()]
+                for metric in _registry.values() if metric.shared and metric.values}
+
+def flush():
+    """Writes this process's counters and histograms to METRICS_DIR."""
+    global _dirty
+    if not METRICS_DIR:
+        return
+    with _lock:
+        _dirty = False
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f'{os.getpid()}-{int(_started)}.json')
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(temp_path, path)
+
+def _flush_forever():
+    pid = os.getpid()
+    while _flusher_pid == pid == os.getpid():
+        time.sleep(METRICS_FLUSH_SECONDS)
+        if _dirty:
+            try:
+                flush()
+            except OSError as e:
+                print(f"[Metrics] Could not write metrics to {METRICS_DIR}: {e}")
+
+def _read_snapshot(name):
+    try:
+        with open(os.path.join(METRICS_DIR, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # Replaced or removed while reading
+
+def _add_up(values):
+    """Adds up [key, value] pairs with the same labels; returns {labels tuple: total}."""
+    totals = {}
+    for key, value in values:
+        key = tuple(key)
+        previous = totals.get(key)
+        if previous is None:
+            totals[key] = value
+        elif isinstance(value, list) and len(value) == len(previous):
+            totals[key] = [a + b for a, b in zip(previous, value)]
+        elif not isinstance(value, list):
+            totals[key] = previous + value
+    return totals
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, owned by another user
+    return True
+
+def _read_snapshots(names):
+    merged = {}
+    for name in names:
+        for metric_name, values in (_read_snapshot(name) or {}).items():
+            merged.setdefault(metric_name, []).extend(values)
+    return merged
+
+def _collect_exited():
+    """Folds the files of processes that have exited into EXITED_FILE and removes them. Needs the .lock."""
+    exited_files = [name for name in os.listdir(METRICS_DIR)
+                    if (match := _PROCESS_FILE.fullmatch(name)) and not _pid_alive(int(match.group(1)))]
+    if not exited_files:
+        return
+    exited = {metric_name: [[list(key), value] for key, value in _add_up(values).items()]
+              for metric_name, values in _read_snapshots([EXITED_FILE] + exited_files).items()}
+    path = os.path.join(METRICS_DIR, EXITED_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(exited, f)
+    os.replace(f'{path}.tmp', path)
+    for name in exited_files:
+        os.remove(os.path.join(METRICS_DIR, name))
+
+def _merged_values():
+    """Counter and histogram values added up over every process's file, or this process's values."""
+    if not METRICS_DIR:
+        return _snapshot()
+    flush()
+    with open(os.path.join(METRICS_DIR, '.lock'), 'w') as lock:
+        if fcntl is not None:
+            # One scrape at a time, so a file being folded into exited.json is not also read on its own
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            _collect_exited()
+        return _read_snapshots(name for name in os.listdir(METRICS_DIR) if name.endswith('.json'))
+
+def render(conn=None):
+    """The metrics in the Prometheus text format. With a connection, the queue gauges are refreshed first."""
+    if conn is not None:
+        collect_database_gauges(conn)
+    merged = _merged_values()
+    lines = []
+    for metric in _registry.values():
+        if metric.shared:
+            totals = _add_up(merged.get(metric.name, []))
+        else:
+            with _lock:
+                totals = dict(metric.values)
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for key, value in sorted(totals.items()):
+            lines.extend(metric.samples(key, value))
+    return '\n'.join(lines) + '\n'
+
+def _flush_at_exit():
+    if METRICS_DIR and _dirty:
+        flush()
+
+atexit.register(_flush_at_exit)
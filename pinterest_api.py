@@ -1,16 +1,20 @@
 import os
-import requests
+import http_client
 import mimetypes
 import json
 from datetime import datetime
-from security import decrypt_data
+from security import load_credentials
+import errors
+
+# API root; point it elsewhere (e.g. at the local emulator, see emulator.py) for load tests
+PINTEREST_API_BASE_URL = os.getenv('PINTEREST_API_BASE_URL', 'https://api.pinterest.com/v5').rstrip('/')
 
 class PinterestAPI:
     def __init__(self, access_token):
         if not access_token:
             raise ValueError("Pinterest access token is required.")
         self.access_token = access_token
-        self.base_url = 'https://api.pinterest.com/v5'
+        self.base_url = PINTEREST_API_BASE_URL
         self.headers = {
             'Authorization': f'Bearer {self.access_token}',
             'Content-Type': 'application/json'
@@ -37,7 +41,8 @@ class PinterestAPI:
         payload = {'media_type': 'image'}
         
         # Register the upload
-        register_response = requests.post(endpoint, headers=self.headers, json=payload)
+        # Registering an upload publishes nothing, so it is safe to retry
+        register_response = http_client.post(endpoint, headers=self.headers, json=payload, retry_unsafe=True)
         register_response.raise_for_status()
         
         upload_data = register_response.json()
@@ -49,7 +54,7 @@ class PinterestAPI:
         upload_headers = {'Content-Type': content_type}
         
         with open(image_path, 'rb') as img_file:
-            upload_response = requests.put(upload_url, headers=upload_headers, data=img_file)
+            upload_response = http_client.put(upload_url, headers=upload_headers, data=img_file)
             upload_response.raise_for_status()
         
         # Optionally, you might need to check the status of the media upload here
@@ -70,8 +75,52 @@ class PinterestAPI:
             }
         }
         
-        response = requests.post(endpoint, headers=self.headers, json=payload)
-        response.raise_for_status()
+        with errors.publish_call():
+            response = http_client.post(endpoint, headers=self.headers, json=payload)
+            response.raise_for_status()
+        return response.json()
+
+    async def post_pin_async(self, board_id, title, description, image_path):
+        """Async version of post_pin: register, upload and create-pin all await on the event loop."""
+        if not board_id:
+            raise ValueError("Board ID is required to post a pin.")
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"Image path does not exist: {image_path}")
+
+        media_id = await self._upload_image_async(image_path)
+        if not media_id:
+            raise Exception("Failed to upload image to Pinterest.")
+        return await self._create_pin_async(board_id, title, description, media_id)
+
+    async def _upload_image_async(self, image_path):
+        register_response = await http_client.request_async(
+            'POST', f'{self.base_url}/media', headers=self.headers, json={'media_type': 'image'}, retry_unsafe=True
+        )
+        register_response.raise_for_status()
+        upload_data = register_response.json()
+
+        # Streamed from the file like the sync path, read off the event loop
+        content_type = mimetypes.guess_type(image_path)[0] or 'image/jpeg'
+        with open(image_path, 'rb') as image_file:
+            upload_response = await http_client.request_async(
+                'PUT', upload_data['upload_url'], headers={'Content-Type': content_type}, content=image_file
+            )
+            upload_response.raise_for_status()
+        return upload_data['media_id']
+
+    async def _create_pin_async(self, board_id, title, description, media_id):
+        payload = {
+            'board_id': board_id,
+            'title': title,
+            'description': description,
+            'media_source': {
+                'source_type': 'media_id',
+                'media_id': media_id
+            }
+        }
+        with errors.publish_call():
+            response = await http_client.request_async('POST', f'{self.base_url}/pins', headers=self.headers, json=payload)
+            response.raise_for_status()
         return response.json()
 
     def schedule_pin(self, board_id, title, description, image_path, scheduled_time):
@@ -87,12 +136,10 @@ class PinterestAPI:
         # The actual scheduling logic is in scheduler.py
         return {'status': 'scheduled_via_external_scheduler', 'scheduled_time': scheduled_time.isoformat()}
 
-def post_to_pinterest(account, content, base_dir):
-    """
-    Main function to post a pin to Pinterest, using credentials from the database.
-    """
+def _pinterest_credentials(account):
+    """Returns (access_token, board_id) for an account, raising if they are unusable."""
     try:
-        credentials = json.loads(decrypt_data(account['credentials']))
+        credentials = load_credentials(account)
     except (json.JSONDecodeError, TypeError):
         raise ValueError("Invalid credentials format for Pinterest account.")
 
@@ -101,18 +148,27 @@ def post_to_pinterest(account, content, base_dir):
 
     if not board_id:
         raise ValueError("Pinterest Board ID is not configured for this account.")
+    return access_token, board_id
 
-    try:
-        api = PinterestAPI(access_token)
-        
-        title = content.get('title', 'No Title')
-        description = f"{content.get('description', '')}\n\n{content.get('hashtags', '')}".strip()
-        media_path_relative = content.get('media_path')
+def _pin_fields(content, base_dir):
+    """Returns (title, description, absolute image path) for a content row."""
+    title = content.get('title', 'No Title')
+    description = f"{content.get('description', '')}\n\n{content.get('hashtags', '')}".strip()
+    media_path_relative = content.get('media_path')
 
-        if not media_path_relative:
-            raise ValueError("An image is required to post a pin to Pinterest.")
+    if not media_path_relative:
+        raise ValueError("An image is required to post a pin to Pinterest.")
+    return title, description, os.path.join(base_dir, media_path_relative)
 
-        media_path_absolute = os.path.join(base_dir, media_path_relative)
+def post_to_pinterest(account, content, base_dir):
+    """
+    Main function to post a pin to Pinterest, using credentials from the database.
+    """
+    access_token, board_id = _pinterest_credentials(account)
+
+    try:
+        api = PinterestAPI(access_token)
+        title, description, media_path_absolute = _pin_fields(content, base_dir)
         
         response = api.post_pin(
             board_id=board_id,
@@ -125,4 +181,27 @@ def post_to_pinterest(account, content, base_dir):
         return response
 
     except Exception as e:
-        raise Exception(f"Pinterest API Error: {e}") 
\ No newline at end of file
+        raise Exception(f"Pinterest API Error: {e}") 
+
+async def post_to_pinterest_async(account, content, base_dir):
+    """
+    Async version of post_to_pinterest for the asyncio publishing engine.
+    """
+    access_token, board_id = _pinterest_credentials(account)
+
+    try:
+        api = PinterestAPI(access_token)
+        title, description, media_path_absolute = _pin_fields(content, base_dir)
+
+        response = await api.post_pin_async(
+            board_id=board_id,
+            title=title,
+            description=description,
+            image_path=media_path_absolute
+        )
+
+        print(f"[Pinterest API] Pin created successfully: {response}")
+        return response
+
+    except Exception as e:
+        raise Exception(f"Pinterest API Error: {e}")
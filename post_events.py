@@ -0,0 +1,215 @@
+"""
+Post lifecycle events.
+
+The content table only holds a post's latest status. post_events keeps every
+transition, append-only, so the time a post spends in each stage can be measured:
+
+  enqueued        created, or requeued after failing (a database trigger, see db.py);
+                  due_at is when it is due
+  claimed         claimed by a scheduler pass; due_at is when this attempt fell due
+  media_prepared  media checked or converted for the platform
+  api_call_start  adapter called
+  api_call_end    adapter returned or raised (with the error class)
+  posted, retrying, dead, error, deferred
+                  the result of the attempt, as recorded in content
+
+The scheduler's events are buffered in memory and written in batches, every
+POST_EVENTS_FLUSH_SECONDS, once POST_EVENTS_BATCH_SIZE are waiting and after each
+scheduler pass, so recording them adds no write per transition. Events still
+buffered when a process is killed are lost; the posts themselves are not affected.
+
+Timestamps are time.monotonic() anchored to the wall clock once per process, so
+durations measured in one worker are exact even when the system clock steps, and
+still line up with the epochs of other processes.
+
+publishing_report() turns the events into p50/p95/p99 publish lag and per-stage
+durations per platform and time window (/api/reports/publishing).
+"""
+import atexit
+import itertools
+import os
+import threading
+import time
+
+import repository
+
+# Events written together, and the longest an event waits in memory
+POST_EVENTS_BATCH_SIZE = int(os.getenv('POST_EVENTS_BATCH_SIZE', '500'))
+POST_EVENTS_FLUSH_SECONDS = float(os.getenv('POST_EVENTS_FLUSH_SECONDS', '2'))
+
+# How long events are kept
+POST_EVENTS_RETENTION_SECONDS = int(os.getenv('POST_EVENTS_RETENTION_SECONDS', str(30 * 86400)))
+
+# Events that end an attempt
+RESULT_EVENTS = ('posted', 'retrying', 'dead', 'error', 'deferred')
+
+# Stages of an attempt: (name, starting event, ending event). 'dispatch' is the wait
+# for a publishing thread or async slot, 'record' the write of the result.
+STAGES = (
+    ('queue_wait', None, 'claimed'),
+    ('media_prep', 'claimed', 'media_prepared'),
+    ('dispatch', 'media_prepared', 'api_call_start'),
+    ('api_call', 'api_call_start', 'api_call_end'),
+    ('record', 'api_call_end', 'result'),
+)
+
+PERCENTILES = (50, 95, 99)
+
+_wall_anchor = time.time()
+_monotonic_anchor = time.monotonic()
+_buffer = []
+_lock = threading.Lock()
+_wake = threading.Event()
+_pid = os.getpid()
+_flusher_pid = None
+_last_prune = 0.0
+
+def now():
+    """The current epoch on this process's monotonic clock."""
+    return _wall_anchor + time.monotonic() - _monotonic_anchor
+
+def record(content_id, event, attempt=None, platform=None, worker_id=None, error_class=None, due_at=None,
+           occurred_at=None):
+    """Buffers an event; it is written by the next flush."""
+    global _pid, _flusher_pid
+    row = (content_id, attempt, event, now() if occurred_at is None else occurred_at, due_at, platform,
+           worker_id, error_class)
+    with _lock:
+        if _pid != os.getpid():
+            # Events inherited across fork() are the parent's to write
+            _buffer.clear()
+            _pid = os.getpid()
+        _buffer.append(row)
+        pending = len(_buffer)
+        if _flusher_pid != _pid:
+            _flusher_pid = _pid
+            threading.Thread(target=_flush_forever, name='post-events-flush', daemon=True).start()
+    if pending >= POST_EVENTS_BATCH_SIZE:
+        _wake.set()
+
+def flush():
+    """Writes the buffered events with one executemany on this thread's connection. Commits."""
+    from db import get_db
+    with _lock:
+        rows = list(_buffer) if _pid == os.getpid() else []
+        _buffer.clear()
+    if not rows:
+        return 0
+    conn = get_db()
+    try:
+        repository.add_post_events(conn, rows)
+        conn.commit()
+    except Exception as e:
+        print(f"[Events] Could not write {len(rows)} post events: {e}")
+        return 0
+    finally:
+        conn.close()
+    return len(rows)
+
+def _flush_forever():
+    pid = os.getpid()
+    while _flusher_pid == pid == os.getpid():
+        _wake.wait(POST_EVENTS_FLUSH_SECONDS)
+        _wake.clear()
+        flush()
+
+def prune(conn, now_epoch=None):
+    """Drops events older than POST_EVENTS_RETENTION_SECONDS, at most once an hour per process. Commits."""
+    global _last_prune
+    now_epoch = time.time() if now_epoch is None else now_epoch
+    with _lock:
+        if now_epoch - _last_prune < 3600:
+            return 0
+        _last_prune = now_epoch
+    removed = repository.prune_post_events(conn, now_epoch - POST_EVENTS_RETENTION_SECONDS)
+    conn.commit()
+    return removed
+
+# --- Reports ---
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def summarize(values):
+    """Count, mean and percentiles of durations in seconds."""
+    summary = {'count': len(values), 'mean': round(sum(values) / len(values), 3) if values else None}
+    for pct in PERCENTILES:
+        value = percentile(values, pct)
+        summary[f'p{pct}'] = None if value is None else round(value, 3)
+    return summary
+
+def _stage_durations(attempt, result, enqueued_at):
+    """Seconds spent in each stage of one attempt, for the stages it reached."""
+    durations = {}
+    events = dict(attempt, result=result)
+    for name, start, end in STAGES:
+        if end not in events:
+            continue
+        if start is None:
+            # Waiting starts when the attempt fell due, or when the post was enqueued if that was later
+            due_at = max(filter(None, (events[end]['due_at'], enqueued_at)), default=None)
+            if due_at is not None:
+                durations[name] = max(0.0, events[end]['occurred_at'] - due_at)
+        elif start in events:
+            durations[name] = max(0.0, events[end]['occurred_at'] - events[start]['occurred_at'])
+    return durations
+
+def publishing_report(conn, since_epoch, until_epoch, bucket_seconds, platform=None):
+    """
+    Publish lag (from a post falling due to it being posted) and per-stage
+    durations per platform, for attempts that ended between since_epoch and
+    until_epoch, in windows of bucket_seconds.
+
+    A post falls due at its schedule time as of its first claim, or when it was
+    enqueued if that was later; a requeued post falls due again when requeued.
+    """
+    windows = {}
+    for _, events in itertools.groupby(
+            repository.list_post_events_for_results(conn, since_epoch, until_epoch, RESULT_EVENTS, platform),
+            key=lambda event: event['content_id']):
+        enqueued_at, due, claimed, attempt = None, None, False, {}
+        for event in events:
+            name = event['event']
+            if name == 'enqueued':
+                enqueued_at, due, claimed, attempt = event['occurred_at'], event['due_at'], False, {}
+                continue
+            if name == 'claimed':
+                if not claimed:
+                    due = max(filter(None, (due, event['due_at'])), default=None)
+                claimed, attempt = True, {}
+            if name not in RESULT_EVENTS:
+                attempt[name] = event
+                continue
+            if since_epoch <= event['occurred_at'] < until_epoch:
+                bucket = int((event['occurred_at'] - since_epoch) // bucket_seconds)
+                window = windows.setdefault(bucket, {}).setdefault(event['platform'] or '', {
+                    'results': {}, 'lags': [], 'attempts': [], 'stages': {name: [] for name, _, _ in STAGES},
+                })
+                window['results'][name] = window['results'].get(name, 0) + 1
+                for stage, seconds in _stage_durations(attempt, event, enqueued_at).items():
+                    window['stages'][stage].append(seconds)
+                if name == 'posted':
+                    if due is not None:
+                        window['lags'].append(max(0.0, event['occurred_at'] - due))
+                    window['attempts'].append(event['attempt'] or 1)
+            attempt = {}
+
+    return [{
+        'start_epoch': since_epoch + bucket * bucket_seconds,
+        'end_epoch': min(until_epoch, since_epoch + (bucket + 1) * bucket_seconds),
+        'platforms': {
+            platform_name: {
+                'results': window['results'],
+                'publish_lag_seconds': summarize(window['lags']),
+                'attempts': {'mean': round(sum(window['attempts']) / len(window['attempts']), 2) if window['attempts'] else None,
+                             'max': max(window['attempts'], default=None)},
+                'stages_seconds': {stage: summarize(values) for stage, values in window['stages'].items()},
+            }
+            for platform_name, window in sorted(platforms.items())
+        },
+    } for bucket, platforms in sorted(windows.items())]
+
+atexit.register(flush)
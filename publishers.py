@@ -0,0 +1,27 @@
+import os
+from youtube_api import post_to_youtube
+from instagram_api import post_to_instagram, post_to_instagram_async
+from twitter_api import post_to_twitter
+from pinterest_api import post_to_pinterest, post_to_pinterest_async
+from linkedin_api import post_to_linkedin, post_to_linkedin_async
+from reddit_api import post_to_reddit
+from async_engine import run_sync
+
+# Publish Instagram, Pinterest and LinkedIn posts on the asyncio engine (httpx)
+# instead of one thread per post. Set ASYNC_PUBLISHING=false to use the sync adapters.
+ASYNC_PUBLISHING = os.getenv('ASYNC_PUBLISHING', 'true').lower() in ('1', 'true', 'yes')
+
+# Maps platform names (platforms.name) to their posting functions. Each function takes
+# (account, content, base_dir) and raises on failure. Shared by the web app and the
+# standalone scheduler worker. Async adapters are wrapped with run_sync, so they are
+# still plain blocking functions to callers; the scheduler detects them and awaits
+# them on the engine instead.
+platform_apis = {
+    'youtube': post_to_youtube,
+    'instagram': run_sync(post_to_instagram_async) if ASYNC_PUBLISHING else post_to_instagram,  # Enabled
+    'twitter': post_to_twitter,
+    'pinterest': run_sync(post_to_pinterest_async) if ASYNC_PUBLISHING else post_to_pinterest,
+
+    'linkedin': run_sync(post_to_linkedin_async) if ASYNC_PUBLISHING else post_to_linkedin,
+    'reddit': post_to_reddit,
+}
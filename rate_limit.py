@@ -0,0 +1,187 @@
+"""
+Rate limiting for publishing: token buckets per (platform, account) and per
+platform app, stored in the rate_limits table so every worker shares them.
+
+The scheduler calls acquire() before publishing a post and defers the post when
+a bucket is empty. While a post is being published, responses seen by the HTTP
+layer (and tweepy's sessions) are observed for rate-limit headers and 429s;
+record() then writes what was learned back to the shared buckets.
+"""
+import contextvars
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import http_client
+import repository
+
+# Default budgets as (requests, per seconds). Override with RATE_LIMIT_<PLATFORM>_ACCOUNT
+# or RATE_LIMIT_<PLATFORM>_APP, e.g. RATE_LIMIT_TWITTER_ACCOUNT=50/900, or 'off'. A bucket
+# without a budget never runs out, but is still blocked when the platform throttles us.
+DEFAULT_RATE_LIMITS = {
+    'twitter': {'account': (100, 900), 'app': (10000, 86400)},  # POST /2/tweets
+    'reddit': {'account': (30, 3600), 'app': (100, 60)},        # OAuth clients: 100 requests/minute
+    'instagram': {'account': (50, 86400)},                        # Content publishing limit per IG user
+    'pinterest': {'account': (100, 60)},
+    'linkedin': {'account': (150, 86400)},                        # Member share limit
+    'youtube': {'app': (6, 86400)},                               # 10,000 quota units/day at 1,600 per upload
+}
+
+UNLIMITED = (1e9, 1)
+
+# Where a platform's daily quota resets (YouTube: midnight Pacific time)
+QUOTA_RESET_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+_ensured_buckets = set()
+
+def _parse_limit(value):
+    if value.strip().lower() in ('off', 'none', '0'):
+        return UNLIMITED
+    count, seconds = value.split('/')
+    return float(count), float(seconds)
+
+def get_limit(platform_name, scope):
+    """Returns (requests, per seconds) for a platform's 'account' or 'app' bucket."""
+    override = os.getenv(f'RATE_LIMIT_{platform_name.upper()}_{scope.upper()}')
+    if override:
+        return _parse_limit(override)
+    return DEFAULT_RATE_LIMITS.get(platform_name, {}).get(scope, UNLIMITED)
+
+def _buckets(platform_name, account_id):
+    """Returns {scope: (bucket_key, limit)} for the buckets a post draws from."""
+    return {
+        'account': (f'{platform_name}:account:{account_id}', get_limit(platform_name, 'account')),
+        'app': (f'{platform_name}:app', get_limit(platform_name, 'app')),
+    }
+
+def _ensure_bucket(conn, key, limit, now_epoch):
+    capacity, seconds = limit
+    if (key, limit) not in _ensured_buckets:
+        repository.ensure_rate_limit_bucket(conn, key, capacity, capacity / seconds, now_epoch)
+        _ensured_buckets.add((key, limit))
+
+def acquire(conn, platform_name, account_id, now_epoch=None):
+    """
+    Takes one token from each of the post's buckets and commits. Returns 0 when
+    the post may be published now, or the number of seconds until it may be
+    retried (nothing is taken in that case).
+    """
+    now_epoch = now_epoch or time.time()
+    taken = []
+    for key, limit in _buckets(platform_name, account_id).values():
+        _ensure_bucket(conn, key, limit, now_epoch)
+        if repository.take_rate_limit_token(conn, key, now_epoch):
+            taken.append(key)
+            continue
+        # Give back what this post already took, then work out how long to wait
+        for taken_key in taken:
+            repository.return_rate_limit_token(conn, taken_key)
+        bucket = repository.get_rate_limit_bucket(conn, key)
+        conn.commit()
+        refilled = min(bucket['capacity'], bucket['tokens'] + (now_epoch - bucket['updated_at']) * bucket['refill_per_second'])
+        wait = (1 - refilled) / bucket['refill_per_second'] if refilled < 1 else 0
+        return max(wait, bucket['blocked_until'] - now_epoch, 1)
+    conn.commit()
+    return 0
+
+# --- Observing platform responses ---
+class Observation:
+    """What the responses of one publish attempt said about the platform's limits."""
+
+    def __init__(self, platform_name, account_id):
+        self.platform_name = platform_name
+        self.account_id = account_id
+        self.remaining = {}          # 'account'/'app' -> requests left in the platform's window
+        self.blocked_until = {}      # 'account'/'app' -> epoch the platform told us to wait for
+
+    @property
+    def throttled(self):
+        return bool(self.blocked_until)
+
+    def limit_remaining(self, scope, remaining):
+        self.remaining[scope] = min(self.remaining.get(scope, remaining), remaining)
+
+    def block(self, scope, until_epoch):
+        self.blocked_until[scope] = max(self.blocked_until.get(scope, 0), until_epoch)
+
+_current = contextvars.ContextVar('rate_limit_observation', default=None)
+
+def begin(platform_name, account_id):
+    """Starts observing responses for a post published on the current thread or task."""
+    observation = Observation(platform_name, account_id)
+    _current.set(observation)
+    return observation
+
+def _reset_epoch(value, now_epoch):
+    """Reads a reset header that is either an absolute epoch or seconds from now."""
+    reset = float(value)
+    return reset if reset > now_epoch - 86400 else now_epoch + reset
+
+def observe_response(response):
+    """Response hook: reads rate-limit headers of a requests or httpx response."""
+    observation = _current.get()
+    if observation is None:
+        return
+    headers = response.headers
+    now_epoch = time.time()
+    try:
+        # Twitter limits each user per endpoint (x-rate-limit-*); Reddit limits the
+        # OAuth client (x-ratelimit-*)
+        for scope, prefix in (('account', 'x-rate-limit-'), ('app', 'x-ratelimit-')):
+            remaining = headers.get(f'{prefix}remaining')
+            if remaining is None:
+                continue
+            observation.limit_remaining(scope, float(remaining))
+            reset = headers.get(f'{prefix}reset')
+            if float(remaining) < 1 and reset is not None:
+                observation.block(scope, _reset_epoch(reset, now_epoch))
+        # Meta Graph API: app usage as percentages of the hourly budget
+        app_usage = headers.get('x-app-usage')
+        if app_usage and max(json.loads(app_usage).values()) >= 100:
+            observation.block('app', now_epoch + 3600)
+        if response.status_code == 429:
+            retry_after = headers.get('retry-after')
+            observation.block('account', now_epoch + (float(retry_after) if retry_after else 60))
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"[RateLimit] Could not read rate-limit headers: {e}")
+
+def observe_exception(exc):
+    """Looks through a poster's exception chain for rate-limit and quota errors."""
+    observation = _current.get()
+    seen = set()
+    while observation is not None and exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, 'response', None)
+        if response is not None and getattr(response, 'status_code', None) == 429:
+            observe_response(response)
+        # googleapiclient HttpError: YouTube's daily quota resets at midnight Pacific time
+        resp = getattr(exc, 'resp', None)
+        if resp is not None and getattr(resp, 'status', None) == 403 and b'quotaExceeded' in (getattr(exc, 'content', b'') or b''):
+            tomorrow = datetime.now(QUOTA_RESET_TIMEZONE).date() + timedelta(days=1)
+            reset = datetime.combine(tomorrow, datetime.min.time(), QUOTA_RESET_TIMEZONE)
+            observation.block('app', reset.timestamp())
+        exc = exc.__cause__ or exc.__context__
+
+def record(conn, observation):
+    """Writes what was observed while publishing into the shared buckets. Does not commit."""
+    if observation is None:
+        return
+    now_epoch = time.time()
+    buckets = _buckets(observation.platform_name, observation.account_id)
+    for scope, remaining in observation.remaining.items():
+        key, limit = buckets[scope]
+        _ensure_bucket(conn, key, limit, now_epoch)
+        repository.cap_rate_limit_tokens(conn, key, remaining, now_epoch)
+    for scope, until_epoch in observation.blocked_until.items():
+        key, limit = buckets[scope]
+        _ensure_bucket(conn, key, limit, now_epoch)
+        repository.block_rate_limit_bucket(conn, key, until_epoch)
+        print(f"[RateLimit] {key} throttled by the platform until {datetime.fromtimestamp(until_epoch).isoformat()}")
+
+def retry_epoch(observation):
+    """The epoch at which a throttled post can be retried."""
+    return max(observation.blocked_until.values())
+
+http_client.response_hooks.append(observe_response)
@@ -1,7 +1,27 @@
 import praw
+import prawcore
 import os
 import json
-from security import decrypt_data
+from security import load_credentials
+from clients import get_client
+import errors
+
+def _build_reddit_client(credentials):
+    """Creates an authenticated PRAW instance, verifying the login once."""
+    reddit = praw.Reddit(
+        client_id=credentials.get('client_id'),
+        client_secret=credentials.get('client_secret'),
+        username=credentials.get('username'),
+        password=credentials.get('password'),
+        user_agent=credentials.get('user_agent', 'script:bot2:v1.0 (by /u/Leather_Emu4253)')
+    )
+    
+    # Verify authentication
+    try:
+        print(f"[Reddit API] Successfully authenticated as: {reddit.user.me()}")
+    except Exception as e:
+        raise Exception(f"Reddit authentication failed: {e}")
+    return reddit
 
 def post_to_reddit(account, content, base_dir):
     """
@@ -13,35 +33,19 @@ def post_to_reddit(account, content, base_dir):
             content = dict(content)
         
         # Decrypt and parse credentials
-        creds_encrypted = account['credentials']
-        creds_json = decrypt_data(creds_encrypted)
-        credentials = json.loads(creds_json)
+        credentials = load_credentials(account)
         
         # Extract credentials
         client_id = credentials.get('client_id')
         client_secret = credentials.get('client_secret')
         username = credentials.get('username')
         password = credentials.get('password')
-        user_agent = credentials.get('user_agent', 'script:bot2:v1.0 (by /u/Leather_Emu4253)')
         
         if not all([client_id, client_secret, username, password]):
             raise ValueError("Missing Reddit credentials. Need client_id, client_secret, username, and password.")
         
-        # Initialize Reddit instance
-        reddit = praw.Reddit(
-            client_id=client_id,
-            client_secret=client_secret,
-            username=username,
-            password=password,
-            user_agent=user_agent
-        )
-        
-        # Verify authentication
-        try:
-            reddit.user.me()
-            print(f"[Reddit API] Successfully authenticated as: {reddit.user.me()}")
-        except Exception as e:
-            raise Exception(f"Reddit authentication failed: {e}")
+        # Reuse this account's Reddit instance (PRAW is not thread-safe, so one per worker thread)
+        reddit = get_client('reddit', account, credentials, _build_reddit_client, per_thread=True)
         
         # Prepare post content
         title = content.get('title', 'No Title')
@@ -79,18 +83,19 @@ def post_to_reddit(account, content, base_dir):
         
         # Post to Reddit
         try:
-            if post_text.strip():
-                # Text post
-                submission = subreddit.submit(
-                    title=title,
-                    selftext=post_text
-                )
-            else:
-                # Link post (just title)
-                submission = subreddit.submit(
-                    title=title,
-                    url="https://www.reddit.com"
-                )
+            with errors.publish_call():
+                if post_text.strip():
+                    # Text post
+                    submission = subreddit.submit(
+                        title=title,
+                        selftext=post_text
+                    )
+                else:
+                    # Link post (just title)
+                    submission = subreddit.submit(
+                        title=title,
+                        url="https://www.reddit.com"
+                    )
             
             print(f"[Reddit API] Post successful! URL: {submission.url}")
             return {
@@ -133,4 +138,20 @@ def test_reddit_connection(credentials):
         
     except Exception as e:
         print(f"[Reddit Test] Error: {e}")
-        return False 
\ No newline at end of file
+        return False 
+
+def classify_error(exc):
+    """Classifies PRAW errors for the scheduler's retry queue (see errors.py)."""
+    if isinstance(exc, praw.exceptions.RedditAPIException):
+        # "You are doing that too much" comes back as an API error, not a 429
+        if any(item.error_type == 'RATELIMIT' for item in exc.items):
+            return errors.RATE_LIMITED
+        return errors.INVALID_REQUEST
+    if isinstance(exc, prawcore.exceptions.RequestException):
+        # Network errors; whether the request was sent depends on the underlying exception
+        return errors.classify_generic(exc.original_exception) or errors.CONNECTION
+    if isinstance(exc, prawcore.exceptions.OAuthException):
+        return errors.AUTH
+    return None
+
+errors.register_classifier('reddit', classify_error)
@@ -0,0 +1,720 @@
+"""
+Data access for platforms, accounts, content and users.
+
+Every function takes a connection from db.get_db() and works on both storage
+backends (SQLite and PostgreSQL). Callers own the transaction: functions that
+write do not commit.
+"""
+import time
+
+from security import load_credentials, invalidate_credentials
+
+# Account columns that are safe to expose in listings (no credentials)
+ACCOUNT_PUBLIC_COLUMNS = 'id, platform_id, name, created_at, updated_at'
+
+# Content columns that listings can be projected to
+CONTENT_COLUMNS = ('id', 'account_id', 'title', 'description', 'hashtags', 'media_path', 'schedule_time',
+                   'schedule_epoch', 'status', 'error', 'created_at', 'claimed_by', 'lease_expires_at',
+                   'attempts', 'next_attempt_at', 'error_class', 'campaign_id', 'external_id')
+
+# Columns of the content_details view (see db.py): content with its account and platform
+CONTENT_DETAIL_COLUMNS = CONTENT_COLUMNS + ('account_name', 'platform_id', 'platform')
+
+def _insert_returning_id(conn, sql, params):
+    """Runs an INSERT and returns the new row id on either backend."""
+    if conn.backend == 'postgres':
+        return conn.execute(f'{sql} RETURNING id', params).fetchone()[0]
+    return conn.execute(sql, params).lastrowid
+
+def _placeholders(values):
+    return ','.join(['?'] * len(values))
+
+# Most values of an IN filter that a keyset page reads as separate index ranges
+_MAX_KEYSET_BRANCHES = 50
+
+def _keyset_page(conn, query, where, params, after_id=None, descending=False, limit=None, any_of=None):
+    """
+    Finishes a listing query ordered by id. Pages are read by keyset: the next page
+    starts after the last id of the previous one, so each page costs the same
+    however deep into the table it is.
+
+    any_of=(column, values) filters on column IN values. A database can only walk an
+    index in id order for a single value, so a page over several values is a UNION
+    ALL of one page per value (each read from a (column, id) index), merged by id.
+    """
+    if after_id is not None:
+        where.append('id < ?' if descending else 'id > ?')
+        params.append(after_id)
+    order = ' ORDER BY id DESC' if descending else ' ORDER BY id'
+    if any_of and limit is not None and 1 < len(any_of[1]) <= _MAX_KEYSET_BRANCHES:
+        column, values = any_of
+        branch_where = ' AND '.join([f'{column}=?'] + where)
+        branches = [f'SELECT * FROM ({query} WHERE {branch_where}{order} LIMIT ?) AS page_{i}'
+                    for i in range(len(values))]
+        branch_params = [param for value in values for param in [value, *params, limit]]
+        return conn.execute(' UNION ALL '.join(branches) + order + ' LIMIT ?', branch_params + [limit]).fetchall()
+    if any_of:
+        column, values = any_of
+        where.insert(0, f'{column} IN ({_placeholders(values)})')
+        params[:0] = values
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    query += order
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return conn.execute(query, params).fetchall()
+
+# --- Platforms ---
+def list_platforms(conn):
+    return conn.execute('SELECT * FROM platforms ORDER BY id').fetchall()
+
+def get_platform(conn, platform_id):
+    return conn.execute('SELECT * FROM platforms WHERE id=?', (platform_id,)).fetchone()
+
+def get_platform_by_name(conn, name):
+    return conn.execute('SELECT * FROM platforms WHERE name=?', (name,)).fetchone()
+
+# --- Accounts ---
+def list_accounts(conn, platform_id=None, after_id=None, limit=None, columns=None):
+    """
+    Lists accounts without their credentials, optionally for a single platform.
+    `columns` projects to a subset of ACCOUNT_PUBLIC_COLUMNS; see _keyset_page for paging.
+    """
+    query = f"SELECT {', '.join(columns) if columns else ACCOUNT_PUBLIC_COLUMNS} FROM accounts"
+    where, params = [], []
+    if platform_id:
+        where.append('platform_id=?')
+        params.append(platform_id)
+    return _keyset_page(conn, query, where, params, after_id, limit=limit)
+
+def get_account(conn, account_id):
+    return conn.execute('SELECT * FROM accounts WHERE id=?', (account_id,)).fetchone()
+
+def get_accounts_with_platform(conn, account_ids):
+    """Returns {account_id: account row with its platform's name as platform_name} in one query."""
+    if not account_ids:
+        return {}
+    rows = conn.execute(
+        f'''SELECT accounts.*, platforms.name AS platform_name FROM accounts
+            LEFT JOIN platforms ON platforms.id = accounts.platform_id
+            WHERE accounts.id IN ({_placeholders(account_ids)})''',
+        list(account_ids)
+    ).fetchall()
+    return {row['id']: row for row in rows}
+
+def find_account_by_name(conn, platform_id, name):
+    return conn.execute('SELECT * FROM accounts WHERE platform_id=? AND name=?', (platform_id, name)).fetchone()
+
+def find_account_by_credential(conn, platform_id, field, value):
+    """
+    Finds an account of a platform whose decrypted credentials have `field` == `value`.
+    Credentials are encrypted at rest, so this cannot be done in SQL.
+    """
+    for account in conn.execute('SELECT * FROM accounts WHERE platform_id=?', (platform_id,)).fetchall():
+        try:
+            credentials = load_credentials(account)
+        except Exception:
+            continue
+        if isinstance(credentials, dict) and credentials.get(field) == value:
+            return account
+    return None
+
+def create_account(conn, platform_id, name, encrypted_credentials, created_at):
+    return _insert_returning_id(
+        conn,
+        'INSERT INTO accounts (platform_id, name, credentials, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+        (platform_id, name, encrypted_credentials, created_at, created_at)
+    )
+
+def update_account(conn, account_id, name, encrypted_credentials, updated_at):
+    conn.execute('UPDATE accounts SET name=?, credentials=?, updated_at=? WHERE id=?',
+                 (name, encrypted_credentials, updated_at, account_id))
+    invalidate_credentials(account_id)
+
+def delete_account(conn, account_id):
+    """Deletes an account and returns the number of rows removed."""
+    deleted = conn.execute('DELETE FROM accounts WHERE id=?', (account_id,)).rowcount
+    invalidate_credentials(account_id)
+    return deleted
+
+def delete_accounts_for_platform(conn, platform_id):
+    for account in conn.execute('SELECT id FROM accounts WHERE platform_id=?', (platform_id,)).fetchall():
+        invalidate_credentials(account['id'])
+    conn.execute('DELETE FROM accounts WHERE platform_id=?', (platform_id,))
+
+def add_account_binding(conn, account_id, binding_type, binding_value):
+    conn.execute('INSERT INTO account_bindings (account_id, binding_type, binding_value) VALUES (?, ?, ?)',
+                 (account_id, binding_type, binding_value))
+
+# --- Content ---
+def list_content(conn, account_ids=None, platform_id=None, statuses=None, scheduled_from=None,
+                 scheduled_until=None, after_id=None, descending=False, limit=None, columns=None,
+                 details=False):
+    """
+    Lists content, optionally restricted to a list of account ids, a platform, some
+    statuses and a range of schedule epochs (inclusive). `columns` projects to a
+    subset of the content columns; see _keyset_page for paging. With details, rows
+    come from content_details and also carry account_name, platform_id and platform.
+    """
+    if platform_id is not None:
+        requested = None if account_ids is None else {str(account_id) for account_id in account_ids}
+        account_ids = [row['id'] for row in list_accounts(conn, platform_id, columns=['id'])
+                       if requested is None or str(row['id']) in requested]
+    if account_ids is not None and not account_ids:
+        return []
+    query = f"SELECT {', '.join(columns) if columns else '*'} FROM {'content_details' if details else 'content'}"
+    where, params = [], []
+    # Page by account when filtering on accounts, else by status
+    any_of = ('account_id', list(account_ids)) if account_ids is not None else None
+    if statuses:
+        if any_of is None:
+            any_of = ('status', list(statuses))
+        else:
+            where.append(f'status IN ({_placeholders(statuses)})')
+            params.extend(statuses)
+    if scheduled_from is not None:
+        where.append('schedule_epoch >= ?')
+        params.append(scheduled_from)
+    if scheduled_until is not None:
+        where.append('schedule_epoch <= ?')
+        params.append(scheduled_until)
+    return _keyset_page(conn, query, where, params, after_id, descending, limit, any_of)
+
+def create_content(conn, account_id, title, description, hashtags, media_path, schedule_time,
+                   schedule_epoch, created_at, campaign_id=None):
+    content_id = _insert_returning_id(
+        conn,
+        '''INSERT INTO content (account_id, title, description, hashtags,
+           media_path, schedule_time, schedule_epoch, created_at, campaign_id)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (account_id, title, description, hashtags, media_path, schedule_time, schedule_epoch, created_at, campaign_id)
+    )
+    if media_path:
+        add_media_references(conn, media_path, 1)
+    return content_id
+
+def delete_content(conn, content_id):
+    """Deletes a post and drops its media reference. Returns the number of rows removed."""
+    row = conn.execute('SELECT media_path FROM content WHERE id=?', (content_id,)).fetchone()
+    deleted = conn.execute('DELETE FROM content WHERE id=?', (content_id,)).rowcount
+    if deleted and row['media_path']:
+        release_media_references(conn, row['media_path'], 1)
+    return deleted
+
+def delete_content_for_account(conn, account_id):
+    media_counts = conn.execute(
+        "SELECT media_path, COUNT(*) AS n FROM content WHERE account_id=? AND media_path <> '' GROUP BY media_path",
+        (account_id,)
+    ).fetchall()
+    conn.execute('DELETE FROM content WHERE account_id=?', (account_id,))
+    for row in media_counts:
+        release_media_references(conn, row['media_path'], row['n'])
+
+def _skip_platforms_clause(skip_platforms):
+    """A filter leaving out posts of accounts on the given platforms, with its parameters."""
+    if not skip_platforms:
+        return '', []
+    return (f' AND account_id NOT IN (SELECT accounts.id FROM accounts JOIN platforms ON platforms.id = accounts.platform_id'
+            f' WHERE platforms.name IN ({_placeholders(skip_platforms)}))', list(skip_platforms))
+
+def claim_due_content(conn, worker_id, now_epoch, lease_expires_at, limit, skip_platforms=()):
+    """
+    Atomically claims up to `limit` posts that are pending and due, waiting in
+    'retrying' with next_attempt_at passed, or stuck in 'processing' with an
+    expired lease, and returns them as dicts. Posts of accounts on skip_platforms
+    are left for later. Each dict also
+    carries the row's `previous_status` and `previous_claimed_by`. Does not commit.
+
+    PostgreSQL claims the batch in one statement with FOR UPDATE SKIP LOCKED, so
+    concurrent workers skip each other's rows instead of waiting on them. SQLite
+    has a single writer, so each row is claimed with a conditional UPDATE that
+    re-checks it is still claimable and due: the candidates are read outside the
+    write, and another worker may have claimed and deferred a post since.
+    """
+    skip_clause, skip_params = _skip_platforms_clause(skip_platforms)
+    if conn.backend == 'postgres':
+        rows = conn.execute(
+            f'''WITH candidates AS (
+                   SELECT id, status AS previous_status, claimed_by AS previous_claimed_by
+                   FROM content
+                   WHERE ((status='pending' AND schedule_epoch <= ?)
+                          OR (status='retrying' AND next_attempt_at <= ?)
+                          OR (status='processing' AND lease_expires_at < ?)){skip_clause}
+                   ORDER BY schedule_epoch
+                   LIMIT ?
+                   FOR UPDATE SKIP LOCKED
+               )
+               UPDATE content SET status='processing', claimed_by=?, lease_expires_at=?
+               FROM candidates WHERE content.id = candidates.id
+               RETURNING content.*, candidates.previous_status, candidates.previous_claimed_by''',
+            [now_epoch, now_epoch, now_epoch] + skip_params + [limit, worker_id, lease_expires_at]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    candidates = conn.execute(
+        f"SELECT * FROM content WHERE status='pending' AND schedule_epoch <= ?{skip_clause} "
+        "ORDER BY schedule_epoch LIMIT ?",
+        [now_epoch] + skip_params + [limit]
+    ).fetchall()
+    if len(candidates) < limit:
+        candidates += conn.execute(
+            f"SELECT * FROM content WHERE status='retrying' AND next_attempt_at <= ?{skip_clause} "
+            "ORDER BY next_attempt_at LIMIT ?",
+            [now_epoch] + skip_params + [limit - len(candidates)]
+        ).fetchall()
+    if len(candidates) < limit:
+        candidates += conn.execute(
+            f"SELECT * FROM content WHERE status='processing' AND lease_expires_at < ?{skip_clause} "
+            "ORDER BY lease_expires_at LIMIT ?",
+            [now_epoch] + skip_params + [limit - len(candidates)]
+        ).fetchall()
+
+    claimed = []
+    for row in candidates:
+        cursor = conn.execute(
+            """UPDATE content SET status='processing', claimed_by=?, lease_expires_at=?
+               WHERE id=? AND ((status='pending' AND schedule_epoch <= ?)
+                               OR (status='retrying' AND next_attempt_at <= ?)
+                               OR (status='processing' AND lease_expires_at < ?))""",
+            (worker_id, lease_expires_at, row['id'], now_epoch, now_epoch, now_epoch)
+        )
+        if cursor.rowcount == 1:
+            post = dict(row)
+            post.update(previous_status=row['status'], previous_claimed_by=row['claimed_by'],
+                        status='processing', claimed_by=worker_id, lease_expires_at=lease_expires_at)
+            claimed.append(post)
+    return claimed
+
+def claim_campaign_targets(conn, worker_id, now_epoch, lease_expires_at, campaign_ids):
+    """
+    Atomically claims every pending, due target of the given campaigns, however
+    many there are, and returns them like claim_due_content. Used to finish off
+    campaigns that a claim limit cut in two. Does not commit.
+    """
+    if not campaign_ids:
+        return []
+    campaign_ids = list(campaign_ids)
+    if conn.backend == 'postgres':
+        rows = conn.execute(
+            f'''WITH candidates AS (
+                   SELECT id, status AS previous_status, claimed_by AS previous_claimed_by
+                   FROM content
+                   WHERE campaign_id IN ({_placeholders(campaign_ids)}) AND status='pending' AND schedule_epoch <= ?
+                   FOR UPDATE SKIP LOCKED
+               )
+               UPDATE content SET status='processing', claimed_by=?, lease_expires_at=?
+               FROM candidates WHERE content.id = candidates.id
+               RETURNING content.*, candidates.previous_status, candidates.previous_claimed_by''',
+            campaign_ids + [now_epoch, worker_id, lease_expires_at]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    candidates = conn.execute(
+        f"SELECT * FROM content WHERE campaign_id IN ({_placeholders(campaign_ids)}) AND status='pending' "
+        "AND schedule_epoch <= ? ORDER BY id",
+        campaign_ids + [now_epoch]
+    ).fetchall()
+    claimed = []
+    for row in candidates:
+        cursor = conn.execute(
+            "UPDATE content SET status='processing', claimed_by=?, lease_expires_at=? "
+            "WHERE id=? AND status='pending' AND schedule_epoch <= ?",
+            (worker_id, lease_expires_at, row['id'], now_epoch)
+        )
+        if cursor.rowcount == 1:
+            post = dict(row)
+            post.update(previous_status='pending', previous_claimed_by=None,
+                        status='processing', claimed_by=worker_id, lease_expires_at=lease_expires_at)
+            claimed.append(post)
+    return claimed
+
+def finish_content(conn, content_id, worker_id, status, error=None, error_class=None, attempts=None,
+                   external_id=None):
+    """
+    Records the final status of a claimed post and releases its lease, only while
+    `worker_id` still holds it. `attempts` is left unchanged when None; external_id
+    is the platform's id for the published post. Returns the number of rows
+    updated. Does not commit.
+    """
+    return conn.execute(
+        "UPDATE content SET status=?, error=?, error_class=?, attempts=COALESCE(?, attempts), next_attempt_at=NULL, "
+        "external_id=COALESCE(?, external_id), claimed_by=NULL, lease_expires_at=NULL WHERE id=? AND claimed_by=?",
+        (status, error, error_class, attempts, external_id, content_id, worker_id)
+    ).rowcount
+
+def retry_content(conn, content_id, worker_id, attempts, next_attempt_at, error, error_class):
+    """
+    Puts a claimed post that failed with a retryable error into 'retrying' until
+    next_attempt_at and releases its lease, only while `worker_id` still holds it.
+    Does not commit.
+    """
+    return conn.execute(
+        "UPDATE content SET status='retrying', attempts=?, next_attempt_at=?, error=?, error_class=?, "
+        "claimed_by=NULL, lease_expires_at=NULL WHERE id=? AND claimed_by=?",
+        (attempts, next_attempt_at, error, error_class, content_id, worker_id)
+    ).rowcount
+
+def defer_content(conn, content_id, worker_id, schedule_epoch):
+    """
+    Puts a claimed post back to 'pending' at a later schedule_epoch and releases
+    its lease, only while `worker_id` still holds it. schedule_time keeps the
+    originally requested time. Does not commit.
+    """
+    return conn.execute(
+        "UPDATE content SET status='pending', schedule_epoch=?, next_attempt_at=NULL, claimed_by=NULL, "
+        "lease_expires_at=NULL WHERE id=? AND claimed_by=?",
+        (schedule_epoch, content_id, worker_id)
+    ).rowcount
+
+def requeue_content(conn, content_id, now_epoch):
+    """
+    Returns a failed ('error', 'dead' or 'retrying') post to 'pending', due now,
+    with its attempts reset. Returns the number of rows updated. Does not commit.
+    """
+    return conn.execute(
+        "UPDATE content SET status='pending', schedule_epoch=?, attempts=0, next_attempt_at=NULL, "
+        "error=NULL, error_class=NULL WHERE id=? AND status IN ('error', 'dead', 'retrying')",
+        (now_epoch, content_id)
+    ).rowcount
+
+def next_due_epoch(conn, skip_platforms=()):
+    """
+    Returns the epoch at which the scheduler next has work: the earliest pending
+    schedule_epoch, retry or expiring lease, leaving out posts on skip_platforms.
+    All are index lookups. None when idle.
+    """
+    skip_clause, skip_params = _skip_platforms_clause(skip_platforms)
+    candidates = [
+        conn.execute(f"SELECT MIN(schedule_epoch) FROM content WHERE status='pending'{skip_clause}",
+                     skip_params).fetchone()[0],
+        conn.execute(f"SELECT MIN(next_attempt_at) FROM content WHERE status='retrying'{skip_clause}",
+                     skip_params).fetchone()[0],
+        conn.execute(f"SELECT MIN(lease_expires_at) FROM content WHERE status='processing'{skip_clause}",
+                     skip_params).fetchone()[0],
+    ]
+    candidates = [epoch for epoch in candidates if epoch is not None]
+    return min(candidates) if candidates else None
+
+def oldest_waiting_epoch(conn):
+    """
+    Returns the epoch at which the post that has waited longest fell due: the
+    earliest pending schedule_epoch or retry. Index lookups. None when nothing waits.
+    """
+    candidates = [
+        conn.execute("SELECT MIN(schedule_epoch) FROM content WHERE status='pending'").fetchone()[0],
+        conn.execute("SELECT MIN(next_attempt_at) FROM content WHERE status='retrying'").fetchone()[0],
+    ]
+    candidates = [epoch for epoch in candidates if epoch is not None]
+    return min(candidates) if candidates else None
+
+# --- Rate limits ---
+# Token buckets shared by every worker. Tokens are refilled lazily from updated_at,
+# so each operation is a single conditional UPDATE that is atomic on both backends.
+_REFILLED_TOKENS = ('(CASE WHEN tokens + (? - updated_at) * refill_per_second > capacity '
+                    'THEN capacity ELSE tokens + (? - updated_at) * refill_per_second END)')
+
+def ensure_rate_limit_bucket(conn, bucket_key, capacity, refill_per_second, now_epoch):
+    """Creates a full bucket, or applies a changed capacity/refill rate to an existing one."""
+    conn.execute(
+        '''INSERT INTO rate_limits (bucket_key, tokens, capacity, refill_per_second, updated_at, blocked_until)
+           VALUES (?, ?, ?, ?, ?, 0)
+           ON CONFLICT (bucket_key) DO UPDATE SET capacity=excluded.capacity,
+               refill_per_second=excluded.refill_per_second''',
+        (bucket_key, capacity, capacity, refill_per_second, now_epoch)
+    )
+
+def get_rate_limit_bucket(conn, bucket_key):
+    return conn.execute('SELECT * FROM rate_limits WHERE bucket_key=?', (bucket_key,)).fetchone()
+
+def take_rate_limit_token(conn, bucket_key, now_epoch):
+    """Takes one token if the bucket has one and is not blocked. Returns True on success."""
+    return conn.execute(
+        f'''UPDATE rate_limits SET tokens={_REFILLED_TOKENS} - 1, updated_at=?
+            WHERE bucket_key=? AND blocked_until <= ? AND tokens + (? - updated_at) * refill_per_second >= 1''',
+        (now_epoch, now_epoch, now_epoch, bucket_key, now_epoch, now_epoch)
+    ).rowcount == 1
+
+def return_rate_limit_token(conn, bucket_key):
+    conn.execute('UPDATE rate_limits SET tokens=tokens + 1 WHERE bucket_key=?', (bucket_key,))
+
+def cap_rate_limit_tokens(conn, bucket_key, remaining, now_epoch):
+    """Lowers a bucket to the remaining quota a platform reported, if that is less than we think."""
+    conn.execute(
+        f'''UPDATE rate_limits SET tokens=(CASE WHEN {_REFILLED_TOKENS} > ? THEN ? ELSE {_REFILLED_TOKENS} END),
+               updated_at=?
+            WHERE bucket_key=?''',
+        (now_epoch, now_epoch, remaining, remaining, now_epoch, now_epoch, now_epoch, bucket_key)
+    )
+
+def block_rate_limit_bucket(conn, bucket_key, until_epoch):
+    """Blocks a bucket until the given epoch (never shortens an existing block)."""
+    conn.execute(
+        'UPDATE rate_limits SET blocked_until=(CASE WHEN blocked_until > ? THEN blocked_until ELSE ? END) WHERE bucket_key=?',
+        (until_epoch, until_epoch, bucket_key)
+    )
+
+# --- Statistics ---
+# content_stats and content_outcomes are maintained by triggers on content (see db.py)
+def list_content_stats(conn):
+    """Post counts per account and status, with the account's platform."""
+    return conn.execute(
+        '''SELECT content_stats.account_id, accounts.name AS account_name, platforms.name AS platform,
+                  content_stats.status, content_stats.posts
+           FROM content_stats
+           JOIN accounts ON accounts.id = content_stats.account_id
+           JOIN platforms ON platforms.id = accounts.platform_id
+           WHERE content_stats.posts > 0'''
+    ).fetchall()
+
+def list_content_outcomes(conn, since_epoch):
+    """Publish results per account and status in the hourly buckets starting at or after since_epoch."""
+    return conn.execute(
+        '''SELECT content_outcomes.account_id, platforms.name AS platform, content_outcomes.status,
+                  SUM(content_outcomes.posts) AS posts
+           FROM content_outcomes
+           JOIN accounts ON accounts.id = content_outcomes.account_id
+           JOIN platforms ON platforms.id = accounts.platform_id
+           WHERE content_outcomes.bucket_epoch >= ?
+           GROUP BY content_outcomes.account_id, platforms.name, content_outcomes.status''',
+        (since_epoch,)
+    ).fetchall()
+
+def prune_content_outcomes(conn, before_epoch):
+    """Drops hourly publish results older than before_epoch. Does not commit."""
+    return conn.execute('DELETE FROM content_outcomes WHERE bucket_epoch < ?', (before_epoch,)).rowcount
+
+def rebuild_content_stats(conn):
+    """Recounts content_stats from the content table. Does not commit."""
+    if conn.backend == 'postgres':
+        # Keep writers (and their triggers) out until the recount commits
+        conn.execute('LOCK TABLE content IN SHARE MODE')
+    conn.execute('DELETE FROM content_stats')
+    conn.execute(
+        '''INSERT INTO content_stats (account_id, status, posts)
+           SELECT account_id, status, COUNT(*) FROM content WHERE status IS NOT NULL GROUP BY account_id, status'''
+    )
+
+# --- Post events ---
+# Append-only; 'enqueued' is written by triggers on content (see db.py), the rest by post_events.py
+POST_EVENT_COLUMNS = ('content_id', 'attempt', 'event', 'occurred_at', 'due_at', 'platform', 'worker_id',
+                      'error_class')
+
+def add_post_events(conn, rows):
+    """Inserts events given as tuples in POST_EVENT_COLUMNS order. Does not commit."""
+    conn.executemany(
+        f'INSERT INTO post_events ({", ".join(POST_EVENT_COLUMNS)}) VALUES ({_placeholders(POST_EVENT_COLUMNS)})',
+        rows
+    )
+
+def list_post_events(conn, content_id):
+    """A post's events, oldest first."""
+    return conn.execute(
+        f'SELECT id, {", ".join(POST_EVENT_COLUMNS)} FROM post_events WHERE content_id=? ORDER BY occurred_at, id',
+        (content_id,)
+    ).fetchall()
+
+def list_post_events_for_results(conn, since_epoch, until_epoch, result_events, platform=None):
+    """
+    Every event of the posts with a result event between since_epoch and until_epoch
+    (optionally on one platform), ordered by post and time.
+    """
+    params = list(result_events) + [since_epoch, until_epoch]
+    platform_clause = ''
+    if platform:
+        platform_clause = ' AND platform = ?'
+        params.append(platform)
+    return conn.execute(
+        f'''SELECT {", ".join(POST_EVENT_COLUMNS)} FROM post_events
+            WHERE content_id IN (
+                SELECT content_id FROM post_events
+                WHERE event IN ({_placeholders(result_events)}) AND occurred_at >= ? AND occurred_at < ?{platform_clause})
+            ORDER BY content_id, occurred_at, id''',
+        params
+    ).fetchall()
+
+def prune_post_events(conn, before_epoch):
+    """Drops events older than before_epoch. Does not commit."""
+    return conn.execute('DELETE FROM post_events WHERE occurred_at < ?', (before_epoch,)).rowcount
+
+# --- Campaigns ---
+def create_campaign(conn, title, description, hashtags, media_path, schedule_time, schedule_epoch, created_at):
+    return _insert_returning_id(
+        conn,
+        '''INSERT INTO campaigns (title, description, hashtags, media_path, schedule_time, schedule_epoch, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        (title, description, hashtags, media_path, schedule_time, schedule_epoch, created_at)
+    )
+
+def get_campaign(conn, campaign_id):
+    return conn.execute('SELECT * FROM campaigns WHERE id=?', (campaign_id,)).fetchone()
+
+def list_campaigns(conn):
+    return conn.execute('SELECT * FROM campaigns ORDER BY id').fetchall()
+
+def count_campaign_targets_by_status(conn, campaign_ids):
+    """Returns {campaign_id: {status: count}} for the given campaigns."""
+    counts = {campaign_id: {} for campaign_id in campaign_ids}
+    if not campaign_ids:
+        return counts
+    rows = conn.execute(
+        f'''SELECT campaign_id, status, COUNT(*) AS n FROM content
+            WHERE campaign_id IN ({_placeholders(campaign_ids)}) GROUP BY campaign_id, status''',
+        list(campaign_ids)
+    ).fetchall()
+    for row in rows:
+        counts[row['campaign_id']][row['status']] = row['n']
+    return counts
+
+def list_campaign_targets(conn, campaign_id):
+    """A campaign's delivery targets with their account and platform names."""
+    return conn.execute(
+        '''SELECT id, account_id, account_name, platform, status, error, error_class, attempts,
+                  next_attempt_at, external_id
+           FROM content_details WHERE campaign_id=? ORDER BY id''',
+        (campaign_id,)
+    ).fetchall()
+
+def delete_campaign(conn, campaign_id):
+    """Deletes a campaign and its targets. Returns the number of campaigns removed. Does not commit."""
+    for row in conn.execute('SELECT id FROM content WHERE campaign_id=?', (campaign_id,)).fetchall():
+        delete_content(conn, row['id'])
+    return conn.execute('DELETE FROM campaigns WHERE id=?', (campaign_id,)).rowcount
+
+def create_content_rows(conn, rows):
+    """
+    Inserts many posts with one executemany. Each row is (account_id, title,
+    description, hashtags, media_path, schedule_time, schedule_epoch, created_at).
+    Media references are added per distinct path. Does not commit.
+    """
+    conn.executemany(
+        '''INSERT INTO content (account_id, title, description, hashtags,
+           media_path, schedule_time, schedule_epoch, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        rows
+    )
+    references = {}
+    for row in rows:
+        if row[4]:
+            references[row[4]] = references.get(row[4], 0) + 1
+    for media_path, count in references.items():
+        add_media_references(conn, media_path, count)
+
+def find_existing_account_ids(conn, account_ids):
+    if not account_ids:
+        return set()
+    rows = conn.execute(f'SELECT id FROM accounts WHERE id IN ({_placeholders(account_ids)})', list(account_ids))
+    return {row['id'] for row in rows.fetchall()}
+
+# --- Media assets ---
+# refcount follows the number of content rows whose media_path is the asset's path;
+# create_content and the delete_content functions keep it in step in the same transaction.
+def get_media_asset(conn, sha256):
+    return conn.execute('SELECT * FROM media_assets WHERE sha256=?', (sha256,)).fetchone()
+
+def upsert_media_asset(conn, sha256, path, size, now_epoch):
+    """Records a stored file, or marks an existing asset as in use again so GC keeps it."""
+    conn.execute(
+        '''INSERT INTO media_assets (sha256, path, size, refcount, created_at, updated_at)
+           VALUES (?, ?, ?, 0, ?, ?)
+           ON CONFLICT (sha256) DO UPDATE SET updated_at=excluded.updated_at, released_at=NULL''',
+        (sha256, path, size, now_epoch, now_epoch)
+    )
+
+def find_media_paths(conn, sha256s, paths):
+    """Maps each given hash or stored path that is in the media store to its path."""
+    found = {}
+    if sha256s:
+        for row in conn.execute(f'SELECT sha256, path FROM media_assets WHERE sha256 IN ({_placeholders(sha256s)})',
+                                list(sha256s)).fetchall():
+            found[row['sha256']] = row['path']
+    if paths:
+        for row in conn.execute(f'SELECT path FROM media_assets WHERE path IN ({_placeholders(paths)})',
+                                list(paths)).fetchall():
+            found[row['path']] = row['path']
+    return found
+
+def add_media_references(conn, media_path, count):
+    conn.execute('UPDATE media_assets SET refcount=refcount + ?, released_at=NULL WHERE path=?', (count, media_path))
+
+def release_media_references(conn, media_path, count):
+    """Drops references to an asset, stamping released_at when the last one goes."""
+    conn.execute(
+        '''UPDATE media_assets SET refcount=refcount - ?,
+               released_at=(CASE WHEN refcount - ? <= 0 THEN ? ELSE released_at END)
+           WHERE path=?''',
+        (count, count, time.time(), media_path)
+    )
+
+# An asset is collectable once its last reference was released, or when it was stored
+# but never referenced before `orphaned_before` (e.g. an upload that was never scheduled)
+_COLLECTABLE_MEDIA = 'refcount <= 0 AND (released_at IS NOT NULL OR updated_at < ?)'
+
+def list_collectable_media_assets(conn, orphaned_before):
+    return conn.execute(f'SELECT * FROM media_assets WHERE {_COLLECTABLE_MEDIA}', (orphaned_before,)).fetchall()
+
+def delete_media_asset(conn, sha256, orphaned_before):
+    """Deletes an asset row only if it is still collectable. Returns the number of rows removed."""
+    return conn.execute(f'DELETE FROM media_assets WHERE sha256=? AND {_COLLECTABLE_MEDIA}',
+                        (sha256, orphaned_before)).rowcount
+
+def list_unstored_media_paths(conn):
+    """Distinct local content media paths that are not in the media store (older uploads)."""
+    return [row[0] for row in conn.execute(
+        '''SELECT DISTINCT media_path FROM content
+           WHERE media_path <> '' AND media_path NOT IN (SELECT path FROM media_assets)'''
+    ).fetchall()]
+
+def replace_content_media_path(conn, old_path, new_path):
+    """Points every post using old_path at new_path and returns how many were moved."""
+    moved = conn.execute('UPDATE content SET media_path=? WHERE media_path=?', (new_path, old_path)).rowcount
+    add_media_references(conn, new_path, moved)
+    return moved
+
+# --- Uploads ---
+def create_upload(conn, upload_id, filename, total_size, now_epoch):
+    conn.execute(
+        'INSERT INTO uploads (id, filename, total_size, received, created_at, updated_at) VALUES (?, ?, ?, 0, ?, ?)',
+        (upload_id, filename, total_size, now_epoch, now_epoch)
+    )
+
+def get_upload(conn, upload_id):
+    return conn.execute('SELECT * FROM uploads WHERE id=?', (upload_id,)).fetchone()
+
+def advance_upload(conn, upload_id, offset, received, chunk_id, now_epoch):
+    """
+    Moves an upload's committed offset from `offset` to `received`, only if no other
+    request moved it first. Returns the number of rows updated. Does not commit.
+    """
+    return conn.execute(
+        "UPDATE uploads SET received=?, last_chunk_id=?, last_chunk_offset=?, updated_at=? "
+        "WHERE id=? AND received=? AND status='uploading'",
+        (received, chunk_id, offset, now_epoch, upload_id, offset)
+    ).rowcount
+
+def complete_upload(conn, upload_id, sha256, media_path, now_epoch):
+    return conn.execute(
+        "UPDATE uploads SET status='complete', sha256=?, media_path=?, updated_at=? WHERE id=? AND status='uploading'",
+        (sha256, media_path, now_epoch, upload_id)
+    ).rowcount
+
+def list_stale_uploads(conn, before_epoch):
+    """Uploads still in progress that have not received data since `before_epoch`."""
+    return conn.execute("SELECT * FROM uploads WHERE status='uploading' AND updated_at < ?", (before_epoch,)).fetchall()
+
+def delete_upload(conn, upload_id):
+    conn.execute('DELETE FROM uploads WHERE id=?', (upload_id,))
+
+# --- Users ---
+def get_user(conn, user_id):
+    return conn.execute('SELECT * FROM users WHERE id=?', (user_id,)).fetchone()
+
+def get_user_by_email(conn, email):
+    return conn.execute('SELECT * FROM users WHERE email=?', (email,)).fetchone()
+
+def create_user(conn, username, email, password_hash, created_at):
+    return _insert_returning_id(
+        conn,
+        'INSERT INTO users (username, email, password_hash, created_at) VALUES (?, ?, ?, ?)',
+        (username, email, password_hash, created_at)
+    )
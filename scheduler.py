@@ -1,93 +1,552 @@
 from datetime import datetime, timezone
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import random
+import socket
+import threading
+import time
 from dateutil.parser import isoparse
+from dateutil.tz import tzlocal
 import os
+import repository
+import rate_limit
+import errors
+import media_prep
+import metrics
+import post_events
+import stats
+from db import change_marker
+from async_engine import get_engine, get_async_concurrency
+
+# Maximum number of due posts fetched per scheduler tick
+SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', '100'))
+
+# Longest the scheduler sleeps without re-checking for due posts, and how often it
+# checks whether another process changed the content table while sleeping
+SCHEDULER_MAX_IDLE_SECONDS = float(os.getenv('SCHEDULER_MAX_IDLE_SECONDS', '300'))
+SCHEDULER_CHANGE_CHECK_SECONDS = float(os.getenv('SCHEDULER_CHANGE_CHECK_SECONDS', '1'))
+
+# How long a claimed post stays reserved for this worker before another worker
+# may reclaim it. Must comfortably exceed the slowest upload (e.g. large videos).
+SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', '1800'))
+
+# Posts that fail with a retryable error (timeouts, 5xx responses, rate limits; see errors.py) are
+# retried with exponential backoff: after the nth failure the post waits
+# RETRY_BACKOFF_SECONDS * 2**(n-1), capped at RETRY_BACKOFF_MAX_SECONDS, less up to half
+# of that as jitter. A post still failing after RETRY_MAX_ATTEMPTS attempts goes to 'dead'.
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BACKOFF_SECONDS = float(os.getenv('RETRY_BACKOFF_SECONDS', '60'))
+RETRY_BACKOFF_MAX_SECONDS = float(os.getenv('RETRY_BACKOFF_MAX_SECONDS', '3600'))
+
+def get_worker_id():
+    """Identifies this process in content.claimed_by (computed per call so forked workers differ)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+# Number of posts published concurrently per platform. Override per platform with
+# SCHEDULER_CONCURRENCY_<PLATFORM> (e.g. SCHEDULER_CONCURRENCY_YOUTUBE=1), or the
+# default for every platform with SCHEDULER_CONCURRENCY.
+DEFAULT_PLATFORM_CONCURRENCY = int(os.getenv('SCHEDULER_CONCURRENCY', '4'))
+PLATFORM_CONCURRENCY = {
+    'youtube': 2,  # Video uploads are bandwidth heavy
+}
+
+_platform_executors = {}
+_platform_executors_lock = threading.Lock()
+
+def get_platform_concurrency(platform_name):
+    """Returns the configured number of concurrent posts for a platform."""
+    override = os.getenv(f'SCHEDULER_CONCURRENCY_{platform_name.upper()}')
+    if override:
+        return max(1, int(override))
+    return PLATFORM_CONCURRENCY.get(platform_name, DEFAULT_PLATFORM_CONCURRENCY)
+
+def get_platform_executor(platform_name):
+    """
+    Returns the bounded thread pool used to publish posts for a platform, so a slow
+    upload on one platform never holds up posts for the others.
+    """
+    with _platform_executors_lock:
+        executor = _platform_executors.get(platform_name)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=get_platform_concurrency(platform_name),
+                thread_name_prefix=f'publish-{platform_name}'
+            )
+            _platform_executors[platform_name] = executor
+        return executor
+
+# Posts handed to a platform's thread pool or the async engine and not finished yet,
+# per platform. A pass only claims posts for platforms with a free slot and does not
+# wait for them, so a slow upload on one platform never holds back the others.
+_in_flight = {}
+_in_flight_changed = threading.Condition()
+
+def get_platform_capacity(platform_name, api_function):
+    """Posts a platform publishes at once: its thread pool size, or its limit on the async engine."""
+    if getattr(api_function, 'async_function', None):
+        return get_async_concurrency(platform_name)
+    return get_platform_concurrency(platform_name)
+
+def free_platform_slots(platform_apis):
+    """Returns {platform name: publishing slots not in use} for the configured platforms."""
+    with _in_flight_changed:
+        return {name: max(0, get_platform_capacity(name, api_function) - _in_flight.get(name, 0))
+                for name, api_function in platform_apis.items()}
+
+def posts_in_flight():
+    with _in_flight_changed:
+        return sum(_in_flight.values())
+
+def wait_for_posts_in_flight(timeout=None, fewer_than=1):
+    """
+    Blocks until fewer than `fewer_than` of the posts this process handed off are
+    still publishing (by default, until all have finished). Returns False on timeout.
+    """
+    with _in_flight_changed:
+        return _in_flight_changed.wait_for(lambda: sum(_in_flight.values()) < fewer_than, timeout)
+
+def _track_in_flight(platform_name, post_id, future):
+    """Counts a handed-off post against its platform until its future is done."""
+    with _in_flight_changed:
+        _in_flight[platform_name] = _in_flight.get(platform_name, 0) + 1
+    future.add_done_callback(lambda done: _post_finished(platform_name, post_id, done))
+
+def _post_finished(platform_name, post_id, future):
+    with _in_flight_changed:
+        _in_flight[platform_name] -= 1
+        _in_flight_changed.notify_all()
+    # publish_post handles adapter errors; anything raised here escaped it (e.g. recording the result)
+    error = None if future.cancelled() else future.exception()
+    if error is not None:
+        print(f"[Scheduler] Unexpected error publishing post ID {post_id} on {platform_name}: {error!r}")
+    # A slot is free again, so the platform's next due post can be claimed now
+    wake_scheduler()
+
+def parse_schedule_time(schedule_time_str):
+    """
+    Converts a schedule time submitted by a user to the UTC ISO string stored in
+    schedule_time (None when empty). Times without a timezone are taken as local
+    time. Raises ValueError.
+    """
+    if not schedule_time_str:
+        return None
+    dt = isoparse(schedule_time_str)
+    # If timezone info is missing, assume browser local tz (server may be UTC)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tzlocal())
+    return dt.astimezone(timezone.utc).isoformat()
+
+def to_schedule_epoch(schedule_time_str):
+    """
+    Converts a stored schedule_time ISO string into a UTC epoch (seconds) for the
+    indexed schedule_epoch column. Missing or malformed values map to 0 so the
+    post is picked up on the next tick, matching the previous behaviour.
+    """
+    if not schedule_time_str:
+        return 0
+    try:
+        sch_dt = isoparse(schedule_time_str)
+        # Ensure timezone aware (treat naive as UTC)
+        if sch_dt.tzinfo is None:
+            sch_dt = sch_dt.replace(tzinfo=timezone.utc)
+        return sch_dt.timestamp()
+    except (ValueError, OverflowError) as e:
+        print(f"[Scheduler] Failed to parse schedule_time '{schedule_time_str}': {e}. Treating as due immediately.")
+        return 0
+
+def claim_due_posts(conn, now_epoch, limit=SCHEDULER_BATCH_SIZE, skip_platforms=()):
+    """
+    Claims up to `limit` due posts for this worker and returns them, leaving
+    posts on skip_platforms for a later pass. The rest of the due targets of any
+    campaign claimed are claimed with it, past the limit and on full platforms
+    too (they queue for a slot), so a campaign is always published in one pass.
+
+    A post is claimable when it is pending and due, waiting to be retried and
+    past its next_attempt_at, or stuck in 'processing' with an expired lease (its
+    worker crashed or was killed). The claim is atomic on both storage backends (see repository.claim_due_content),
+    so when several workers race for the same post only one of them publishes it.
+    """
+    lease_expires_at = now_epoch + SCHEDULER_LEASE_SECONDS
+    claimed = repository.claim_due_content(conn, get_worker_id(), now_epoch, lease_expires_at, limit, skip_platforms)
+    campaign_ids = {post['campaign_id'] for post in claimed if post.get('campaign_id')}
+    claimed += repository.claim_campaign_targets(conn, get_worker_id(), now_epoch, lease_expires_at, campaign_ids)
+    conn.commit()
+    for post in claimed:
+        if post['previous_status'] == 'processing':
+            print(f"[Scheduler] Reclaiming post ID {post['id']} from expired lease held by {post['previous_claimed_by']}")
+    return claimed
+
+def finish_post(conn, post_id, status, error=None, error_class=None, attempts=None, external_id=None):
+    """
+    Records the final status of a claimed post and releases its lease. The update
+    only applies while this worker still holds the lease; returns whether it did.
+    """
+    finished = repository.finish_content(conn, post_id, get_worker_id(), status, error, error_class, attempts,
+                                         external_id) > 0
+    if not finished:
+        print(f"[Scheduler] Lease on post ID {post_id} was lost before its '{status}' status could be recorded.")
+    conn.commit()
+    return finished
+
+def defer_post(conn, post_id, schedule_epoch, reason):
+    """Returns a claimed post to 'pending' to be retried at schedule_epoch. Returns whether it did."""
+    deferred = repository.defer_content(conn, post_id, get_worker_id(), schedule_epoch) > 0
+    if not deferred:
+        print(f"[Scheduler] Lease on post ID {post_id} was lost before it could be deferred.")
+    else:
+        print(f"[Scheduler] Deferred post ID {post_id} until "
+              f"{datetime.fromtimestamp(schedule_epoch, timezone.utc).isoformat()}: {reason}")
+    conn.commit()
+    return deferred
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a post that has failed `attempts` times."""
+    delay = min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+def fail_post(conn, post, error, error_class, retryable):
+    """
+    Records a failed attempt at a claimed post. Retryable errors put the post in
+    'retrying' with a backoff until attempts run out, when it goes to the 'dead'
+    letter status; fatal errors mark it 'error' straight away. Returns the status
+    recorded, or None when the lease was lost.
+    """
+    attempts = (post.get('attempts') or 0) + 1
+    if retryable and attempts < RETRY_MAX_ATTEMPTS:
+        next_attempt_at = time.time() + retry_delay(attempts)
+        status = 'retrying'
+        if repository.retry_content(conn, post['id'], get_worker_id(), attempts, next_attempt_at, error, error_class) == 0:
+            print(f"[Scheduler] Lease on post ID {post['id']} was lost before its retry could be scheduled.")
+            status = None
+        else:
+            print(f"[Scheduler] Retrying post ID {post['id']} ({error_class}, attempt {attempts} of {RETRY_MAX_ATTEMPTS}) at "
+                  f"{datetime.fromtimestamp(next_attempt_at, timezone.utc).isoformat()}")
+        conn.commit()
+        return status
+    if retryable:
+        print(f"[Scheduler] Post ID {post['id']} failed {attempts} times ({error_class}); moving it to dead letters.")
+    status = 'dead' if retryable else 'error'
+    return status if finish_post(conn, post['id'], status, error, error_class, attempts) else None
+
+def external_post_id(result):
+    """The platform's id for a published post, from what the adapter returned (usually a dict with 'id')."""
+    if isinstance(result, dict) and result.get('id') is not None:
+        return str(result['id'])
+    return None
+
+def record_event(post, event, platform_name=None, **fields):
+    """Buffers a lifecycle event for the current attempt at a claimed post (see post_events.py)."""
+    post_events.record(post['id'], event, (post.get('attempts') or 0) + 1, platform_name, get_worker_id(), **fields)
+
+def publish_lag(post, now_epoch):
+    """Seconds from a post's schedule_time (its creation for immediate posts) to now_epoch, or None."""
+    scheduled_epoch = to_schedule_epoch(post.get('schedule_time') or post.get('created_at'))
+    return now_epoch - scheduled_epoch if scheduled_epoch else None
+
+def record_post_result(get_db, post, error=None, observation=None, error_class=None, retryable=False,
+                       external_id=None):
+    """
+    Commits the result of publishing a post on the calling thread's own database
+    connection, along with any rate limits observed while publishing it. `error`
+    is None when the post was published. A post that failed because the platform
+    throttled us is deferred until the limit resets without using up an attempt.
+    """
+    platform_name = observation.platform_name if observation else None
+    conn = get_db()
+    try:
+        rate_limit.record(conn, observation)
+        if error is None:
+            status = 'posted' if finish_post(conn, post['id'], 'posted', external_id=external_id) else None
+            if status:
+                lag = publish_lag(post, time.time())
+                if lag is not None:
+                    metrics.PUBLISH_LAG.observe(max(0.0, lag), platform=platform_name or '')
+        elif observation is not None and observation.throttled:
+            status = 'deferred' if defer_post(conn, post['id'], rate_limit.retry_epoch(observation),
+                                              'rate limited by the platform') else None
+        else:
+            status = fail_post(conn, post, error, error_class, retryable)
+        if status:
+            record_event(post, status, platform_name, error_class=error_class)
+    finally:
+        conn.close()
+
+def prepare_post_media(platform_name, post, base_dir):
+    """
+    Returns the post with its media swapped for a copy that fits the platform's
+    limits (see media_prep.py). Preparation problems fall back to the original.
+    """
+    if not post.get('media_path'):
+        return post
+    try:
+        media_path = media_prep.prepare_media(platform_name, base_dir, post['media_path'])
+    except Exception as e:
+        print(f"[Scheduler] Could not prepare media for post ID {post['id']}, using the original: {e}")
+        return post
+    return dict(post, media_path=media_path) if media_path != post['media_path'] else post
+
+def publish_post(get_db, api_function, platform_name, account, post, base_dir):
+    """
+    Publishes a single post on a worker thread and commits its result ('posted',
+    or a failed attempt, see fail_post).
+    """
+    observation = rate_limit.begin(platform_name, account['id'])
+    post = prepare_post_media(platform_name, post, base_dir)
+    record_event(post, 'media_prepared', platform_name)
+    started = time.perf_counter()
+    record_event(post, 'api_call_start', platform_name)
+    try:
+        print(f"[Scheduler] Calling API for {platform_name} for post ID {post['id']}")
+        result = api_function(account, post, base_dir)
+    except Exception as e:
+        error_message = str(e)
+        retryable, error_class = errors.classify(platform_name, e)
+        metrics.PLATFORM_API_SECONDS.observe(time.perf_counter() - started, platform=platform_name, result=error_class)
+        record_event(post, 'api_call_end', platform_name, error_class=error_class)
+        print(f"[Scheduler] Error processing post ID {post['id']} ({error_class}): {error_message}")
+        rate_limit.observe_exception(e)
+        record_post_result(get_db, post, error_message, observation, error_class, retryable)
+        return
+    metrics.PLATFORM_API_SECONDS.observe(time.perf_counter() - started, platform=platform_name, result='success')
+    record_event(post, 'api_call_end', platform_name)
+    record_post_result(get_db, post, observation=observation, external_id=external_post_id(result))
+    print(f"[Scheduler] Post ID {post['id']} successfully posted.")
+
+async def publish_post_async(get_db, async_function, platform_name, account, post, base_dir):
+    """
+    Publishes a single post on the async engine's event loop. The database write
+    runs on a worker thread so it never blocks other posts in flight.
+    """
+    # Each task runs in its own context, so observations do not mix between posts
+    observation = rate_limit.begin(platform_name, account['id'])
+    # Resizing and transcoding are CPU bound, so they run off the event loop
+    post = await asyncio.to_thread(prepare_post_media, platform_name, post, base_dir)
+    record_event(post, 'media_prepared', platform_name)
+    async with get_engine().limit(platform_name):
+        started = time.perf_counter()
+        record_event(post, 'api_call_start', platform_name)
+        try:
+            print(f"[Scheduler] Calling async API for {platform_name} for post ID {post['id']}")
+            result = await async_function(account, post, base_dir)
+        except Exception as e:
+            error_message = str(e)
+            retryable, error_class = errors.classify(platform_name, e)
+            metrics.PLATFORM_API_SECONDS.observe(time.perf_counter() - started, platform=platform_name,
+                                                 result=error_class)
+            record_event(post, 'api_call_end', platform_name, error_class=error_class)
+            print(f"[Scheduler] Error processing post ID {post['id']} ({error_class}): {error_message}")
+            rate_limit.observe_exception(e)
+            await asyncio.to_thread(record_post_result, get_db, post, error_message, observation,
+                                    error_class, retryable)
+            return
+        metrics.PLATFORM_API_SECONDS.observe(time.perf_counter() - started, platform=platform_name, result='success')
+        record_event(post, 'api_call_end', platform_name)
+    await asyncio.to_thread(record_post_result, get_db, post, None, observation,
+                            external_id=external_post_id(result))
+    print(f"[Scheduler] Post ID {post['id']} successfully posted.")
 
 def process_scheduled_posts(get_db, platform_apis, base_dir):
     """
     Checks for pending posts and processes them using the appropriate platform API function.
+    Returns the number of posts claimed in this pass.
+
+    Posts are only claimed for platforms with a free publishing slot, and the pass
+    returns once they are handed off, without waiting for them to be published.
     """
     print(f"[Scheduler] Running scheduled posts check at {datetime.now(timezone.utc).isoformat()}")
     
     conn = get_db()
     try:
-        # Fetch all pending posts and filter in Python to avoid string comparison issues
-        pending_rows = conn.execute("SELECT * FROM content WHERE status='pending'").fetchall()
-        due_posts = []
-        now_utc = datetime.now(timezone.utc)
-        for row in pending_rows:
-            # Debug: show original schedule_time string
-            print(f"[Scheduler] Evaluating post ID {row['id']} with schedule_time='{row['schedule_time']}'")
-            schedule_time_str = row['schedule_time']
-            if not schedule_time_str:
-                # No schedule specified – post immediately
-                due_posts.append(row)
-                continue
-            try:
-                sch_dt = isoparse(schedule_time_str)
-                # Ensure timezone aware (treat naive as UTC)
-                if sch_dt.tzinfo is None:
-                    sch_dt = sch_dt.replace(tzinfo=timezone.utc)
-                sch_dt_utc = sch_dt.astimezone(timezone.utc)
-                print(f"[Scheduler] Parsed schedule_time UTC: {sch_dt_utc.isoformat()}, Now UTC: {now_utc.isoformat()}")
-                if sch_dt_utc <= now_utc:
-                    due_posts.append(row)
-            except Exception as e:
-                # Malformed timestamp – log and process anyway so it does not get stuck forever
-                print(f"[Scheduler] Failed to parse schedule_time '{schedule_time_str}' for post ID {row['id']}: {e}. Processing immediately.")
-                due_posts.append(row)
+        # Claim due rows (and expired leases) so no other worker publishes them too
+        now_epoch = datetime.now(timezone.utc).timestamp()
+        stats.prune_outcomes(conn, now_epoch)
+        post_events.prune(conn, now_epoch)
+        free_slots = free_platform_slots(platform_apis)
+        full_platforms = [name for name, slots in free_slots.items() if not slots]
+        # At least one, so posts on unconfigured platforms are still claimed (and failed)
+        due_posts = claim_due_posts(conn, now_epoch, min(SCHEDULER_BATCH_SIZE, max(1, sum(free_slots.values()))),
+                                    full_platforms)
+        claimed_at = post_events.now()
 
         if not due_posts:
             print("[Scheduler] No posts are due for processing.")
-            return
+            return 0
 
-        print(f"[Scheduler] Found {len(due_posts)} posts ready to be processed.")
+        print(f"[Scheduler] Claimed {len(due_posts)} posts ready to be processed.")
+        metrics.SCHEDULER_CLAIMED_POSTS.inc(len(due_posts))
 
+        # Every account of the pass and its platform, in one query
+        accounts = repository.get_accounts_with_platform(conn, {post['account_id'] for post in due_posts})
         for post in due_posts:
             print(f"[Scheduler] Processing post ID: {post['id']}")
-            
-            # Set status to 'processing' to prevent reprocessing by other workers
-            conn.execute("UPDATE content SET status='processing' WHERE id=?", (post['id'],))
-            conn.commit()
+            account = accounts.get(post['account_id'])
+            platform_name = account['platform_name'] if account else None
+            record_event(post, 'claimed', platform_name, occurred_at=claimed_at,
+                         due_at=post['next_attempt_at'] if post['previous_status'] == 'retrying' else post['schedule_epoch'])
 
             try:
-                account = conn.execute('SELECT * FROM accounts WHERE id=?', (post['account_id'],)).fetchone()
                 if not account:
                     raise Exception("Account not found.")
 
-                platform = conn.execute('SELECT * FROM platforms WHERE id=?', (account['platform_id'],)).fetchone()
-                if not platform:
+                if not platform_name:
                     raise Exception("Platform not found.")
 
-                platform_name = platform['name']
                 api_function = platform_apis.get(platform_name)
+                if not api_function:
+                    raise Exception(f"No API function configured for platform: {platform_name}")
 
-                # Convert all sqlite3.Row objects to dicts for robust access
-                account_dict = dict(account)
-                post_dict = dict(post)
-                platform_dict = dict(platform)
+                # Hold the post back instead of firing it into a platform rate limit
+                wait_seconds = rate_limit.acquire(conn, platform_name, account['id'])
+                if wait_seconds:
+                    if defer_post(conn, post['id'], time.time() + wait_seconds,
+                                  f"{platform_name} rate limit budget exhausted"):
+                        record_event(post, 'deferred', platform_name)
+                    continue
 
-                if api_function:
-                    print(f"[Scheduler] Calling API for {platform_name} for post ID {post['id']}")
-                    api_function(account_dict, post_dict, base_dir)
-                    conn.execute("UPDATE content SET status='posted', error=NULL WHERE id=?", (post['id'],))
-                    print(f"[Scheduler] Post ID {post['id']} successfully posted.")
+                # Convert rows to dicts so they can be handed to worker threads
+                async_function = getattr(api_function, 'async_function', None)
+                if async_function:
+                    # Async adapters share one event loop instead of a thread per post
+                    future = get_engine().submit(publish_post_async(
+                        get_db, async_function, platform_name, dict(account), post, base_dir
+                    ))
                 else:
-                    raise Exception(f"No API function configured for platform: {platform_name}")
+                    future = get_platform_executor(platform_name).submit(
+                        publish_post, get_db, api_function, platform_name, dict(account), post, base_dir
+                    )
+                _track_in_flight(platform_name, post['id'], future)
 
             except Exception as e:
+                # Missing accounts, platforms or adapters will not fix themselves on retry
                 error_message = str(e)
                 print(f"[Scheduler] Error processing post ID {post['id']}: {error_message}")
-                conn.execute("UPDATE content SET status='error', error=? WHERE id=?", (error_message, post['id']))
-            
-            # Commit the final status of the post ('posted' or 'error')
-            conn.commit()
+                if finish_post(conn, post['id'], 'error', error_message, errors.CONFIG, (post.get('attempts') or 0) + 1):
+                    record_event(post, 'error', platform_name, error_class=errors.CONFIG)
+
+        return len(due_posts)
 
     except Exception as e:
         print(f"[Scheduler] A critical error occurred in the scheduler's main loop: {e}")
+        return 0
     finally:
         if conn:
             conn.close()
             print("[Scheduler] Database connection closed.")
+        # Write the pass's events now rather than waiting for the next batch
+        post_events.flush()
+
+class SchedulerLoop:
+    """
+    Runs process_scheduled_posts whenever work is due instead of on a fixed interval.
+
+    Between passes the loop sleeps until the earliest pending schedule_epoch. It
+    wakes early when wake() is called (new or deleted content in this process, or a
+    post finished and freed its platform's publishing slot) or
+    when db.change_marker shows another process committed changes, which is a
+    header read rather than a table query.
+    """
+
+    def __init__(self, get_db, platform_apis, base_dir):
+        self.get_db = get_db
+        self.platform_apis = platform_apis
+        self.base_dir = base_dir
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Runs the loop on a background daemon thread."""
+        self._thread = threading.Thread(target=self.run_forever, name='scheduler-loop', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Makes the loop re-check due posts immediately."""
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def run_forever(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            started = time.perf_counter()
+            claimed = process_scheduled_posts(self.get_db, self.platform_apis, self.base_dir)
+            metrics.SCHEDULER_TICK_SECONDS.observe(time.perf_counter() - started)
+            if claimed >= SCHEDULER_BATCH_SIZE:
+                # A full batch means more posts may already be due
+                continue
+            try:
+                self._sleep_until_due()
+            except Exception as e:
+                print(f"[Scheduler] Error while waiting for the next due post: {e}")
+                self._wake_event.wait(SCHEDULER_MAX_IDLE_SECONDS)
+
+    def _sleep_until_due(self):
+        conn = self.get_db()
+        try:
+            marker = change_marker(conn)
+            due_epoch = self._next_due_epoch(conn)
+            idle_deadline = time.monotonic() + SCHEDULER_MAX_IDLE_SECONDS
+            while not self._stop_event.is_set():
+                now_epoch = datetime.now(timezone.utc).timestamp()
+                remaining = idle_deadline - time.monotonic()
+                if due_epoch is not None:
+                    remaining = min(remaining, due_epoch - now_epoch)
+                if remaining <= 0:
+                    return
+                if self._wake_event.wait(min(remaining, SCHEDULER_CHANGE_CHECK_SECONDS)):
+                    return
+                current_marker = change_marker(conn)
+                if current_marker != marker:
+                    # Another connection committed changes; the next due post may have moved
+                    marker = current_marker
+                    due_epoch = self._next_due_epoch(conn)
+        finally:
+            conn.close()
+
+    def _next_due_epoch(self, conn):
+        # Posts on platforms without a free slot wait until one frees up (which wakes the loop)
+        full_platforms = [name for name, slots in free_platform_slots(self.platform_apis).items() if not slots]
+        return repository.next_due_epoch(conn, full_platforms)
+
+# The loop running in this process, if any (see wake_scheduler)
+_scheduler_loop = None
+
+def start_scheduler_loop(get_db, platform_apis, base_dir):
+    """Starts the background scheduler loop for this process and returns it."""
+    global _scheduler_loop
+    _scheduler_loop = SchedulerLoop(get_db, platform_apis, base_dir)
+    _scheduler_loop.start()
+    return _scheduler_loop
+
+def wake_scheduler():
+    """Wakes this process's scheduler loop early, e.g. after content is added or removed."""
+    if _scheduler_loop is not None:
+        _scheduler_loop.wake()
+
+def run_worker():
+    """
+    Runs the scheduler as a standalone process, without importing the Flask app.
+    Pair it with EMBEDDED_SCHEDULER=false on the web process so web and publishing
+    capacity can be scaled independently.
+    """
+    from db import get_db, init_db, BASE_DIR
+    from publishers import platform_apis
+
+    global _scheduler_loop
+    init_db()
+    print(f"[Scheduler] Worker {get_worker_id()} started.")
+    try:
+        _scheduler_loop = SchedulerLoop(get_db, platform_apis, BASE_DIR)
+        _scheduler_loop.run_forever()
+    except (KeyboardInterrupt, SystemExit):
+        print(f"[Scheduler] Worker {get_worker_id()} stopped.")
+
+# Note: The embedded scheduler loop is started in app.py
 
-# Note: The scheduler setup (BackgroundScheduler) is in app.py 
\ No newline at end of file
+if __name__ == "__main__":
+    # python -m scheduler run still works, but runs the worker through the imported
+    # scheduler module rather than this __main__ copy (see worker.py)
+    import worker
+    worker.main()
\ No newline at end of file
@@ -1,15 +1,70 @@
 from dotenv import load_dotenv
 load_dotenv()
 from cryptography.fernet import Fernet
+from collections import OrderedDict
+import json
 import os
+import threading
+import time
 
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY')
 if not ENCRYPTION_KEY:
     raise ValueError('ENCRYPTION_KEY must be set in your .env file')
 fernet = Fernet(ENCRYPTION_KEY.encode())
 
+# Decrypted credentials are cached in memory only (never written to disk)
+CREDENTIAL_CACHE_TTL_SECONDS = int(os.getenv('CREDENTIAL_CACHE_TTL_SECONDS', '300'))
+CREDENTIAL_CACHE_SIZE = int(os.getenv('CREDENTIAL_CACHE_SIZE', '256'))
+
+_credential_cache = OrderedDict()  # account id -> (updated_at, token, expires_at, credentials)
+_credential_cache_lock = threading.Lock()
+
 def encrypt_data(data: str) -> str:
     return fernet.encrypt(data.encode()).decode()
 
 def decrypt_data(token: str) -> str:
-    return fernet.decrypt(token.encode()).decode()
\ No newline at end of file
+    return fernet.decrypt(token.encode()).decode()
+
+def _cache_key(account):
+    """Returns (account id, updated_at) for an account row or dict, or None if it has no id."""
+    try:
+        return account['id'], account['updated_at']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+def load_credentials(account) -> dict:
+    """
+    Returns the decrypted, parsed credentials of an account row or dict.
+    Results are cached per account and reused while the row's updated_at and
+    ciphertext are unchanged. Raises like json.loads(decrypt_data(...)) would.
+    """
+    token = account['credentials']
+    key = _cache_key(account)
+    if key is None or CREDENTIAL_CACHE_SIZE <= 0:
+        return json.loads(decrypt_data(token))
+
+    account_id, updated_at = key
+    now = time.monotonic()
+    with _credential_cache_lock:
+        entry = _credential_cache.get(account_id)
+        if entry and entry[0] == updated_at and entry[1] == token and entry[2] > now:
+            _credential_cache.move_to_end(account_id)
+            return json.loads(entry[3])
+
+    # Decrypt outside the lock so other accounts are not held up
+    plaintext = decrypt_data(token)
+    credentials = json.loads(plaintext)
+    with _credential_cache_lock:
+        _credential_cache[account_id] = (updated_at, token, now + CREDENTIAL_CACHE_TTL_SECONDS, plaintext)
+        _credential_cache.move_to_end(account_id)
+        while len(_credential_cache) > CREDENTIAL_CACHE_SIZE:
+            _credential_cache.popitem(last=False)
+    return credentials
+
+def invalidate_credentials(account_id=None):
+    """Drops the cached credentials of an account, or of every account when account_id is None."""
+    with _credential_cache_lock:
+        if account_id is None:
+            _credential_cache.clear()
+        else:
+            _credential_cache.pop(account_id, None)
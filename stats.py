@@ -0,0 +1,106 @@
+"""
+Dashboard statistics.
+
+Post counts per account and status (content_stats) and publish results per hour
+(content_outcomes) are maintained incrementally by database triggers on the
+content table (see db.py), so every insert, delete and status change made by the
+app, the scheduler or the bulk importer is counted without extra code. Reading
+statistics touches a few rows per account, however many posts there are.
+
+`python -m stats rebuild` recounts content_stats from the content table, should
+the counts ever be in doubt (e.g. after editing the database by hand).
+"""
+import os
+import threading
+import time
+
+import repository
+
+# How far back /api/stats looks for the failure rate
+STATS_FAILURE_WINDOW_SECONDS = int(os.getenv('STATS_FAILURE_WINDOW_SECONDS', '86400'))
+
+# How long hourly publish results are kept
+STATS_RETENTION_SECONDS = int(os.getenv('STATS_RETENTION_SECONDS', str(30 * 86400)))
+
+# Statuses of posts still waiting to be published
+QUEUED_STATUSES = ('pending', 'processing', 'retrying')
+
+# Publish results that count as failures; 'posted' is the only success
+FAILED_STATUSES = ('retrying', 'error', 'dead')
+
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+
+def _add(counts, status, posts):
+    counts[status] = counts.get(status, 0) + posts
+    counts['total'] = counts.get('total', 0) + posts
+
+def _failure_rate(outcomes):
+    failed = sum(outcomes.get(status, 0) for status in FAILED_STATUSES)
+    attempts = failed + outcomes.get('posted', 0)
+    return {'attempts': attempts, 'failed': failed, 'rate': round(failed / attempts, 4) if attempts else None}
+
+def get_stats(conn, now_epoch=None):
+    """
+    Post counts by status overall, per platform and per account, the queue depth,
+    and the share of publish attempts that failed in the last
+    STATS_FAILURE_WINDOW_SECONDS (overall and per platform).
+    """
+    now_epoch = time.time() if now_epoch is None else now_epoch
+    totals, platforms, accounts = {}, {}, {}
+    for row in repository.list_content_stats(conn):
+        _add(totals, row['status'], row['posts'])
+        _add(platforms.setdefault(row['platform'], {}), row['status'], row['posts'])
+        account = accounts.setdefault(row['account_id'], {
+            'account_id': row['account_id'], 'name': row['account_name'], 'platform': row['platform'], 'counts': {},
+        })
+        _add(account['counts'], row['status'], row['posts'])
+
+    # Hourly buckets: the window starts at the beginning of the hour it falls in
+    since_epoch = int(now_epoch - STATS_FAILURE_WINDOW_SECONDS) // 3600 * 3600
+    outcomes, platform_outcomes = {}, {}
+    for row in repository.list_content_outcomes(conn, since_epoch):
+        outcomes[row['status']] = outcomes.get(row['status'], 0) + row['posts']
+        by_status = platform_outcomes.setdefault(row['platform'], {})
+        by_status[row['status']] = by_status.get(row['status'], 0) + row['posts']
+
+    return {
+        'totals': totals,
+        'platforms': platforms,
+        'accounts': sorted(accounts.values(), key=lambda account: account['account_id']),
+        'queue_depth': sum(totals.get(status, 0) for status in QUEUED_STATUSES),
+        'failures': dict(_failure_rate(outcomes), window_seconds=STATS_FAILURE_WINDOW_SECONDS, platforms={
+            platform: _failure_rate(by_status) for platform, by_status in platform_outcomes.items()
+        }),
+    }
+
+def prune_outcomes(conn, now_epoch=None):
+    """Drops publish results older than STATS_RETENTION_SECONDS, at most once an hour per process. Commits."""
+    global _last_prune
+    now_epoch = time.time() if now_epoch is None else now_epoch
+    with _prune_lock:
+        if now_epoch - _last_prune < 3600:
+            return 0
+        _last_prune = now_epoch
+    removed = repository.prune_content_outcomes(conn, now_epoch - STATS_RETENTION_SECONDS)
+    conn.commit()
+    return removed
+
+if __name__ == "__main__":
+    import argparse
+    from db import get_db, init_db
+
+    parser = argparse.ArgumentParser(description="Dashboard statistics maintenance")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    subcommands.add_parser('rebuild', help="Recount post statistics from the content table")
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_db()
+    try:
+        if args.command == 'rebuild':
+            repository.rebuild_content_stats(conn)
+            conn.commit()
+            print(f"[Stats] Recounted {get_stats(conn)['totals'].get('total', 0)} posts.")
+    finally:
+        conn.close()
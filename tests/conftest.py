@@ -0,0 +1,93 @@
+"""
+Shared fixtures: every test gets its own SQLite database under tmp_path, with
+the schema created by db.init_db() and an account on a few platforms.
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import post_events
+import rate_limit
+import repository
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """This thread's connection to a fresh database."""
+    monkeypatch.setattr(db, 'DB_BACKEND', 'sqlite')
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'test.db'))
+    # Buckets already created are remembered per process; each database starts empty
+    monkeypatch.setattr(rate_limit, '_ensured_buckets', set())
+    # Tests flush events themselves; the background flusher's connection would outlive the database
+    monkeypatch.setattr(post_events, 'POST_EVENTS_FLUSH_SECONDS', 3600)
+    db.close_db()
+    db.init_db()
+    conn = db.get_db()
+    yield conn
+    # Events buffered by the test belong to this database, not to the next one
+    post_events.flush()
+    db.close_db()
+
+@pytest.fixture
+def accounts(conn):
+    """Account ids by platform name."""
+    platform_ids = {row['name']: row['id'] for row in repository.list_platforms(conn)}
+    now = datetime.utcnow().isoformat()
+    ids = {name: repository.create_account(conn, platform_ids[name], f'{name} account', '{}', now)
+           for name in ('twitter', 'reddit', 'youtube')}
+    conn.commit()
+    return ids
+
+def add_post(conn, account_id, schedule_epoch=0, media_path='', title='post'):
+    """Creates a post and commits; returns its id."""
+    post_id = repository.create_content(conn, account_id, title, None, None, media_path, None, schedule_epoch,
+                                        datetime.utcnow().isoformat())
+    conn.commit()
+    return post_id
+
+def get_post(conn, post_id):
+    return conn.execute('SELECT * FROM content WHERE id=?', (post_id,)).fetchone()
+
+def run_in_thread(function, *args):
+    """Runs function on a new thread (and so on its own database connection) and returns its result."""
+    result = {}
+
+    def target():
+        try:
+            result['value'] = function(*args)
+        finally:
+            db.close_db()
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    return result.get('value')
+
+@pytest.fixture
+def dispatch(conn, monkeypatch):
+    """Fresh publishing thread pools and in-flight counts, without rate limits."""
+    import scheduler
+    for name in ('twitter', 'reddit', 'youtube'):
+        monkeypatch.setenv(f'RATE_LIMIT_{name.upper()}_ACCOUNT', 'off')
+        monkeypatch.setenv(f'RATE_LIMIT_{name.upper()}_APP', 'off')
+    executors = {}
+    monkeypatch.setattr(scheduler, '_platform_executors', executors)
+    monkeypatch.setattr(scheduler, '_in_flight', {})
+    yield scheduler
+    scheduler.wait_for_posts_in_flight(10)
+    for executor in executors.values():
+        executor.shutdown(wait=True)
+
+def wait_for(condition, timeout=5):
+    """Polls condition until it is true; returns how long that took, or fails after timeout seconds."""
+    started = time.monotonic()
+    while not condition():
+        assert time.monotonic() - started < timeout, 'timed out'
+        time.sleep(0.01)
+    return time.monotonic() - started
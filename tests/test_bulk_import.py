@@ -0,0 +1,88 @@
+"""Bulk scheduling from JSONL and CSV, in partial and atomic modes."""
+import hashlib
+import io
+import json
+
+import pytest
+
+import bulk_import
+import media_store
+
+def jsonl(*rows):
+    return io.BytesIO(''.join((row if isinstance(row, str) else json.dumps(row)) + '\n' for row in rows).encode())
+
+def content_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM content').fetchone()[0]
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(bulk_import, 'BULK_IMPORT_BATCH_SIZE', 2)
+
+@pytest.fixture
+def media(conn, tmp_path):
+    data = b'image bytes'
+    path = media_store.store_stream(conn, str(tmp_path), io.BytesIO(data), 'photo.jpg')
+    return hashlib.sha256(data).hexdigest(), path
+
+def mixed_rows(account_id, sha256, media_path):
+    return jsonl(
+        {'account_id': account_id, 'title': 'first', 'schedule_time': '2030-01-01T10:00:00Z'},
+        {'account_id': account_id, 'title': 'by hash', 'media': sha256.upper()},
+        '{not json',
+        {'account_id': 999999, 'title': 'unknown account'},
+        {'account_id': account_id, 'title': 'by path', 'media': media_path},
+        {'account_id': account_id, 'title': 'missing media', 'media': 'uploads/media/nope.jpg'},
+        {'account_id': account_id, 'title': ''},
+    )
+
+def test_partial_import_schedules_the_valid_rows(conn, accounts, media, small_batches):
+    sha256, media_path = media
+    result = bulk_import.import_posts(conn, mixed_rows(accounts['twitter'], sha256, media_path), 'jsonl')
+
+    assert (result['scheduled'], result['failed']) == (3, 4)
+    assert [(r['row'], r['status']) for r in result['results']] == [
+        (1, 'scheduled'), (2, 'scheduled'), (3, 'error'), (4, 'error'), (5, 'scheduled'), (6, 'error'), (7, 'error'),
+    ]
+    assert 'unknown account 999999' in result['results'][3]['error']
+    assert 'media not found' in result['results'][5]['error']
+    rows = conn.execute('SELECT title, media_path, schedule_epoch FROM content ORDER BY id').fetchall()
+    assert [(row['title'], row['media_path']) for row in rows] == [
+        ('first', ''), ('by hash', media_path), ('by path', media_path),
+    ]
+    assert rows[0]['schedule_epoch'] == 1893492000
+    assert conn.execute('SELECT refcount FROM media_assets').fetchone()['refcount'] == 2
+
+def test_atomic_import_rolls_back_on_any_error(conn, accounts, media, small_batches):
+    sha256, media_path = media
+    result = bulk_import.import_posts(conn, mixed_rows(accounts['twitter'], sha256, media_path), 'jsonl', atomic=True)
+
+    assert (result['scheduled'], result['failed']) == (0, 4)
+    assert {r['status'] for r in result['results']} == {'skipped', 'error'}
+    assert content_count(conn) == 0
+    assert conn.execute('SELECT refcount FROM media_assets').fetchone()['refcount'] == 0
+    assert conn.execute('SELECT COUNT(*) FROM content_stats WHERE posts > 0').fetchone()[0] == 0
+
+def test_atomic_import_of_valid_rows_commits(conn, accounts, small_batches):
+    rows = jsonl(*({'account_id': accounts['reddit'], 'title': f'post {n}'} for n in range(5)))
+    result = bulk_import.import_posts(conn, rows, 'jsonl', atomic=True)
+    assert (result['scheduled'], result['failed']) == (5, 0)
+    conn.rollback()
+    assert content_count(conn) == 5
+
+def test_csv_import(conn, accounts):
+    # Spreadsheet programs start CSV files with a byte order mark
+    data = ('\ufeffaccount_id,title,hashtags,schedule_time\n'
+            f'{accounts["twitter"]},hello,#one,2030-01-01T10:00:00Z\n'
+            f'{accounts["twitter"]},extra,#two,2030-01-01T10:00:00Z,surplus\n'
+            f'{accounts["twitter"]},,#three,\n')
+    result = bulk_import.import_posts(conn, io.BytesIO(data.encode()), 'csv')
+    assert [(r['row'], r['status']) for r in result['results']] == [(2, 'scheduled'), (3, 'error'), (4, 'error')]
+    assert [tuple(row) for row in conn.execute('SELECT title, hashtags FROM content')] == [('hello', '#one')]
+
+def test_too_many_rows_imports_nothing(conn, accounts, monkeypatch):
+    monkeypatch.setattr(bulk_import, 'BULK_IMPORT_MAX_ROWS', 3)
+    monkeypatch.setattr(bulk_import, 'BULK_IMPORT_BATCH_SIZE', 2)
+    rows = jsonl(*({'account_id': accounts['twitter'], 'title': f'post {n}'} for n in range(4)))
+    with pytest.raises(bulk_import.BulkImportError):
+        bulk_import.import_posts(conn, rows, 'jsonl')
+    assert content_count(conn) == 0
@@ -0,0 +1,37 @@
+"""Campaign targets are claimed and published together."""
+import time
+from datetime import datetime
+
+import db
+import repository
+from conftest import add_post, get_post, wait_for
+
+def add_campaign(conn, account_ids, schedule_epoch=0):
+    """Creates a campaign with one target per account and commits; returns the target ids."""
+    now = datetime.utcnow().isoformat()
+    campaign_id = repository.create_campaign(conn, 'campaign', None, None, '', None, schedule_epoch, now)
+    target_ids = [repository.create_content(conn, account_id, 'campaign', None, None, '', None, schedule_epoch, now,
+                                            campaign_id=campaign_id)
+                  for account_id in account_ids]
+    conn.commit()
+    return target_ids
+
+def test_a_campaign_larger_than_the_batch_is_claimed_in_one_pass(conn, accounts, dispatch, tmp_path, monkeypatch):
+    monkeypatch.setattr(dispatch, 'SCHEDULER_BATCH_SIZE', 2)
+    published = []
+
+    def publish(account, post, base_dir):
+        published.append(post['id'])
+        return {'id': f"external-{post['id']}"}
+
+    earlier = add_post(conn, accounts['twitter'])
+    targets = add_campaign(conn, [accounts['twitter'], accounts['reddit'], accounts['youtube']], time.time() - 60)
+    later = add_post(conn, accounts['reddit'], time.time() - 30)
+
+    apis = {'twitter': publish, 'reddit': publish, 'youtube': publish}
+    assert dispatch.process_scheduled_posts(db.get_db, apis, str(tmp_path)) == 1 + len(targets)
+    wait_for(lambda: dispatch.posts_in_flight() == 0)
+    assert sorted(published) == sorted([earlier] + targets)
+    assert [get_post(conn, target)['external_id'] for target in targets] == [f'external-{target}' for target in targets]
+    # Posts outside the campaign still wait for the next pass
+    assert get_post(conn, later)['status'] == 'pending'
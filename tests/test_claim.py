@@ -0,0 +1,118 @@
+"""Claiming due posts when several workers race for them."""
+import threading
+import time
+
+import db
+import repository
+from conftest import add_post, get_post, run_in_thread
+
+LEASE_SECONDS = 600
+
+def claim(worker_id, now_epoch, limit=100):
+    conn = db.get_db()
+    try:
+        claimed = repository.claim_due_content(conn, worker_id, now_epoch, now_epoch + LEASE_SECONDS, limit)
+        conn.commit()
+        return [post['id'] for post in claimed]
+    finally:
+        conn.close()
+
+class InterleavedConnection:
+    """Runs `before_write` just before the first UPDATE, i.e. after the claim read its candidates."""
+
+    backend = 'sqlite'
+
+    def __init__(self, conn, before_write):
+        self.conn = conn
+        self.before_write = before_write
+
+    def execute(self, sql, params=()):
+        if self.before_write and sql.lstrip().upper().startswith('UPDATE'):
+            before_write, self.before_write = self.before_write, None
+            before_write()
+        return self.conn.execute(sql, params)
+
+def test_claims_only_due_posts(conn, accounts):
+    now = time.time()
+    due = add_post(conn, accounts['twitter'], now - 10)
+    add_post(conn, accounts['twitter'], now + 3600)
+
+    assert claim('worker-a', now) == [due]
+    post = get_post(conn, due)
+    assert (post['status'], post['claimed_by']) == ('processing', 'worker-a')
+    assert claim('worker-b', now) == []
+
+def test_concurrent_workers_claim_each_post_once(conn, accounts):
+    now = time.time()
+    post_ids = {add_post(conn, accounts['twitter'], now - i) for i in range(60)}
+    workers = 6
+    barrier = threading.Barrier(workers)
+    claimed = {}
+
+    def worker(worker_id):
+        barrier.wait()
+        try:
+            ids = []
+            while True:
+                batch = claim(worker_id, now, limit=5)
+                if not batch:
+                    break
+                ids += batch
+            claimed[worker_id] = ids
+        finally:
+            db.close_db()
+
+    threads = [threading.Thread(target=worker, args=(f'worker-{n}',)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_claims = [post_id for ids in claimed.values() for post_id in ids]
+    assert len(claimed) == workers
+    assert sorted(all_claims) == sorted(post_ids)
+    for worker_id, ids in claimed.items():
+        for post_id in ids:
+            assert get_post(conn, post_id)['claimed_by'] == worker_id
+
+def test_post_deferred_by_another_worker_is_not_claimed(conn, accounts):
+    now = time.time()
+    post_id = add_post(conn, accounts['twitter'], now - 10)
+
+    def other_worker_claims_and_defers():
+        def claim_and_defer():
+            other = db.get_db()
+            try:
+                assert [post['id'] for post in repository.claim_due_content(other, 'worker-b', now, now + 60, 10)] == [post_id]
+                assert repository.defer_content(other, post_id, 'worker-b', now + 3600) == 1
+                other.commit()
+            finally:
+                other.close()
+        run_in_thread(claim_and_defer)
+
+    # worker-a read the post as due, then worker-b claimed it and deferred it for an hour
+    claimed = repository.claim_due_content(InterleavedConnection(conn, other_worker_claims_and_defers),
+                                           'worker-a', now, now + LEASE_SECONDS, 10)
+    conn.commit()
+
+    assert claimed == []
+    post = get_post(conn, post_id)
+    assert (post['status'], post['claimed_by'], post['schedule_epoch']) == ('pending', None, now + 3600)
+
+def test_expired_lease_is_reclaimed(conn, accounts):
+    now = time.time()
+    post_id = add_post(conn, accounts['twitter'], now - 10)
+    assert claim('worker-a', now) == [post_id]
+
+    # Before the lease runs out nobody else can take the post
+    assert claim('worker-b', now + LEASE_SECONDS - 1) == []
+    reclaimed = repository.claim_due_content(conn, 'worker-b', now + LEASE_SECONDS + 1, now + 2 * LEASE_SECONDS, 10)
+    conn.commit()
+    assert [(post['id'], post['previous_status'], post['previous_claimed_by']) for post in reclaimed] == \
+        [(post_id, 'processing', 'worker-a')]
+
+    # The worker that lost the lease can no longer record a result
+    assert repository.finish_content(conn, post_id, 'worker-a', 'posted') == 0
+    assert repository.finish_content(conn, post_id, 'worker-b', 'posted') == 1
+    conn.commit()
+    assert get_post(conn, post_id)['status'] == 'posted'
@@ -0,0 +1,57 @@
+"""Publishing posts concurrently on per-platform thread pools."""
+import threading
+
+import db
+from conftest import add_post, get_post, wait_for
+
+def stub_apis(release):
+    def slow_upload(account, post, base_dir):
+        release.wait(10)
+        return {'id': f"video-{post['id']}"}
+
+    def tweet(account, post, base_dir):
+        return {'id': f"tweet-{post['id']}"}
+
+    return {'youtube': slow_upload, 'twitter': tweet, 'reddit': tweet}
+
+def run_pass(scheduler, apis, tmp_path):
+    return scheduler.process_scheduled_posts(db.get_db, apis, str(tmp_path))
+
+def test_slow_platform_does_not_hold_back_others(conn, accounts, dispatch, tmp_path, monkeypatch):
+    monkeypatch.setenv('SCHEDULER_CONCURRENCY_YOUTUBE', '1')
+    release = threading.Event()
+    apis = stub_apis(release)
+    first_video = add_post(conn, accounts['youtube'])
+
+    try:
+        # The pass hands the upload off and returns while it is still running
+        assert run_pass(dispatch, apis, tmp_path) == 1
+        assert dispatch.free_platform_slots(apis)['youtube'] == 0
+
+        second_video = add_post(conn, accounts['youtube'])
+        tweet = add_post(conn, accounts['twitter'])
+        # YouTube has no free slot, so only the tweet is claimed
+        assert run_pass(dispatch, apis, tmp_path) == 1
+        wait_for(lambda: get_post(conn, tweet)['status'] == 'posted')
+        assert get_post(conn, tweet)['external_id'] == f'tweet-{tweet}'
+        assert get_post(conn, first_video)['status'] == 'processing'
+        assert get_post(conn, second_video)['status'] == 'pending'
+    finally:
+        release.set()
+
+    assert dispatch.wait_for_posts_in_flight(5)
+    assert run_pass(dispatch, apis, tmp_path) == 1
+    assert dispatch.wait_for_posts_in_flight(5)
+    assert [get_post(conn, post_id)['status'] for post_id in (first_video, second_video)] == ['posted', 'posted']
+
+def test_errors_escaping_a_post_are_logged(conn, accounts, dispatch, tmp_path, monkeypatch, capsys):
+    def record_post_result(*args, **kwargs):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(dispatch, 'record_post_result', record_post_result)
+    post_id = add_post(conn, accounts['twitter'])
+    assert run_pass(dispatch, stub_apis(threading.Event()), tmp_path) == 1
+    assert dispatch.wait_for_posts_in_flight(5)
+
+    assert f"Unexpected error publishing post ID {post_id} on twitter: RuntimeError('disk full')" in capsys.readouterr().out
+    assert dispatch.posts_in_flight() == 0
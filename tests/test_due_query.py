@@ -0,0 +1,35 @@
+"""Fetching due posts through the indexed schedule_epoch column."""
+import time
+
+import db
+import repository
+from conftest import add_post
+
+def test_only_due_posts_are_claimed_earliest_first(conn, accounts):
+    now = time.time()
+    due = [add_post(conn, accounts['twitter'], now - n) for n in range(10)]
+    for n in range(5):
+        add_post(conn, accounts['twitter'], now + 60 + n)
+
+    claimed = repository.claim_due_content(conn, 'worker-a', now, now + 600, 4)
+    conn.commit()
+    assert [post['id'] for post in claimed] == due[:-5:-1]
+    assert repository.next_due_epoch(conn) == now - 5
+
+def test_due_posts_are_found_by_index(conn):
+    plan = ' '.join(row[-1] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM content WHERE status='pending' AND schedule_epoch <= ? "
+        "ORDER BY schedule_epoch LIMIT ?", (time.time(), 100)))
+    assert 'idx_content_status_schedule' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_init_db_backfills_schedule_epoch(conn, accounts):
+    post_ids = [add_post(conn, accounts['twitter']) for _ in range(3)]
+    for post_id, schedule_time in zip(post_ids, ('2030-01-01T12:00:00+02:00', '2030-01-01T10:00:00', None)):
+        conn.execute('UPDATE content SET schedule_time=?, schedule_epoch=NULL WHERE id=?', (schedule_time, post_id))
+    conn.commit()
+
+    db.init_db()
+    epochs = [row['schedule_epoch'] for row in conn.execute('SELECT schedule_epoch FROM content ORDER BY id')]
+    # Times without a timezone are UTC; posts without a schedule time are due at once
+    assert epochs == [1893492000, 1893492000, 0]
@@ -0,0 +1,71 @@
+"""Media reference counts and garbage collection."""
+import io
+import os
+
+import media_store
+import repository
+from conftest import add_post
+
+def store(conn, base_dir, data, filename='photo.jpg'):
+    return media_store.store_stream(conn, str(base_dir), io.BytesIO(data), filename)
+
+def refcount(conn, media_path):
+    return conn.execute('SELECT refcount FROM media_assets WHERE path=?', (media_path,)).fetchone()['refcount']
+
+def test_same_content_is_stored_once(conn, tmp_path):
+    first = store(conn, tmp_path, b'image bytes', 'a.jpg')
+    second = store(conn, tmp_path, b'image bytes', 'b.jpg')
+    other = store(conn, tmp_path, b'other bytes', 'a.jpg')
+    assert first == second != other
+    assert conn.execute('SELECT COUNT(*) FROM media_assets').fetchone()[0] == 2
+    # Nothing is left behind in the temporary directory
+    assert os.listdir(tmp_path / 'uploads' / '.partial') == []
+
+def test_file_is_collected_after_its_last_post_is_deleted(conn, tmp_path, accounts):
+    media_path = store(conn, tmp_path, b'image bytes')
+    posts = [add_post(conn, accounts['twitter'], media_path=media_path) for _ in range(2)]
+    assert refcount(conn, media_path) == 2
+
+    repository.delete_content(conn, posts[0])
+    conn.commit()
+    assert refcount(conn, media_path) == 1
+    assert media_store.collect_garbage(conn, str(tmp_path)) == 0
+    assert os.path.exists(tmp_path / media_path)
+
+    repository.delete_content(conn, posts[1])
+    conn.commit()
+    assert refcount(conn, media_path) == 0
+    assert media_store.collect_garbage(conn, str(tmp_path)) == 1
+    assert not os.path.exists(tmp_path / media_path)
+    assert repository.find_media_paths(conn, set(), {media_path}) == {}
+
+def test_deleting_an_account_releases_its_references(conn, tmp_path, accounts):
+    media_path = store(conn, tmp_path, b'image bytes')
+    add_post(conn, accounts['twitter'], media_path=media_path)
+    add_post(conn, accounts['twitter'], media_path=media_path)
+    add_post(conn, accounts['reddit'], media_path=media_path)
+
+    repository.delete_content_for_account(conn, accounts['twitter'])
+    conn.commit()
+    assert refcount(conn, media_path) == 1
+    assert media_store.collect_garbage(conn, str(tmp_path)) == 0
+
+def test_unused_upload_is_kept_for_the_grace_period(conn, tmp_path, monkeypatch):
+    media_path = store(conn, tmp_path, b'never scheduled')
+    assert media_store.collect_garbage(conn, str(tmp_path)) == 0
+    assert os.path.exists(tmp_path / media_path)
+
+    monkeypatch.setattr(media_store, 'MEDIA_ORPHAN_GRACE_SECONDS', -60)
+    assert media_store.collect_garbage(conn, str(tmp_path)) == 1
+    assert not os.path.exists(tmp_path / media_path)
+
+def test_storing_again_revives_a_released_asset(conn, tmp_path, accounts):
+    media_path = store(conn, tmp_path, b'image bytes')
+    repository.delete_content(conn, add_post(conn, accounts['twitter'], media_path=media_path))
+    conn.commit()
+
+    # Uploaded again before garbage collection ran: the file must survive it
+    assert store(conn, tmp_path, b'image bytes') == media_path
+    assert media_store.collect_garbage(conn, str(tmp_path)) == 0
+    with open(tmp_path / media_path, 'rb') as f:
+        assert f.read() == b'image bytes'
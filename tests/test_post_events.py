@@ -0,0 +1,105 @@
+"""Post lifecycle events and the publishing report built from them."""
+import time
+
+import pytest
+
+import post_events
+import repository
+from conftest import add_post
+
+T = 1_700_000_000.0
+
+def event(content_id, attempt, name, occurred_at, platform, due_at=None, error_class=None):
+    return (content_id, attempt, name, occurred_at, due_at, platform, 'worker-a', error_class)
+
+def attempt_events(content_id, attempt, claimed_at, due_at, platform, result='posted', error_class=None):
+    """One attempt: claimed, 0.5s media prep, 0.5s dispatch, 2s API call, 0.25s to record the result."""
+    return [
+        event(content_id, attempt, 'claimed', claimed_at, platform, due_at),
+        event(content_id, attempt, 'media_prepared', claimed_at + 0.5, platform),
+        event(content_id, attempt, 'api_call_start', claimed_at + 1, platform),
+        event(content_id, attempt, 'api_call_end', claimed_at + 3, platform, error_class=error_class),
+        event(content_id, attempt, result, claimed_at + 3.25, platform, error_class=error_class),
+    ]
+
+@pytest.fixture
+def events(conn):
+    rows = []
+    # 100 tweets due at T, claimed i seconds late
+    for i in range(100):
+        rows.append(event(i + 1, 0, 'enqueued', T - 1000, 'twitter', T))
+        rows += attempt_events(i + 1, 1, T + i, T, 'twitter')
+    # Retried once: lag runs from the first due time, not the retry's
+    rows.append(event(1000, 0, 'enqueued', T - 100, 'reddit', T))
+    rows += attempt_events(1000, 1, T + 10, T, 'reddit', 'retrying', 'connect')
+    rows += attempt_events(1000, 2, T + 70, T + 60, 'reddit')
+    # Failed, then requeued by hand: lag runs from the requeue
+    rows.append(event(1001, 0, 'enqueued', T - 100, 'reddit', T))
+    rows += attempt_events(1001, 1, T + 1, T, 'reddit', 'error', 'server_error')
+    rows.append(event(1001, 0, 'enqueued', T + 1000, 'reddit', T + 1000))
+    rows += attempt_events(1001, 1, T + 1005, T + 1000, 'reddit')
+    # Published in the second hour
+    rows.append(event(2000, 0, 'enqueued', T + 3000, 'twitter', T + 3600))
+    rows += attempt_events(2000, 1, T + 3610, T + 3600, 'twitter')
+    repository.add_post_events(conn, rows)
+    conn.commit()
+
+def test_percentile_is_nearest_rank():
+    values = list(range(100, 0, -1))
+    assert [post_events.percentile(values, pct) for pct in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert [post_events.percentile([3, 1, 2], pct) for pct in (1, 50, 99)] == [1, 2, 3]
+    assert post_events.percentile([], 50) is None
+    assert post_events.summarize([]) == {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None}
+
+def test_report_percentiles_per_platform_and_window(conn, events):
+    report = post_events.publishing_report(conn, T, T + 7200, 3600)
+    assert [(window['start_epoch'], window['end_epoch']) for window in report] == [(T, T + 3600), (T + 3600, T + 7200)]
+
+    twitter = report[0]['platforms']['twitter']
+    assert twitter['results'] == {'posted': 100}
+    # Lags are i + 3.25 seconds for i in 0..99
+    assert twitter['publish_lag_seconds'] == {'count': 100, 'mean': 52.75, 'p50': 52.25, 'p95': 97.25, 'p99': 101.25}
+    assert twitter['attempts'] == {'mean': 1, 'max': 1}
+    stages = twitter['stages_seconds']
+    assert (stages['queue_wait']['p50'], stages['queue_wait']['p99']) == (49, 98)
+    assert {name: stages[name]['p95'] for name in ('media_prep', 'dispatch', 'api_call', 'record')} == \
+        {'media_prep': 0.5, 'dispatch': 0.5, 'api_call': 2, 'record': 0.25}
+
+    reddit = report[0]['platforms']['reddit']
+    assert reddit['results'] == {'retrying': 1, 'error': 1, 'posted': 2}
+    assert reddit['publish_lag_seconds'] == {'count': 2, 'mean': 40.75, 'p50': 8.25, 'p95': 73.25, 'p99': 73.25}
+    assert reddit['attempts'] == {'mean': 1.5, 'max': 2}
+    # Queue waits: 10 and 1 for the first attempts, 10 after the retry fell due, 5 after the requeue
+    assert reddit['stages_seconds']['queue_wait'] == {'count': 4, 'mean': 6.5, 'p50': 5, 'p95': 10, 'p99': 10}
+
+    assert report[1]['platforms']['twitter']['publish_lag_seconds']['p50'] == 13.25
+
+def test_report_filters_by_platform_and_time(conn, events):
+    report = post_events.publishing_report(conn, T, T + 3600, 3600, platform='reddit')
+    assert len(report) == 1 and list(report[0]['platforms']) == ['reddit']
+    # The window ends before the requeued post was published
+    report = post_events.publishing_report(conn, T, T + 500, 500, platform='reddit')
+    assert report[0]['platforms']['reddit']['results'] == {'retrying': 1, 'error': 1, 'posted': 1}
+
+def test_enqueued_events_are_written_by_the_database(conn, accounts):
+    now = time.time()
+    post_id = add_post(conn, accounts['twitter'], now - 60)
+    enqueued = repository.list_post_events(conn, post_id)
+    assert [(row['event'], row['platform']) for row in enqueued] == [('enqueued', 'twitter')]
+    # A post created already overdue falls due when it is enqueued
+    assert enqueued[0]['due_at'] == pytest.approx(now, abs=5)
+
+    conn.execute("UPDATE content SET status='error' WHERE id=?", (post_id,))
+    repository.requeue_content(conn, post_id, now + 100)
+    conn.commit()
+    assert [row['event'] for row in repository.list_post_events(conn, post_id)] == ['enqueued', 'enqueued']
+
+def test_recorded_events_are_flushed_in_one_batch(conn, accounts):
+    post_id = add_post(conn, accounts['twitter'])
+    post_events.flush()
+    for name in ('claimed', 'media_prepared', 'api_call_start', 'api_call_end', 'posted'):
+        post_events.record(post_id, name, 1, 'twitter', 'worker-a')
+    assert post_events.flush() == 5
+    assert [row['event'] for row in repository.list_post_events(conn, post_id)] == [
+        'enqueued', 'claimed', 'media_prepared', 'api_call_start', 'api_call_end', 'posted',
+    ]
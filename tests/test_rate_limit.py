@@ -0,0 +1,64 @@
+"""Token buckets shared by the workers: taking, refunding and platform blocks."""
+import time
+
+import pytest
+
+import rate_limit
+import repository
+
+NOW = 1_700_000_000.0
+
+def tokens(conn, key):
+    return repository.get_rate_limit_bucket(conn, key)['tokens']
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setenv('RATE_LIMIT_TWITTER_ACCOUNT', '2/60')
+    monkeypatch.setenv('RATE_LIMIT_TWITTER_APP', 'off')
+
+def test_acquire_until_empty_then_wait_for_refill(conn, accounts, limits):
+    account_id = accounts['twitter']
+    assert rate_limit.acquire(conn, 'twitter', account_id, NOW) == 0
+    assert rate_limit.acquire(conn, 'twitter', account_id, NOW) == 0
+    # Empty: one token comes back every 30 seconds
+    assert rate_limit.acquire(conn, 'twitter', account_id, NOW) == pytest.approx(30)
+    assert rate_limit.acquire(conn, 'twitter', account_id, NOW + 15) == pytest.approx(15)
+    assert rate_limit.acquire(conn, 'twitter', account_id, NOW + 30) == 0
+    assert tokens(conn, f'twitter:account:{account_id}') == pytest.approx(0)
+
+def test_buckets_are_per_account(conn, accounts, limits):
+    first, second = accounts['twitter'], accounts['twitter'] + 1000
+    rate_limit.acquire(conn, 'twitter', first, NOW)
+    rate_limit.acquire(conn, 'twitter', first, NOW)
+    assert rate_limit.acquire(conn, 'twitter', first, NOW) > 0
+    assert rate_limit.acquire(conn, 'twitter', second, NOW) == 0
+
+def test_tokens_are_refunded_when_a_later_bucket_is_empty(conn, accounts, monkeypatch):
+    monkeypatch.setenv('RATE_LIMIT_TWITTER_ACCOUNT', '5/60')
+    monkeypatch.setenv('RATE_LIMIT_TWITTER_APP', '1/3600')
+    first, second = accounts['twitter'], accounts['twitter'] + 1000
+
+    assert rate_limit.acquire(conn, 'twitter', first, NOW) == 0
+    assert tokens(conn, f'twitter:account:{first}') == 4
+    # The app bucket is empty, so the token taken from the second account's bucket is given back
+    assert rate_limit.acquire(conn, 'twitter', second, NOW) == pytest.approx(3600)
+    assert tokens(conn, f'twitter:account:{second}') == 5
+    assert tokens(conn, 'twitter:app') == 0
+
+def test_platform_block_overrides_tokens(conn, accounts, limits):
+    account_id = accounts['twitter']
+    now = time.time()
+    observation = rate_limit.Observation('twitter', account_id)
+    observation.block('account', now + 900)
+    observation.limit_remaining('account', 1)
+    rate_limit.record(conn, observation)
+    conn.commit()
+
+    key = f'twitter:account:{account_id}'
+    assert tokens(conn, key) == 1
+    assert rate_limit.acquire(conn, 'twitter', account_id, now) == pytest.approx(900, abs=1)
+    # A shorter block reported later does not lift the longer one
+    repository.block_rate_limit_bucket(conn, key, now + 60)
+    conn.commit()
+    assert repository.get_rate_limit_bucket(conn, key)['blocked_until'] == pytest.approx(now + 900)
+    assert rate_limit.acquire(conn, 'twitter', account_id, now + 901) == 0
@@ -0,0 +1,236 @@
+"""Retry, dead-letter and requeue transitions, and which errors are retried."""
+import json
+import socket
+import time
+
+import pytest
+import requests
+from googleapiclient.errors import HttpError
+from httplib2 import Response as HttpLib2Response
+
+import db
+import errors
+import http_client
+import instagram_api
+import linkedin_api
+import pinterest_api
+import post_events
+import rate_limit
+import repository
+import scheduler
+import youtube_api  # registers the YouTube classifier
+from conftest import add_post, get_post
+
+def fake_response(status_code, body=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body if body is not None else {}).encode()
+    response.url = 'https://api.example/'
+    return response
+
+def http_error(status_code):
+    return requests.HTTPError(f'{status_code} error', response=fake_response(status_code))
+
+def raised_from(exc, cause):
+    try:
+        raise exc from cause
+    except Exception as e:
+        return e
+
+@pytest.mark.parametrize('exc, expected', [
+    (raised_from(requests.ConnectionError('could not connect'), ConnectionRefusedError(111, 'refused')),
+     (True, errors.CONNECT)),
+    (requests.exceptions.ConnectTimeout('connect timed out'), (True, errors.CONNECT)),
+    (socket.gaierror(-2, 'Name or service not known'), (True, errors.CONNECT)),
+    (http_error(429), (True, errors.RATE_LIMITED)),
+    (requests.exceptions.ReadTimeout('read timed out'), (True, errors.TIMEOUT)),
+    (requests.ConnectionError('connection reset'), (True, errors.CONNECTION)),
+    (http_error(503), (True, errors.SERVER_ERROR)),
+    (http_error(401), (False, errors.AUTH)),
+    (ValueError('missing title'), (False, errors.INVALID_REQUEST)),
+    (RuntimeError('something else'), (False, errors.UNKNOWN)),
+])
+def test_classify(exc, expected):
+    assert errors.classify('twitter', exc) == expected
+
+def raised_during_publish(exc):
+    try:
+        try:
+            with errors.publish_call():
+                raise exc
+        except Exception as e:
+            # Adapters wrap their errors; the mark is found anywhere in the chain
+            raise Exception(f'API Error: {e}')
+    except Exception as e:
+        return e
+
+@pytest.mark.parametrize('exc, expected', [
+    (raised_from(requests.ConnectionError('could not connect'), ConnectionRefusedError(111, 'refused')),
+     (True, errors.CONNECT)),
+    (http_error(429), (True, errors.RATE_LIMITED)),
+    (requests.exceptions.ReadTimeout('read timed out'), (False, errors.TIMEOUT)),
+    (requests.ConnectionError('connection reset'), (False, errors.CONNECTION)),
+    (http_error(503), (False, errors.SERVER_ERROR)),
+])
+def test_classify_failed_publish_call(exc, expected):
+    assert errors.classify('twitter', raised_during_publish(exc)) == expected
+
+class FakePlatform:
+    """Stands in for http_client.request: answers each URL, by suffix, with a response or an exception."""
+
+    def __init__(self, monkeypatch, answers):
+        self.answers = answers
+        monkeypatch.setattr(http_client, 'request', self.request)
+
+    def request(self, method, url, retry_unsafe=False, **kwargs):
+        for suffix, answer in self.answers.items():
+            if url.endswith(suffix):
+                if isinstance(answer, Exception):
+                    raise answer
+                return answer
+        raise AssertionError(f'unexpected request {method} {url}')
+
+def publish_error(platform_name, post_function, *args):
+    with pytest.raises(Exception) as raised:
+        post_function(*args)
+    return errors.classify(platform_name, raised.value)
+
+GRAPH_TRANSIENT = fake_response(400, {'error': {'code': 2, 'is_transient': True}})
+GRAPH_RATE_LIMITED = fake_response(400, {'error': {'code': 4}})
+
+@pytest.mark.parametrize('create, publish, expected', [
+    (fake_response(503), None, (True, errors.SERVER_ERROR)),
+    (GRAPH_TRANSIENT, None, (True, errors.SERVER_ERROR)),
+    (requests.exceptions.ReadTimeout('read timed out'), None, (True, errors.TIMEOUT)),
+    (fake_response(200, {'id': 'container'}), fake_response(503), (False, errors.SERVER_ERROR)),
+    (fake_response(200, {'id': 'container'}), GRAPH_TRANSIENT, (False, errors.SERVER_ERROR)),
+    (fake_response(200, {'id': 'container'}), requests.exceptions.ReadTimeout('read timed out'),
+     (False, errors.TIMEOUT)),
+    (fake_response(200, {'id': 'container'}), GRAPH_RATE_LIMITED, (True, errors.RATE_LIMITED)),
+])
+def test_instagram_retries_container_failures_but_not_ambiguous_publishes(monkeypatch, create, publish, expected):
+    monkeypatch.setattr(instagram_api, 'load_credentials',
+                        lambda account: {'access_token': 'token', 'ig_user_id': '17841'})
+    FakePlatform(monkeypatch, {'/media': create, '/media_publish': publish})
+    content = {'id': 1, 'title': 'post', 'media_path': 'https://images.example/post.jpg'}
+    assert publish_error('instagram', instagram_api.post_to_instagram, {}, content, '.') == expected
+
+@pytest.mark.parametrize('register, upload, pin, expected', [
+    (requests.exceptions.ReadTimeout('read timed out'), None, None, (True, errors.TIMEOUT)),
+    (fake_response(200, {'upload_url': 'https://upload.example/image', 'media_id': 'm1'}), fake_response(503),
+     None, (True, errors.SERVER_ERROR)),
+    (fake_response(200, {'upload_url': 'https://upload.example/image', 'media_id': 'm1'}), fake_response(204),
+     fake_response(503), (False, errors.SERVER_ERROR)),
+    (fake_response(200, {'upload_url': 'https://upload.example/image', 'media_id': 'm1'}), fake_response(204),
+     fake_response(429), (True, errors.RATE_LIMITED)),
+])
+def test_pinterest_retries_media_failures_but_not_ambiguous_pins(monkeypatch, tmp_path, register, upload, pin,
+                                                                  expected):
+    monkeypatch.setattr(pinterest_api, 'load_credentials',
+                        lambda account: {'access_token': 'token', 'board_id': 'board'})
+    FakePlatform(monkeypatch, {'/media': register, '/image': upload, '/pins': pin})
+    (tmp_path / 'pin.jpg').write_bytes(b'image')
+    content = {'id': 1, 'title': 'post', 'media_path': 'pin.jpg'}
+    assert publish_error('pinterest', pinterest_api.post_to_pinterest, {}, content, str(tmp_path)) == expected
+
+LINKEDIN_REGISTRATION = fake_response(200, {'value': {'asset': 'urn:li:digitalmediaAsset:1', 'uploadMechanism': {
+    'com.linkedin.digitalmedia.uploadmechanism.MediaUploadHttpRequest': {'uploadUrl': 'https://upload.example/asset'}
+}}})
+
+@pytest.mark.parametrize('register, upload, ugc_post, expected', [
+    (fake_response(502), None, None, (True, errors.SERVER_ERROR)),
+    (LINKEDIN_REGISTRATION, requests.exceptions.ReadTimeout('read timed out'), None, (True, errors.TIMEOUT)),
+    (LINKEDIN_REGISTRATION, fake_response(201), fake_response(504), (False, errors.SERVER_ERROR)),
+    (LINKEDIN_REGISTRATION, fake_response(201), requests.ConnectionError('connection reset'),
+     (False, errors.CONNECTION)),
+    (LINKEDIN_REGISTRATION, fake_response(201), requests.exceptions.ConnectTimeout('connect timed out'),
+     (True, errors.CONNECT)),
+])
+def test_linkedin_retries_asset_failures_but_not_ambiguous_posts(monkeypatch, tmp_path, register, upload, ugc_post,
+                                                                 expected):
+    monkeypatch.setattr(linkedin_api, 'load_credentials', lambda account: {
+        'access_token': 'token', 'person_urn': 'urn:li:person:abc', 'scopes': ['w_member_social']})
+    FakePlatform(monkeypatch, {'/assets': register, '/asset': upload, '/ugcPosts': ugc_post})
+    (tmp_path / 'photo.jpg').write_bytes(b'image')
+    content = {'id': 1, 'title': 'post', 'media_path': 'photo.jpg'}
+    assert publish_error('linkedin', linkedin_api.post_to_linkedin, {'name': 'account'}, content,
+                         str(tmp_path)) == expected
+
+def test_youtube_upload_failures_are_retried():
+    # The whole resumable upload happens before the video exists, so none of it is wrapped in publish_call()
+    server_error = HttpError(HttpLib2Response({'status': 503}), b'backend error')
+    assert errors.classify('youtube', server_error) == (True, errors.SERVER_ERROR)
+
+def claim_one(conn, now_epoch):
+    claimed = scheduler.claim_due_posts(conn, now_epoch)
+    assert len(claimed) == 1
+    return claimed[0]
+
+def test_retryable_failures_back_off_then_go_to_dead_letters(conn, accounts, monkeypatch):
+    monkeypatch.setattr(scheduler, 'RETRY_MAX_ATTEMPTS', 3)
+    post_id = add_post(conn, accounts['twitter'])
+    now = time.time()
+
+    for attempt in (1, 2):
+        post = claim_one(conn, now)
+        before = time.time()
+        assert scheduler.fail_post(conn, post, 'could not connect', errors.CONNECT, True) == 'retrying'
+        row = get_post(conn, post_id)
+        assert (row['status'], row['attempts'], row['error_class'], row['claimed_by']) == \
+            ('retrying', attempt, errors.CONNECT, None)
+        delay = scheduler.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+        assert before + delay / 2 <= row['next_attempt_at'] <= time.time() + delay
+        # Not claimable again until the backoff has passed
+        assert scheduler.claim_due_posts(conn, row['next_attempt_at'] - 1) == []
+        now = row['next_attempt_at']
+
+    post = claim_one(conn, now)
+    assert post['previous_status'] == 'retrying'
+    assert scheduler.fail_post(conn, post, 'could not connect', errors.CONNECT, True) == 'dead'
+    row = get_post(conn, post_id)
+    assert (row['status'], row['attempts'], row['next_attempt_at']) == ('dead', 3, None)
+    assert scheduler.claim_due_posts(conn, now + 86400) == []
+
+def test_fatal_failure_goes_to_error_at_once(conn, accounts):
+    post_id = add_post(conn, accounts['twitter'])
+    post = claim_one(conn, time.time())
+    assert scheduler.fail_post(conn, post, '503 error', errors.SERVER_ERROR, False) == 'error'
+    row = get_post(conn, post_id)
+    assert (row['status'], row['attempts'], row['error']) == ('error', 1, '503 error')
+
+def test_requeue_resets_a_failed_post(conn, accounts):
+    post_id = add_post(conn, accounts['twitter'])
+    post = claim_one(conn, time.time())
+    scheduler.fail_post(conn, post, 'read timed out', errors.TIMEOUT, False)
+
+    now = time.time()
+    assert repository.requeue_content(conn, post_id, now) == 1
+    conn.commit()
+    row = get_post(conn, post_id)
+    assert (row['status'], row['attempts'], row['error'], row['error_class']) == ('pending', 0, None, None)
+    assert claim_one(conn, now)['id'] == post_id
+    # Posts that are not failed stay where they are
+    assert repository.requeue_content(conn, post_id, now) == 0
+
+def test_lost_lease_records_nothing(conn, accounts):
+    post_id = add_post(conn, accounts['twitter'])
+    post = claim_one(conn, time.time())
+    repository.claim_due_content(conn, 'another-worker', post['lease_expires_at'] + 1,
+                                 post['lease_expires_at'] + 600, 10)
+    conn.commit()
+    assert scheduler.fail_post(conn, post, 'could not connect', errors.CONNECT, True) is None
+    assert get_post(conn, post_id)['claimed_by'] == 'another-worker'
+
+def test_throttled_post_is_deferred_without_using_an_attempt(conn, accounts):
+    post_id = add_post(conn, accounts['twitter'])
+    post = claim_one(conn, time.time())
+    observation = rate_limit.Observation('twitter', accounts['twitter'])
+    observation.block('account', time.time() + 900)
+
+    scheduler.record_post_result(db.get_db, post, '429 error', observation, errors.RATE_LIMITED, True)
+    post_events.flush()
+
+    row = get_post(conn, post_id)
+    assert (row['status'], row['attempts'], row['claimed_by']) == ('pending', 0, None)
+    assert row['schedule_epoch'] == observation.blocked_until['account']
+    assert [event['event'] for event in repository.list_post_events(conn, post_id)][-1] == 'deferred'
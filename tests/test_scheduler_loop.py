@@ -0,0 +1,62 @@
+"""The next-due-time scheduler loop and waking it early."""
+import threading
+import time
+
+import db
+import scheduler
+import worker
+from conftest import add_post, get_post, wait_for
+
+def test_immediate_post_is_not_delayed_by_a_slow_upload(conn, accounts, dispatch, tmp_path, monkeypatch):
+    uploading, release = threading.Event(), threading.Event()
+
+    def slow_upload(account, post, base_dir):
+        uploading.set()
+        release.wait(10)
+        return {'id': 'video'}
+
+    def tweet(account, post, base_dir):
+        return {'id': 'tweet'}
+
+    monkeypatch.setattr(dispatch, '_scheduler_loop', None)
+    video = add_post(conn, accounts['youtube'])
+    loop = dispatch.start_scheduler_loop(db.get_db, {'youtube': slow_upload, 'twitter': tweet}, str(tmp_path))
+    try:
+        assert uploading.wait(5)
+        post_id = add_post(conn, accounts['twitter'], time.time())
+        dispatch.wake_scheduler()
+        assert wait_for(lambda: get_post(conn, post_id)['status'] == 'posted') < 1
+        assert get_post(conn, video)['status'] == 'processing'
+    finally:
+        release.set()
+        loop.stop()
+        loop._thread.join(5)
+    assert dispatch.wait_for_posts_in_flight(5)
+    assert get_post(conn, video)['status'] == 'posted'
+
+def test_loop_sleeps_until_the_next_due_post(conn, accounts, dispatch, tmp_path, monkeypatch):
+    published = []
+
+    def tweet(account, post, base_dir):
+        published.append((post['id'], time.time()))
+        return {'id': 'tweet'}
+
+    monkeypatch.setattr(dispatch, '_scheduler_loop', None)
+    due_epoch = time.time() + 0.5
+    post_id = add_post(conn, accounts['twitter'], due_epoch)
+    loop = dispatch.start_scheduler_loop(db.get_db, {'twitter': tweet}, str(tmp_path))
+    try:
+        wait_for(lambda: published)
+    finally:
+        loop.stop()
+        loop._thread.join(5)
+    assert published[0][0] == post_id
+    assert due_epoch <= published[0][1] < due_epoch + 0.5
+
+def test_worker_runs_the_loop_that_wake_scheduler_reaches(conn, monkeypatch):
+    woken = []
+    monkeypatch.setattr(scheduler, '_scheduler_loop', None)
+    monkeypatch.setattr(scheduler.SchedulerLoop, 'run_forever', lambda loop: scheduler.wake_scheduler())
+    monkeypatch.setattr(scheduler.SchedulerLoop, 'wake', lambda loop: woken.append(loop))
+    worker.main(['run'])
+    assert woken == [scheduler._scheduler_loop]
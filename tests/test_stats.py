@@ -0,0 +1,99 @@
+"""Trigger-maintained statistics stay equal to a recount of the content table."""
+import io
+import json
+import random
+import time
+
+import bulk_import
+import errors
+import repository
+import scheduler
+import stats
+from conftest import add_post
+
+def stats_rows(conn):
+    return sorted(tuple(row) for row in conn.execute(
+        'SELECT account_id, status, posts FROM content_stats WHERE posts > 0'))
+
+def counted_rows(conn):
+    return sorted(tuple(row) for row in conn.execute(
+        'SELECT account_id, status, COUNT(*) FROM content GROUP BY account_id, status'))
+
+def assert_consistent(conn):
+    maintained = stats_rows(conn)
+    assert maintained == counted_rows(conn)
+    before = stats.get_stats(conn)
+    repository.rebuild_content_stats(conn)
+    conn.commit()
+    assert stats_rows(conn) == maintained
+    assert stats.get_stats(conn) == before
+
+def test_counts_follow_every_kind_of_write(conn, accounts, monkeypatch):
+    monkeypatch.setattr(scheduler, 'RETRY_MAX_ATTEMPTS', 2)
+    randomizer = random.Random(7)
+    account_ids = list(accounts.values())
+    now = time.time()
+    for n in range(40):
+        add_post(conn, randomizer.choice(account_ids), now - n)
+    bulk_import.import_posts(conn, io.BytesIO(''.join(
+        json.dumps({'account_id': randomizer.choice(account_ids), 'title': f'bulk {n}'}) + '\n'
+        for n in range(30)).encode()), 'jsonl')
+    assert_consistent(conn)
+
+    for post in scheduler.claim_due_posts(conn, now, limit=50):
+        outcome = randomizer.choice(('posted', 'retry', 'error', 'defer', 'leave'))
+        if outcome == 'posted':
+            scheduler.finish_post(conn, post['id'], 'posted')
+        elif outcome == 'retry':
+            scheduler.fail_post(conn, post, 'could not connect', errors.CONNECT, True)
+        elif outcome == 'error':
+            scheduler.fail_post(conn, post, 'server error', errors.SERVER_ERROR, False)
+        elif outcome == 'defer':
+            scheduler.defer_post(conn, post['id'], now + 3600, 'rate limited')
+    assert {'pending', 'processing', 'posted', 'retrying', 'error'} <= {status for _, status, _ in stats_rows(conn)}
+    assert_consistent(conn)
+
+    # Second attempts of the retried posts go to dead letters
+    for post in scheduler.claim_due_posts(conn, now + 86400, limit=100):
+        if post['previous_status'] == 'retrying':
+            scheduler.fail_post(conn, post, 'could not connect', errors.CONNECT, True)
+    for row in conn.execute("SELECT id FROM content WHERE status IN ('error', 'dead')").fetchall()[::2]:
+        repository.requeue_content(conn, row['id'], now)
+    conn.commit()
+    assert 'dead' in {status for _, status, _ in stats_rows(conn)}
+    assert_consistent(conn)
+
+    for row in conn.execute('SELECT id FROM content ORDER BY id').fetchall()[::5]:
+        repository.delete_content(conn, row['id'])
+    conn.execute('UPDATE content SET account_id=? WHERE id % 7 = 0', (accounts['youtube'],))
+    repository.delete_content_for_account(conn, accounts['reddit'])
+    conn.commit()
+    assert_consistent(conn)
+
+def test_rebuild_repairs_counts_edited_by_hand(conn, accounts):
+    for _ in range(3):
+        add_post(conn, accounts['twitter'])
+    conn.execute('UPDATE content_stats SET posts = 42')
+    conn.execute("INSERT INTO content_stats (account_id, status, posts) VALUES (?, 'posted', 5)", (accounts['reddit'],))
+    conn.commit()
+
+    repository.rebuild_content_stats(conn)
+    conn.commit()
+    assert stats_rows(conn) == counted_rows(conn) == [(accounts['twitter'], 'pending', 3)]
+    assert stats.get_stats(conn)['queue_depth'] == 3
+
+def test_failure_rate_counts_publish_results(conn, accounts):
+    for _ in range(4):
+        add_post(conn, accounts['twitter'])
+    claimed = scheduler.claim_due_posts(conn, time.time())
+    scheduler.finish_post(conn, claimed[0]['id'], 'posted')
+    scheduler.finish_post(conn, claimed[1]['id'], 'posted')
+    scheduler.fail_post(conn, claimed[2], 'could not connect', errors.CONNECT, True)
+    scheduler.fail_post(conn, claimed[3], 'bad request', errors.INVALID_REQUEST, False)
+
+    current = stats.get_stats(conn)
+    assert current['totals'] == {'posted': 2, 'retrying': 1, 'error': 1, 'total': 4}
+    assert current['queue_depth'] == 1
+    assert {key: current['failures'][key] for key in ('attempts', 'failed', 'rate')} == \
+        {'attempts': 4, 'failed': 2, 'rate': 0.5}
+    assert current['failures']['platforms']['twitter']['failed'] == 2
@@ -0,0 +1,147 @@
+"""Chunked uploads: offsets, resuming and completion."""
+import fcntl
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import db
+import media_store
+import repository
+import uploads
+
+DATA = os.urandom(250_000)
+
+def put(conn, base_dir, upload_id, offset, chunk, chunk_id=None):
+    return uploads.write_chunk(conn, base_dir, upload_id, offset, io.BytesIO(chunk), len(chunk), chunk_id)
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(uploads, 'UPLOAD_BLOCK_SIZE', 4096)
+
+def test_chunks_append_at_the_committed_offset(conn, tmp_path, small_blocks):
+    upload = uploads.create_upload(conn, str(tmp_path), 'clip.mp4', len(DATA))
+    upload_id = upload['id']
+    assert put(conn, str(tmp_path), upload_id, 0, DATA[:100_000], 'c1') == 100_000
+    assert put(conn, str(tmp_path), upload_id, 100_000, DATA[100_000:200_000], 'c2') == 200_000
+
+    # A chunk at the wrong offset is refused with the offset to resume from
+    with pytest.raises(uploads.UploadError) as refused:
+        put(conn, str(tmp_path), upload_id, 150_000, DATA[150_000:], 'c3')
+    assert (refused.value.status_code, refused.value.offset) == (409, 200_000)
+
+    # Re-sending the last accepted chunk is acknowledged without writing it again
+    assert put(conn, str(tmp_path), upload_id, 100_000, DATA[100_000:200_000], 'c2') == 200_000
+    assert os.path.getsize(uploads.partial_path(str(tmp_path), upload_id)) == 200_000
+
+    # Completing early is refused
+    with pytest.raises(uploads.UploadError) as early:
+        uploads.complete_upload(conn, str(tmp_path), upload_id)
+    assert early.value.offset == 200_000
+
+    assert put(conn, str(tmp_path), upload_id, 200_000, DATA[200_000:], 'c3') == len(DATA)
+    completed = uploads.complete_upload(conn, str(tmp_path), upload_id, hashlib.sha256(DATA).hexdigest())
+    assert completed['status'] == 'complete'
+    with open(os.path.join(str(tmp_path), completed['media_path']), 'rb') as f:
+        assert f.read() == DATA
+
+def test_resume_after_a_dropped_chunk(conn, tmp_path, small_blocks):
+    upload_id = uploads.create_upload(conn, str(tmp_path), 'clip.mp4', len(DATA))['id']
+    put(conn, str(tmp_path), upload_id, 0, DATA[:100_000], 'c1')
+
+    # The connection drops 30,000 bytes into the second chunk
+    with pytest.raises(uploads.UploadError) as dropped:
+        uploads.write_chunk(conn, str(tmp_path), upload_id, 100_000, io.BytesIO(DATA[100_000:130_000]),
+                            len(DATA) - 100_000, 'c2')
+    assert dropped.value.offset == 100_000
+    assert uploads.get_upload(conn, upload_id)['received'] == 100_000
+
+    # The client asks where to resume and sends the rest; the partial bytes are overwritten
+    offset = uploads.describe(uploads.get_upload(conn, upload_id))['offset']
+    assert put(conn, str(tmp_path), upload_id, offset, DATA[offset:], 'c2') == len(DATA)
+    completed = uploads.complete_upload(conn, str(tmp_path), upload_id)
+    assert completed['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+def test_resume_on_another_process_hashes_from_disk(conn, tmp_path, small_blocks):
+    upload_id = uploads.create_upload(conn, str(tmp_path), 'clip.mp4', len(DATA))['id']
+    put(conn, str(tmp_path), upload_id, 0, DATA[:100_000], 'c1')
+    # A process that did not see the first chunk has no running hash for the upload
+    uploads._hashers.pop(upload_id)
+    put(conn, str(tmp_path), upload_id, 100_000, DATA[100_000:], 'c2')
+    assert uploads.complete_upload(conn, str(tmp_path), upload_id)['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+def test_checksum_mismatch_and_size_limits(conn, tmp_path, small_blocks):
+    upload_id = uploads.create_upload(conn, str(tmp_path), 'clip.mp4', len(DATA))['id']
+    with pytest.raises(uploads.UploadError) as too_long:
+        put(conn, str(tmp_path), upload_id, 0, DATA + b'extra', 'c1')
+    assert too_long.value.status_code == 400
+    with pytest.raises(uploads.UploadError) as no_length:
+        uploads.write_chunk(conn, str(tmp_path), upload_id, 0, io.BytesIO(DATA), None)
+    assert no_length.value.status_code == 411
+
+    put(conn, str(tmp_path), upload_id, 0, DATA, 'c1')
+    with pytest.raises(uploads.UploadError) as mismatch:
+        uploads.complete_upload(conn, str(tmp_path), upload_id, '0' * 64)
+    assert mismatch.value.status_code == 422
+    assert uploads.get_upload(conn, upload_id)['status'] == 'uploading'
+
+def test_identical_uploads_share_one_stored_file(conn, tmp_path):
+    paths = []
+    for name in ('a.mp4', 'b.mp4'):
+        upload_id = uploads.create_upload(conn, str(tmp_path), name, len(DATA))['id']
+        put(conn, str(tmp_path), upload_id, 0, DATA)
+        paths.append(uploads.complete_upload(conn, str(tmp_path), upload_id)['media_path'])
+    assert paths[0] == paths[1] == media_store.media_path_for(hashlib.sha256(DATA).hexdigest(), 'a.mp4')
+
+def test_unknown_uploads_get_no_lock_and_finished_ones_drop_theirs(conn, tmp_path, monkeypatch):
+    with pytest.raises(uploads.UploadError) as missing:
+        put(conn, str(tmp_path), 'no-such-upload', 0, DATA)
+    assert missing.value.status_code == 404
+    assert 'no-such-upload' not in uploads._locks
+
+    completed_id = uploads.create_upload(conn, str(tmp_path), 'a.mp4', len(DATA))['id']
+    put(conn, str(tmp_path), completed_id, 0, DATA)
+    assert completed_id in uploads._locks
+    uploads.complete_upload(conn, str(tmp_path), completed_id)
+    assert completed_id not in uploads._locks
+
+    expired_id = uploads.create_upload(conn, str(tmp_path), 'b.mp4', len(DATA))['id']
+    put(conn, str(tmp_path), expired_id, 0, DATA[:1000])
+    monkeypatch.setattr(uploads, 'UPLOAD_EXPIRY_SECONDS', -60)
+    uploads.purge_stale_uploads(conn, str(tmp_path))
+    assert expired_id not in uploads._locks
+    assert repository.get_upload(conn, expired_id) is None
+
+def test_a_chunk_waits_for_another_process_writing_the_same_upload(conn, tmp_path):
+    upload_id = uploads.create_upload(conn, str(tmp_path), 'clip.mp4', len(DATA))['id']
+    path = uploads.partial_path(str(tmp_path), upload_id)
+    result = {}
+
+    def send_chunk():
+        try:
+            put(db.get_db(), str(tmp_path), upload_id, 0, b'x' * 1000, 'theirs')
+        except uploads.UploadError as e:
+            result['error'] = e
+        finally:
+            db.close_db()
+
+    # Another worker process holds the partial file while it writes the first chunk
+    with open(path, 'r+b') as other:
+        fcntl.flock(other, fcntl.LOCK_EX)
+        thread = threading.Thread(target=send_chunk)
+        thread.start()
+        time.sleep(0.2)
+        assert thread.is_alive()
+        other.write(DATA[:1000])
+        other.flush()
+        repository.advance_upload(conn, upload_id, 0, 1000, 'ours', time.time())
+        conn.commit()
+    thread.join(5)
+
+    # The waiting request sees the committed offset and does not overwrite the chunk
+    assert (result['error'].status_code, result['error'].offset) == (409, 1000)
+    with open(path, 'rb') as f:
+        assert f.read() == DATA[:1000]
@@ -1,29 +1,19 @@
 import tweepy
 import os
 import json
-from security import decrypt_data
+from security import load_credentials
+from clients import get_client, discard_client
+import http_client
 import logging
+import errors
 
-def post_to_twitter(account, content, base_dir):
-    """
-    Posts content to Twitter, reading credentials from the account database record.
-    Now uses robust error handling and consistent key usage.
-    """
-    try:
-        credentials = json.loads(decrypt_data(account['credentials']))
-    except (json.JSONDecodeError, TypeError):
-        logging.error("[Twitter] Invalid credentials format for Twitter account.")
-        raise ValueError("Invalid credentials format for Twitter account. Please re-add the account with correct keys.")
-
+def _build_twitter_clients(credentials):
+    """Builds the v1.1 API (media uploads) and v2 Client (tweeting) for an account."""
     api_key = credentials.get('api_key')
     api_key_secret = credentials.get('api_key_secret')
     access_token = credentials.get('access_token')
     access_token_secret = credentials.get('access_token_secret')
 
-    if not all([api_key, api_key_secret, access_token, access_token_secret]):
-        logging.error("[Twitter] Missing one or more required Twitter API credentials.")
-        raise ValueError("Missing one or more required Twitter API credentials. Please check your keys and try again.")
-
     # Authenticate with Twitter API v1.1 for media uploads
     try:
         auth = tweepy.OAuth1UserHandler(api_key, api_key_secret, access_token, access_token_secret)
@@ -44,6 +34,34 @@ def post_to_twitter(account, content, base_dir):
         logging.error(f"[Twitter] Client initialization failed: {e}")
         raise Exception("Twitter client initialization failed. Please check your credentials.")
 
+    # Let the rate limiter see Twitter's x-rate-limit-* headers
+    http_client.add_session_hooks(api_v1.session)
+    http_client.add_session_hooks(client.session)
+    return api_v1, client
+
+def post_to_twitter(account, content, base_dir):
+    """
+    Posts content to Twitter, reading credentials from the account database record.
+    Now uses robust error handling and consistent key usage.
+    """
+    try:
+        credentials = load_credentials(account)
+    except (json.JSONDecodeError, TypeError):
+        logging.error("[Twitter] Invalid credentials format for Twitter account.")
+        raise ValueError("Invalid credentials format for Twitter account. Please re-add the account with correct keys.")
+
+    api_key = credentials.get('api_key')
+    api_key_secret = credentials.get('api_key_secret')
+    access_token = credentials.get('access_token')
+    access_token_secret = credentials.get('access_token_secret')
+
+    if not all([api_key, api_key_secret, access_token, access_token_secret]):
+        logging.error("[Twitter] Missing one or more required Twitter API credentials.")
+        raise ValueError("Missing one or more required Twitter API credentials. Please check your keys and try again.")
+
+    # Reuse this account's authenticated clients across posts
+    api_v1, client = get_client('twitter', account, credentials, _build_twitter_clients)
+
     tweet_text = f"{content.get('title', '')}\n\n{content.get('description', '')}\n\n{content.get('hashtags', '')}".strip()
     media_path_relative = content.get('media_path')
     media_ids = []
@@ -56,20 +74,25 @@ def post_to_twitter(account, content, base_dir):
                 media_ids.append(media.media_id_string)
             except Exception as e:
                 logging.error(f"[Twitter] Error uploading media: {e}")
+                if isinstance(e, (tweepy.Unauthorized, tweepy.Forbidden)):
+                    discard_client('twitter', account)
                 raise Exception("Error uploading media to Twitter. Please ensure the file is a supported image or video format.")
         else:
             logging.error(f"[Twitter] Media file not found: {media_path_absolute}")
             raise Exception("Media file not found. Please re-upload your file.")
 
     try:
-        if media_ids:
-            response = client.create_tweet(text=tweet_text, media_ids=media_ids)
-        else:
-            response = client.create_tweet(text=tweet_text)
+        with errors.publish_call():
+            if media_ids:
+                response = client.create_tweet(text=tweet_text, media_ids=media_ids)
+            else:
+                response = client.create_tweet(text=tweet_text)
         logging.info(f"[Twitter] Tweet posted successfully: {response.data['id']}")
-        return True
+        return {'id': response.data['id']}
     except Exception as e:
         logging.error(f"[Twitter] Error posting tweet: {e}")
+        if isinstance(e, (tweepy.Unauthorized, tweepy.Forbidden)):
+            discard_client('twitter', account)
         raise Exception("Error posting tweet. Please try again later or check your content for issues.")
 
 def test_twitter_connection(credentials):
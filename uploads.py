@@ -0,0 +1,234 @@
+"""
+Resumable, chunked media uploads.
+
+Large videos are sent as a series of PUT requests instead of one multipart form,
+so neither Werkzeug nor this process ever holds a whole file. Each chunk is
+streamed from the request body to a partial file in fixed-size blocks while its
+SHA-256 is updated, so memory use is constant whatever the file size.
+
+Protocol:
+  POST /api/uploads {filename, size}            -> {upload_id, offset: 0}
+  PUT  /api/uploads/<id>  body=chunk bytes
+       headers Upload-Offset: <offset>, Upload-Chunk-Id: <client chunk id>
+                                                 -> {offset: <new offset>}
+  GET  /api/uploads/<id>                         -> {offset, ...} to resume
+  POST /api/uploads/<id>/complete {sha256}       -> {media_path, sha256}
+
+A chunk must start at the upload's current offset; otherwise the server answers
+409 with the offset to resume from. Re-sending the last accepted chunk (same
+chunk id and offset), e.g. after its response was lost, is acknowledged without
+writing it twice.
+
+Requests for the same upload are serialized: threads of one process share a lock
+per upload, and processes (gunicorn workers) hold an exclusive flock on the
+partial file while they check the offset, write and commit. Without fcntl
+(Windows) only the per-process lock is taken.
+"""
+import contextlib
+import hashlib
+import os
+import secrets
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from werkzeug.utils import secure_filename
+
+import media_store
+import repository
+
+# Block size for streaming chunk bodies to disk and for hashing files
+UPLOAD_BLOCK_SIZE = int(os.getenv('UPLOAD_BLOCK_SIZE', str(1024 * 1024)))
+
+# Largest chunk accepted in one PUT, and the chunk size suggested to clients
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv('UPLOAD_MAX_CHUNK_BYTES', str(64 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+
+# Unfinished uploads that received nothing for this long are removed
+UPLOAD_EXPIRY_SECONDS = int(os.getenv('UPLOAD_EXPIRY_SECONDS', '86400'))
+
+class UploadError(Exception):
+    """An upload request that cannot be applied; carries the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+# Running SHA-256 of uploads being written by this process: upload id -> (offset, hasher).
+# Hash state cannot be stored in the database, so an upload resumed on another
+# process (or after a restart) is hashed from disk once when it completes.
+_hashers = {}
+_locks = {}  # upload id -> threading.Lock, removed when the upload completes or expires
+_locks_lock = threading.Lock()
+
+def uploads_dir(base_dir):
+    return os.path.join(base_dir, 'uploads')
+
+def partial_path(base_dir, upload_id):
+    return os.path.join(uploads_dir(base_dir), '.partial', upload_id)
+
+def describe(upload):
+    """The JSON view of an upload row."""
+    return {
+        'upload_id': upload['id'],
+        'filename': upload['filename'],
+        'size': upload['total_size'],
+        'offset': upload['received'],
+        'status': upload['status'],
+        'media_path': upload['media_path'],
+        'sha256': upload['sha256'],
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+    }
+
+def create_upload(conn, base_dir, filename, total_size=None):
+    """Starts an upload and returns its row. Commits."""
+    filename = secure_filename(filename or '')
+    if not filename:
+        raise UploadError('A filename is required.')
+    if total_size is not None and total_size < 0:
+        raise UploadError('Invalid upload size.')
+    purge_stale_uploads(conn, base_dir)
+    upload_id = secrets.token_hex(16)
+    path = partial_path(base_dir, upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    repository.create_upload(conn, upload_id, filename, total_size, time.time())
+    conn.commit()
+    _hashers[upload_id] = (0, hashlib.sha256())
+    return repository.get_upload(conn, upload_id)
+
+def get_upload(conn, upload_id):
+    upload = repository.get_upload(conn, upload_id)
+    if upload is None:
+        raise UploadError('Upload not found.', 404)
+    return upload
+
+@contextlib.contextmanager
+def _locked_upload(conn, base_dir, upload_id):
+    """
+    Locks an upload against other threads and processes and yields its current
+    row and its partial file, opened for writing (None once the upload is complete).
+    """
+    # Unknown ids get a 404 before a lock is created for them
+    get_upload(conn, upload_id)
+    with _locks_lock:
+        lock = _locks.setdefault(upload_id, threading.Lock())
+    with lock:
+        try:
+            partial = open(partial_path(base_dir, upload_id), 'r+b')
+        except FileNotFoundError:
+            partial = None
+        try:
+            if partial is not None and fcntl is not None:
+                fcntl.flock(partial, fcntl.LOCK_EX)
+            # Read again under the lock: another process may have moved the upload on
+            upload = get_upload(conn, upload_id)
+            if partial is None and upload['status'] == 'uploading':
+                raise UploadError('Upload not found.', 404)
+            yield upload, partial
+        finally:
+            if partial is not None:
+                partial.close()
+
+def _forget_upload(upload_id):
+    _hashers.pop(upload_id, None)
+    with _locks_lock:
+        _locks.pop(upload_id, None)
+
+def write_chunk(conn, base_dir, upload_id, offset, stream, content_length, chunk_id=None):
+    """
+    Appends one chunk read from `stream` at `offset` and returns the new offset.
+    Commits. The chunk is streamed to disk in UPLOAD_BLOCK_SIZE blocks.
+    """
+    if content_length is None:
+        raise UploadError('Chunks need a Content-Length.', 411)
+    if content_length > UPLOAD_MAX_CHUNK_BYTES:
+        raise UploadError(f'Chunks may be at most {UPLOAD_MAX_CHUNK_BYTES} bytes.', 413)
+
+    with _locked_upload(conn, base_dir, upload_id) as (upload, f):
+        if upload['status'] != 'uploading':
+            raise UploadError('Upload is already complete.', 409, upload['received'])
+        received = upload['received']
+        if chunk_id is not None and chunk_id == upload['last_chunk_id'] and offset == upload['last_chunk_offset']:
+            # The client did not see our answer to this chunk and sent it again
+            return received
+        if offset != received:
+            raise UploadError(f'Expected offset {received}.', 409, received)
+        if upload['total_size'] is not None and offset + content_length > upload['total_size']:
+            raise UploadError('Chunk goes past the declared upload size.', 400, received)
+
+        hashed_offset, hasher = _hashers.get(upload_id, (None, None))
+        if hashed_offset != offset:
+            hasher = None
+        written = 0
+        # Drop anything written past the committed offset by an interrupted request
+        f.seek(offset)
+        f.truncate()
+        while written < content_length:
+            block = stream.read(min(UPLOAD_BLOCK_SIZE, content_length - written))
+            if not block:
+                break
+            f.write(block)
+            if hasher is not None:
+                hasher.update(block)
+            written += len(block)
+        # Flushed before the offset is committed and the lock released
+        f.flush()
+        if written < content_length:
+            # Connection dropped mid-chunk: keep the committed offset, the client resumes from it
+            _hashers.pop(upload_id, None)
+            raise UploadError(f'Chunk ended after {written} of {content_length} bytes.', 400, received)
+
+        new_offset = offset + written
+        if repository.advance_upload(conn, upload_id, offset, new_offset, chunk_id, time.time()) == 0:
+            conn.commit()
+            _hashers.pop(upload_id, None)
+            raise UploadError('Upload was changed by another request.', 409, get_upload(conn, upload_id)['received'])
+        conn.commit()
+        if hasher is not None:
+            _hashers[upload_id] = (new_offset, hasher)
+        else:
+            _hashers.pop(upload_id, None)
+        return new_offset
+
+def complete_upload(conn, base_dir, upload_id, expected_sha256=None):
+    """
+    Verifies a finished upload against its declared size and checksum, moves it
+    into the media store and returns its row. Commits.
+    """
+    with _locked_upload(conn, base_dir, upload_id) as (upload, _):
+        if upload['status'] == 'complete':
+            return upload
+        if upload['total_size'] is not None and upload['received'] != upload['total_size']:
+            raise UploadError(f"Upload has {upload['received']} of {upload['total_size']} bytes.", 409, upload['received'])
+        path = partial_path(base_dir, upload_id)
+        hashed_offset, hasher = _hashers.pop(upload_id, (None, None))
+        sha256 = hasher.hexdigest() if hashed_offset == upload['received'] else media_store.hash_file(path)
+        if expected_sha256 and expected_sha256.lower() != sha256:
+            raise UploadError('Checksum mismatch.', 422, upload['received'])
+
+        media_path = media_store.store_file(conn, base_dir, path, upload['filename'], sha256)
+        repository.complete_upload(conn, upload_id, sha256, media_path, time.time())
+        conn.commit()
+    _forget_upload(upload_id)
+    return repository.get_upload(conn, upload_id)
+
+def purge_stale_uploads(conn, base_dir):
+    """
+    Removes unfinished uploads that have been idle longer than UPLOAD_EXPIRY_SECONDS,
+    and media that was uploaded but never scheduled. Commits.
+    """
+    for upload in repository.list_stale_uploads(conn, time.time() - UPLOAD_EXPIRY_SECONDS):
+        try:
+            os.remove(partial_path(base_dir, upload['id']))
+        except FileNotFoundError:
+            pass
+        repository.delete_upload(conn, upload['id'])
+        _forget_upload(upload['id'])
+    conn.commit()
+    media_store.collect_garbage(conn, base_dir)
@@ -0,0 +1,29 @@
+"""
+Standalone scheduler worker, without the Flask app:
+
+  python -m worker run
+
+See scheduler.run_worker. The entry point lives here rather than in scheduler.py:
+run as `python -m scheduler`, that file would be loaded as __main__ and imported
+again as `scheduler` (e.g. by db.init_db), leaving two copies of its globals, and
+wake_scheduler() calls through the imported module would never reach the loop.
+"""
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import scheduler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Social media scheduled post worker")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    subcommands.add_parser('run', help="Run the scheduler worker in the foreground")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        scheduler.run_worker()
+
+if __name__ == "__main__":
+    main()
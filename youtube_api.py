@@ -1,16 +1,24 @@
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
+from google.auth import exceptions as google_auth_exceptions
 import os
 import json
-import sqlite3
-from security import decrypt_data
+from security import load_credentials
+from clients import get_client
+import errors
 
 # Remove the local definition of BASE_DIR, it will be passed as an argument
 # BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
 
+def _build_youtube_client(creds_dict):
+    """Builds the YouTube Data API service for an account's authorized-user credentials."""
+    creds = Credentials.from_authorized_user_info(creds_dict, SCOPES)
+    return build('youtube', 'v3', credentials=creds)
+
 def post_to_youtube(account, content, base_dir):
     """
     Posts a video to YouTube using credentials stored in the database.
@@ -18,7 +26,7 @@ def post_to_youtube(account, content, base_dir):
     try:
         # The entire credentials object (including client_id, client_secret, refresh_token)
         # is stored as a JSON string in the database.
-        creds_dict = json.loads(decrypt_data(account['credentials']))
+        creds_dict = load_credentials(account)
     except (json.JSONDecodeError, TypeError):
         raise ValueError("Invalid credentials format for YouTube account.")
 
@@ -27,9 +35,8 @@ def post_to_youtube(account, content, base_dir):
          raise ValueError("YouTube credentials missing client_id, client_secret, or refresh_token.")
 
     try:
-        # Create a Credentials object directly from the dictionary
-        creds = Credentials.from_authorized_user_info(creds_dict, SCOPES)
-        youtube = build('youtube', 'v3', credentials=creds)
+        # Reuse this account's service (httplib2 is not thread-safe, so one per worker thread)
+        youtube = get_client('youtube', account, creds_dict, _build_youtube_client, per_thread=True)
 
         body = {
             'snippet': {
@@ -60,16 +67,25 @@ def post_to_youtube(account, content, base_dir):
         video_id = response.get('id') if isinstance(response, dict) else None
         if not video_id:
             raise Exception(f"YouTube API returned unexpected response without video ID: {response}")
-        return True
+        return {'id': video_id}
 
     except Exception as e:
-        # Update status to error in DB directly and re-raise so scheduler catches it
+        # The scheduler records the failure and decides whether to retry
         print(f"[YouTube API] Upload failed: {e}")
-        try:
-            conn = sqlite3.connect(os.path.join(base_dir, 'social_media_automation.db'))
-            conn.execute("UPDATE content SET status='error', error=? WHERE id=?", (str(e), content['id']))
-            conn.commit()
-            conn.close()
-        except Exception as db_e:
-            print(f"[YouTube API] Error updating DB after failure: {db_e}")
-        raise
\ No newline at end of file
+        raise
+
+def classify_error(exc):
+    """Classifies YouTube API errors for the scheduler's retry queue (see errors.py)."""
+    if isinstance(exc, HttpError):
+        # Quota and per-user rate limits come back as 403s; other 403s are permission problems
+        if exc.resp.status == 403 and any(reason in (exc.content or b'') for reason in (b'quotaExceeded', b'rateLimitExceeded')):
+            return errors.RATE_LIMITED
+        return errors.classify_status(exc.resp.status)
+    if isinstance(exc, google_auth_exceptions.RefreshError):
+        return errors.AUTH
+    if isinstance(exc, google_auth_exceptions.TransportError):
+        # Raised while refreshing the access token, before anything is uploaded
+        return errors.CONNECT
+    return None
+
+errors.register_classifier('youtube', classify_error)